@@ -1,7 +1,12 @@
 #!/usr/bin/env python3
 import boto3
+import os
 import sys
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from aws_utils.ami import get_ubuntu_ami
+from aws_utils.inventory import find_resource, reservation_instances
+
 def add_grafana_instance(vpc_id, subnet_id):
     ec2 = boto3.client('ec2', region_name='us-east-1')
     
@@ -32,33 +37,22 @@ def add_grafana_instance(vpc_id, subnet_id):
         ]
     )
     
-    # Obtener IP de Prometheus
-    prometheus_instances = ec2.describe_instances(
+    # Obtener IP de Prometheus (se deja de paginar en cuanto aparece)
+    prometheus = find_resource(
+        ec2, 'describe_instances', reservation_instances,
         Filters=[
             {'Name': 'tag:Name', 'Values': ['prometheus']},
             {'Name': 'instance-state-name', 'Values': ['running']}
         ]
     )
-    
-    prometheus_ip = None
-    for reservation in prometheus_instances['Reservations']:
-        for instance in reservation['Instances']:
-            prometheus_ip = instance.get('PrivateIpAddress')
-            break
+    prometheus_ip = prometheus.get('PrivateIpAddress') if prometheus else None
     
     if not prometheus_ip:
         print("Error: Instancia Prometheus no encontrada")
         return
     
     # Obtener AMI de Ubuntu
-    images = ec2.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-alias', 'Values': ['amazon']}
-        ],
-        Owners=['099720109477']
-    )
-    ami_id = sorted(images['Images'], key=lambda x: x['CreationDate'])[-1]['ImageId']
+    ami_id = get_ubuntu_ami(ec2)
     
     # User data para Grafana
     grafana_userdata = f"""#!/bin/bash
@@ -1,42 +1,51 @@
 #!/usr/bin/env python3
+import argparse
 import boto3
+import os
+import sys
 
-def cleanup_monitoring_infrastructure():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from aws_utils.inventory import iter_instances, iter_resources
+from aws_utils.reconcile import delete_once, use_state
+from aws_utils.teardown import terminate_instances
+
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
+
+def cleanup_monitoring_infrastructure(state=STATE_PATH):
     ec2 = boto3.client('ec2', region_name='us-east-1')
+    use_state(state)
     
     # Buscar instancias por tags
-    instances = ec2.describe_instances(
+    instance_ids = [instance['InstanceId'] for instance in iter_instances(
+        ec2,
         Filters=[
             {'Name': 'tag:Name', 'Values': ['ec2_a', 'prometheus', 'ec2-grafana']},
             {'Name': 'instance-state-name', 'Values': ['running', 'stopped']}
         ]
-    )
-    
-    instance_ids = []
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            instance_ids.append(instance['InstanceId'])
+    )]
     
     if instance_ids:
         print(f"Terminando instancias: {instance_ids}")
-        ec2.terminate_instances(InstanceIds=instance_ids)
-        
-        # Esperar a que terminen
-        waiter = ec2.get_waiter('instance_terminated')
-        waiter.wait(InstanceIds=instance_ids)
+        # Una sola llamada y una sola espera; las ya terminadas se ignoran
+        terminate_instances(ec2, instance_ids)
         print("Instancias terminadas")
     
-    # Buscar y eliminar security groups
-    sgs = ec2.describe_security_groups(
-        Filters=[{'Name': 'group-name', 'Values': ['monitoring-sg', 'grafana-sg']}]
-    )
-    
-    for sg in sgs['SecurityGroups']:
+    # Buscar y eliminar security groups (DependencyViolation se reintenta con backoff)
+    for sg in iter_resources(
+            ec2, 'describe_security_groups', 'SecurityGroups',
+            Filters=[{'Name': 'group-name', 'Values': ['monitoring-sg', 'grafana-sg']}]
+    ):
         if sg['GroupName'] != 'default':
-            print(f"Eliminando Security Group: {sg['GroupId']}")
-            ec2.delete_security_group(GroupId=sg['GroupId'])
+            if delete_once(sg['GroupId'], ec2.delete_security_group, GroupId=sg['GroupId']):
+                print(f"Eliminando Security Group: {sg['GroupId']}")
     
     print("Infraestructura eliminada exitosamente!")
 
 if __name__ == "__main__":
-    cleanup_monitoring_infrastructure()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza de la infraestructura de monitorización")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+
+    cleanup_monitoring_infrastructure(state=args.state)
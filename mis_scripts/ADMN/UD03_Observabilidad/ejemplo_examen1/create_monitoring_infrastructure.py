@@ -1,6 +1,15 @@
 #!/usr/bin/env python3
 import boto3
 import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..'))
+from aws_utils import instrumentation
+from aws_utils.ami import get_ubuntu_ami
+
+# Métricas opcionales con AWS_UTILS_METRICS=1
+instrumentation.enable_from_env()
 
 def create_monitoring_infrastructure():
     ec2 = boto3.client('ec2', region_name='us-east-1')
@@ -81,14 +90,7 @@ def create_monitoring_infrastructure():
     )
     
     # Obtener AMI de Ubuntu
-    images = ec2.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-alias', 'Values': ['amazon']}
-        ],
-        Owners=['099720109477']
-    )
-    ami_id = sorted(images['Images'], key=lambda x: x['CreationDate'])[-1]['ImageId']
+    ami_id = get_ubuntu_ami(ec2)
     
     # User data para ec2_a (node exporter)
     ec2_a_userdata = """#!/bin/bash
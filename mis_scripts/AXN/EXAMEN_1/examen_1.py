@@ -1,15 +1,51 @@
 #!/usr/bin/env python3
-import boto3
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.ami import get_ubuntu_ami
+from aws_utils.cidr import validate_topology
+from aws_utils.clients import get_client
+from aws_utils.coalescing import CoalescingClient
+from aws_utils.journal import Journal
+from aws_utils.sg import verify_access
+
+# Diario de pasos completados, para poder reanudar con --resume
+JOURNAL_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.journal.sqlite'
+
+# Plan de direcciones, comprobado (solapes, RFC1918) antes de crear nada
+VPC_CIDR = '10.0.0.0/16'
+SUBNET_CIDRS = {
+    'Subred-Publica-1': '10.0.1.0/24',
+    'Subred-Publica-2': '10.0.2.0/24',
+    'Subred-Privada-1': '10.0.3.0/24',
+    'Subred-Privada-2': '10.0.4.0/24'
+}
+
+# Accesos esperados entre las instancias del ejercicio 5 (se comprueban con las
+# reglas de los Security Groups, sin SSH ni ping)
+INTERNET = '203.0.113.10'
+ACCESOS_ESPERADOS = [
+    ('SSH desde Internet a Bastion-Host-1', INTERNET, 'Bastion-Host-1', 'tcp', 22, True),
+    ('SSH de Bastion-Host-1 a App-Server-1', 'Bastion-Host-1', 'App-Server-1', 'tcp', 22, True),
+    ('ping de Bastion-Host-2 a App-Server-2', 'Bastion-Host-2', 'App-Server-2', 'icmp', None, True),
+    ('SSH desde Internet a App-Server-1', INTERNET, 'App-Server-1', 'tcp', 22, False),
+    ('HTTP de Bastion-Host-1 a App-Server-1', 'Bastion-Host-1', 'App-Server-1', 'tcp', 80, False)
+]
 
 def ejercicio1_crear_vpc():
     """Ejercicio 1: Crear VPC con configuración básica"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 1: Creando VPC ===")
     
     # Crear VPC con CIDR 10.0.0.0/16
     print("Creando VPC...")
-    vpc_response = ec2.create_vpc(CidrBlock='10.0.0.0/16')
+    vpc_response = ec2.create_vpc(
+        CidrBlock=VPC_CIDR,
+        Tags=[{'Key': 'Name', 'Value': 'Examen-VPC-Ricardo'}]
+    )
     vpc_id = vpc_response['Vpc']['VpcId']
     print(f"VPC creada con ID: {vpc_id}")
     
@@ -20,70 +56,61 @@ def ejercicio1_crear_vpc():
     print("Habilitando DNS Hostnames...")
     ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
     
-    # Etiquetar VPC
-    print("Etiquetando VPC...")
-    ec2.create_tags(
-        Resources=[vpc_id],
-        Tags=[{'Key': 'Name', 'Value': 'Examen-VPC-Ricardo'}]
-    )
-    
     print(f"✅ VPC creada exitosamente: {vpc_id}\n")
     return vpc_id
 
 
 def ejercicio2_crear_infraestructura(vpc_id):
     """Ejercicio 2: Crear 4 subredes distribuidas en 2 zonas de disponibilidad"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 2: Creando infraestructura de red ===")
     
     # Crear Subredes Públicas
     print("Creando Subred-Publica-1...")
     subnet_publica_1_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.1.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock=SUBNET_CIDRS['Subred-Publica-1'], AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-1-AZ-A'}]
     )
     subnet_publica_1_id = subnet_publica_1_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_publica_1_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-1-AZ-A'}])
     print(f"Subred-Publica-1 creada: {subnet_publica_1_id}")
     
     print("Creando Subred-Publica-2...")
     subnet_publica_2_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.2.0/24', AvailabilityZone='us-east-1b'
+        VpcId=vpc_id, CidrBlock=SUBNET_CIDRS['Subred-Publica-2'], AvailabilityZone='us-east-1b',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-2-AZ-B'}]
     )
     subnet_publica_2_id = subnet_publica_2_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_publica_2_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-2-AZ-B'}])
     print(f"Subred-Publica-2 creada: {subnet_publica_2_id}")
     
     # Crear Subredes Privadas
     print("Creando Subred-Privada-1...")
     subnet_privada_1_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.3.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock=SUBNET_CIDRS['Subred-Privada-1'], AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-1-AZ-A'}]
     )
     subnet_privada_1_id = subnet_privada_1_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_privada_1_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-1-AZ-A'}])
     print(f"Subred-Privada-1 creada: {subnet_privada_1_id}")
     
     print("Creando Subred-Privada-2...")
     subnet_privada_2_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.4.0/24', AvailabilityZone='us-east-1b'
+        VpcId=vpc_id, CidrBlock=SUBNET_CIDRS['Subred-Privada-2'], AvailabilityZone='us-east-1b',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-2-AZ-B'}]
     )
     subnet_privada_2_id = subnet_privada_2_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_privada_2_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-2-AZ-B'}])
     print(f"Subred-Privada-2 creada: {subnet_privada_2_id}")
     
     # Crear Internet Gateway
     print("Creando Internet Gateway...")
-    igw_response = ec2.create_internet_gateway()
+    igw_response = ec2.create_internet_gateway(Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     igw_id = igw_response['InternetGateway']['InternetGatewayId']
-    ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
     print(f"Internet Gateway creado y adjuntado: {igw_id}")
     
     # Configurar Enrutamiento para Subredes Públicas
     print("Configurando enrutamiento para subredes públicas...")
-    route_table_response = ec2.create_route_table(VpcId=vpc_id)
+    route_table_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Publicas'}])
     route_table_id = route_table_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[route_table_id], Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Publicas'}])
     ec2.create_route(RouteTableId=route_table_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
     ec2.associate_route_table(RouteTableId=route_table_id, SubnetId=subnet_publica_1_id)
     ec2.associate_route_table(RouteTableId=route_table_id, SubnetId=subnet_publica_2_id)
@@ -96,10 +123,10 @@ def ejercicio2_crear_infraestructura(vpc_id):
     
     nat_2_response = ec2.create_nat_gateway(
         SubnetId=subnet_publica_2_id,
-        AllocationId=allocation_2_id
+        AllocationId=allocation_2_id,
+        Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW-2'}]
     )
     nat_gateway_2_id = nat_2_response['NatGateway']['NatGatewayId']
-    ec2.create_tags(Resources=[nat_gateway_2_id], Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW-2'}])
     
     # Esperar a que esté disponible
     print("Esperando a que NAT Gateway 2 esté disponible...")
@@ -107,9 +134,8 @@ def ejercicio2_crear_infraestructura(vpc_id):
     waiter.wait(NatGatewayIds=[nat_gateway_2_id])
     
     # Crear tabla de enrutamiento para Subred-Privada-2
-    rt_privada_2_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_privada_2_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Privada-2'}])
     rt_privada_2_id = rt_privada_2_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_privada_2_id], Tags=[{'Key': 'Name', 'Value': 'RT-Privada-2'}])
     ec2.create_route(RouteTableId=rt_privada_2_id, DestinationCidrBlock='0.0.0.0/0', NatGatewayId=nat_gateway_2_id)
     ec2.associate_route_table(RouteTableId=rt_privada_2_id, SubnetId=subnet_privada_2_id)
     print(f"NAT Gateway 2 y tabla de enrutamiento configurados: {nat_gateway_2_id}")
@@ -131,7 +157,7 @@ def ejercicio2_crear_infraestructura(vpc_id):
     Ejercicio 2: Crear 4 subredes distribuidas en 2 zonas de disponibilidad 
     y configurar Internet Gateway (IGW) y NAT Gateway (NGW).
     """
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 2: Creando infraestructura de red COMPLETA ===")
     
@@ -140,40 +166,39 @@ def ejercicio2_crear_infraestructura(vpc_id):
     
     # Subredes Públicas
     subnet_publica_1_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.10.1.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock='10.10.1.0/24', AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-1 (AZ-A)'}]
     )
     subnet_publica_1_id = subnet_publica_1_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_publica_1_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-1 (AZ-A)'}])
     print(f"Subred-Publica-1 creada: {subnet_publica_1_id}")
     
     subnet_publica_2_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.10.2.0/24', AvailabilityZone='us-east-1b'
+        VpcId=vpc_id, CidrBlock='10.10.2.0/24', AvailabilityZone='us-east-1b',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-2 (AZ-B)'}]
     )
     subnet_publica_2_id = subnet_publica_2_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_publica_2_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Publica-2 (AZ-B)'}])
     print(f"Subred-Publica-2 creada: {subnet_publica_2_id}")
     
     # Subredes Privadas
     subnet_privada_1_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.10.3.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock='10.10.3.0/24', AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-1 (AZ-A)'}]
     )
     subnet_privada_1_id = subnet_privada_1_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_privada_1_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-1 (AZ-A)'}])
     print(f"Subred-Privada-1 creada: {subnet_privada_1_id}")
     
     subnet_privada_2_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.10.4.0/24', AvailabilityZone='us-east-1b'
+        VpcId=vpc_id, CidrBlock='10.10.4.0/24', AvailabilityZone='us-east-1b',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-2 (AZ-B)'}]
     )
     subnet_privada_2_id = subnet_privada_2_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_privada_2_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Privada-2 (AZ-B)'}])
     print(f"Subred-Privada-2 creada: {subnet_privada_2_id}")
 
     # 2. Configuración de Internet Gateway (IGW)
     # ---
     print("Creando y adjuntando Internet Gateway...")
-    igw_response = ec2.create_internet_gateway()
+    igw_response = ec2.create_internet_gateway(Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     igw_id = igw_response['InternetGateway']['InternetGatewayId']
-    ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
     print(f"Internet Gateway creado y adjuntado: {igw_id}")
     
@@ -190,10 +215,10 @@ def ejercicio2_crear_infraestructura(vpc_id):
     print("Creando NAT Gateway en Subred-Publica-1...")
     nat_response = ec2.create_nat_gateway(
         SubnetId=subnet_publica_1_id,
-        AllocationId=eip_allocation_id
+        AllocationId=eip_allocation_id,
+        Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}]
     )
     nat_gateway_id = nat_response['NatGateway']['NatGatewayId']
-    ec2.create_tags(Resources=[nat_gateway_id], Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}])
     print(f"NAT Gateway creado: {nat_gateway_id}. Esperando a que esté 'available'...")
     
     # ¡Importante! Esperar a que el NAT Gateway esté disponible antes de usarlo en la tabla de rutas
@@ -206,9 +231,8 @@ def ejercicio2_crear_infraestructura(vpc_id):
 
     # a. Tabla de Rutas Públicas
     print("Configurando enrutamiento para subredes públicas...")
-    rt_publica_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_publica_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Publicas'}])
     rt_publica_id = rt_publica_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_publica_id], Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Publicas'}])
     
     # Ruta por defecto a Internet Gateway
     ec2.create_route(RouteTableId=rt_publica_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
@@ -220,9 +244,8 @@ def ejercicio2_crear_infraestructura(vpc_id):
     
     # b. Tabla de Rutas Privadas
     print("Configurando enrutamiento para subredes privadas...")
-    rt_privada_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_privada_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Privadas'}])
     rt_privada_id = rt_privada_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_privada_id], Tags=[{'Key': 'Name', 'Value': 'RT-Subredes-Privadas'}])
     
     # Ruta por defecto a NAT Gateway
     ec2.create_route(RouteTableId=rt_privada_id, DestinationCidrBlock='0.0.0.0/0', NatGatewayId=nat_gateway_id)
@@ -248,7 +271,7 @@ def ejercicio2_crear_infraestructura(vpc_id):
 
 def ejercicio3_nat(subnet_id):
     """Ejercicio 3: Crear NAT Gateway en la subred especificada"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 3: Creando NAT Gateway ===")
     
@@ -262,14 +285,12 @@ def ejercicio3_nat(subnet_id):
     print("Creando NAT Gateway...")
     nat_response = ec2.create_nat_gateway(
         SubnetId=subnet_id,
-        AllocationId=allocation_id
+        AllocationId=allocation_id,
+        Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}]
     )
     nat_gateway_id = nat_response['NatGateway']['NatGatewayId']
     print(f"NAT Gateway creado: {nat_gateway_id}")
     
-    # Etiquetar NAT Gateway después de crearlo
-    ec2.create_tags(Resources=[nat_gateway_id], Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}])
-    
     # Esperar a que esté disponible
     print("Esperando a que el NAT Gateway esté disponible...")
     waiter = ec2.get_waiter('nat_gateway_available')
@@ -283,42 +304,38 @@ def ejercicio3_nat(subnet_id):
 
 def ejercicio4_tablas_enrutamiento(vpc_id, igw_id, nat_gateway_id, subnet_publica_1_id, subnet_publica_2_id, subnet_privada_1_id, subnet_privada_2_id):
     """Ejercicio 4: Crear 4 tablas de enrutamiento separadas"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 4: Creando tablas de enrutamiento ===")
     
     # Tabla para Subred Pública 1
     print("Creando tabla de enrutamiento para Subred-Publica-1...")
-    rt_pub_1_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_pub_1_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Publica-1'}])
     rt_pub_1_id = rt_pub_1_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_pub_1_id], Tags=[{'Key': 'Name', 'Value': 'RT-Publica-1'}])
     ec2.create_route(RouteTableId=rt_pub_1_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
     ec2.associate_route_table(RouteTableId=rt_pub_1_id, SubnetId=subnet_publica_1_id)
     print(f"Tabla RT-Publica-1 creada: {rt_pub_1_id}")
     
     # Tabla para Subred Pública 2
     print("Creando tabla de enrutamiento para Subred-Publica-2...")
-    rt_pub_2_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_pub_2_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Publica-2'}])
     rt_pub_2_id = rt_pub_2_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_pub_2_id], Tags=[{'Key': 'Name', 'Value': 'RT-Publica-2'}])
     ec2.create_route(RouteTableId=rt_pub_2_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
     ec2.associate_route_table(RouteTableId=rt_pub_2_id, SubnetId=subnet_publica_2_id)
     print(f"Tabla RT-Publica-2 creada: {rt_pub_2_id}")
     
     # Tabla para Subred Privada 1
     print("Creando tabla de enrutamiento para Subred-Privada-1...")
-    rt_priv_1_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_priv_1_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Privada-1'}])
     rt_priv_1_id = rt_priv_1_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_priv_1_id], Tags=[{'Key': 'Name', 'Value': 'RT-Privada-1'}])
     ec2.create_route(RouteTableId=rt_priv_1_id, DestinationCidrBlock='0.0.0.0/0', NatGatewayId=nat_gateway_id)
     ec2.associate_route_table(RouteTableId=rt_priv_1_id, SubnetId=subnet_privada_1_id)
     print(f"Tabla RT-Privada-1 creada: {rt_priv_1_id}")
     
     # Tabla para Subred Privada 2
     print("Creando tabla de enrutamiento para Subred-Privada-2...")
-    rt_priv_2_response = ec2.create_route_table(VpcId=vpc_id)
+    rt_priv_2_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Privada-2'}])
     rt_priv_2_id = rt_priv_2_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[rt_priv_2_id], Tags=[{'Key': 'Name', 'Value': 'RT-Privada-2'}])
     ec2.create_route(RouteTableId=rt_priv_2_id, DestinationCidrBlock='0.0.0.0/0', NatGatewayId=nat_gateway_id)
     ec2.associate_route_table(RouteTableId=rt_priv_2_id, SubnetId=subnet_privada_2_id)
     print(f"Tabla RT-Privada-2 creada: {rt_priv_2_id}")
@@ -333,7 +350,7 @@ def ejercicio4_tablas_enrutamiento(vpc_id, igw_id, nat_gateway_id, subnet_public
 
 def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id, subnet_privada_1_id, subnet_privada_2_id):
     """Ejercicio 5: Crear grupos de seguridad e instancias EC2 en cada subred"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 5: Creando grupos de seguridad e instancias ===")
     
@@ -342,10 +359,10 @@ def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id,
     sg_bastion_response = ec2.create_security_group(
         GroupName='GS-Bastion',
         Description='Security Group para Bastion Hosts',
-        VpcId=vpc_id
+        VpcId=vpc_id,
+        Tags=[{'Key': 'Name', 'Value': 'GS-Bastion'}]
     )
     sg_bastion_id = sg_bastion_response['GroupId']
-    ec2.create_tags(Resources=[sg_bastion_id], Tags=[{'Key': 'Name', 'Value': 'GS-Bastion'}])
     
     # Regla SSH para GS-Bastion
     ec2.authorize_security_group_ingress(
@@ -364,10 +381,10 @@ def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id,
     sg_app_response = ec2.create_security_group(
         GroupName='GS-App',
         Description='Security Group para App Servers',
-        VpcId=vpc_id
+        VpcId=vpc_id,
+        Tags=[{'Key': 'Name', 'Value': 'GS-App'}]
     )
     sg_app_id = sg_app_response['GroupId']
-    ec2.create_tags(Resources=[sg_app_id], Tags=[{'Key': 'Name', 'Value': 'GS-App'}])
     
     # Reglas para GS-App (SSH y ICMP solo desde GS-Bastion)
     ec2.authorize_security_group_ingress(
@@ -391,14 +408,7 @@ def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id,
     
     # Obtener AMI de Ubuntu
     print("Obteniendo AMI de Ubuntu...")
-    images = ec2.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-id', 'Values': ['099720109477']}
-        ],
-        Owners=['099720109477']
-    )
-    ami_id = sorted(images['Images'], key=lambda x: x['CreationDate'], reverse=True)[0]['ImageId']
+    ami_id = get_ubuntu_ami(ec2)
     
     # Lanzar instancias Bastion en subredes públicas
     print("Lanzando Bastion-Host-1...")
@@ -478,6 +488,10 @@ def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id,
     app_2_id = app_2_response['Instances'][0]['InstanceId']
     print(f"App-Server-2 lanzado: {app_2_id}")
     
+    # Comprobar los accesos entre instancias según sus grupos de seguridad
+    print("Comprobando accesos de GS-Bastion y GS-App...")
+    verify_access(['us-east-1'], [vpc_id], ACCESOS_ESPERADOS)
+    
     print("✅ Instancias y grupos de seguridad creados exitosamente!")
     return {
         'sg_bastion_id': sg_bastion_id,
@@ -489,15 +503,14 @@ def ejercicio5_instancias_ec2(vpc_id, subnet_publica_1_id, subnet_publica_2_id,
     }
 def ejercicio6_nacl(vpc_id, subnet_publica_1_id, subnet_publica_2_id, subnet_privada_1_id, subnet_privada_2_id):
     """Ejercicio 6: Configurar ACLs específicas para subredes públicas y privadas"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 6: Configurando Network ACLs específicas ===")
     
     # NACL para Subredes Públicas (SSH e ICMP permitidos)
     print("Creando NACL para subredes públicas...")
-    nacl_publica_response = ec2.create_network_acl(VpcId=vpc_id)
+    nacl_publica_response = ec2.create_network_acl(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'NACL-Publica'}])
     nacl_publica_id = nacl_publica_response['NetworkAcl']['NetworkAclId']
-    ec2.create_tags(Resources=[nacl_publica_id], Tags=[{'Key': 'Name', 'Value': 'NACL-Publica'}])
     
     # Reglas de entrada para NACL pública
     ec2.create_network_acl_entry(
@@ -525,9 +538,8 @@ def ejercicio6_nacl(vpc_id, subnet_publica_1_id, subnet_publica_2_id, subnet_pri
     
     # NACL para Subredes Privadas (denegar tráfico externo)
     print("Creando NACL para subredes privadas...")
-    nacl_privada_response = ec2.create_network_acl(VpcId=vpc_id)
+    nacl_privada_response = ec2.create_network_acl(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'NACL-Privada'}])
     nacl_privada_id = nacl_privada_response['NetworkAcl']['NetworkAclId']
-    ec2.create_tags(Resources=[nacl_privada_id], Tags=[{'Key': 'Name', 'Value': 'NACL-Privada'}])
     
     # Solo permitir tráfico interno de la VPC (10.0.0.0/16)
     ec2.create_network_acl_entry(
@@ -568,28 +580,33 @@ def ejercicio6_nacl(vpc_id, subnet_publica_1_id, subnet_publica_2_id, subnet_pri
     return {'nacl_publica_id': nacl_publica_id, 'nacl_privada_id': nacl_privada_id}
 
 
-def main():
+def main(resume=False, journal_path=JOURNAL_PATH):
     """Función principal que ejecuta todos los ejercicios dinámicamente"""
     recursos = {}
+    # Plan de CIDRs comprobado antes de cualquier llamada a AWS
+    if not validate_topology({'Examen-VPC-Ricardo': (VPC_CIDR, SUBNET_CIDRS)}):
+        return
+    journal = Journal(journal_path, resume=resume).attach()
     
     # Ejercicio 1: Crear VPC
     print("\n" + "="*50)
     print("INICIANDO EJERCICIOS AWS")
     print("="*50)
     
-    vpc_id = ejercicio1_crear_vpc()
+    vpc_id = journal.step('ejercicio1', ejercicio1_crear_vpc)
     recursos['vpc_id'] = vpc_id
     
     # Ejercicio 2: Crear infraestructura de red
-    recursos_red = ejercicio2_crear_infraestructura(vpc_id)
+    recursos_red = journal.step('ejercicio2', ejercicio2_crear_infraestructura, vpc_id)
     recursos.update(recursos_red)
     
     # Ejercicio 3: Crear NAT Gateway
-    recursos_nat = ejercicio3_nat(recursos['subnet_publica_1_id'])
+    recursos_nat = journal.step('ejercicio3', ejercicio3_nat, recursos['subnet_publica_1_id'])
     recursos.update(recursos_nat)
     
     # Ejercicio 4: Crear tablas de enrutamiento
-    recursos_tablas = ejercicio4_tablas_enrutamiento(
+    recursos_tablas = journal.step(
+        'ejercicio4', ejercicio4_tablas_enrutamiento,
         recursos['vpc_id'],
         recursos['igw_id'],
         recursos['nat_gateway_id'],
@@ -601,7 +618,8 @@ def main():
     recursos.update(recursos_tablas)
     
     # Ejercicio 5: Crear instancias EC2
-    recursos_instancias = ejercicio5_instancias_ec2(
+    recursos_instancias = journal.step(
+        'ejercicio5', ejercicio5_instancias_ec2,
         recursos['vpc_id'],
         recursos['subnet_publica_1_id'],
         recursos['subnet_publica_2_id'],
@@ -611,7 +629,8 @@ def main():
     recursos.update(recursos_instancias)
     
     # Ejercicio 6: Configurar NACLs
-    recursos_nacl = ejercicio6_nacl(
+    recursos_nacl = journal.step(
+        'ejercicio6', ejercicio6_nacl,
         recursos['vpc_id'],
         recursos['subnet_publica_1_id'],
         recursos['subnet_publica_2_id'],
@@ -633,11 +652,19 @@ def main():
     print("="*50)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Examen 1: VPC, subredes, NAT, instancias y NACLs')
+    parser.add_argument('--resume', action='store_true',
+                        help="Reanuda un despliegue fallido saltando los pasos ya completados")
+    parser.add_argument('--journal', metavar='RUTA', default=JOURNAL_PATH,
+                        help="Diario SQLite del despliegue (por defecto junto al script)")
+    args = parser.parse_args()
+    
     try:
-        main()
+        main(resume=args.resume, journal_path=args.journal)
     except KeyboardInterrupt:
         print("\n❌ Ejecución interrumpida por el usuario")
     except Exception as e:
         print(f"\n❌ Error durante la ejecución: {e}")
+        print("💡 Vuelve a ejecutar con --resume para continuar desde el último paso completado")
         import traceback
         traceback.print_exc()
\ No newline at end of file
@@ -1,43 +1,39 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.clients import get_client
+from aws_utils.inventory import build_inventory, iter_instances, iter_resources
+from aws_utils.poller import shared_poller
+from aws_utils.reconcile import call_with_retry, current_state, delete_once, use_state
+from aws_utils.teardown import delete_tgw_peering_attachments, run_per_region, terminate_instances
+
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
 
 def cleanup_region(region):
     """Limpia todos los recursos de Transit Gateway en una región"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n=== Limpiando recursos en {region} ===")
     
     # 1. Terminar instancias EC2
     print("Terminando instancias EC2...")
-    instances = ec2.describe_instances(
+    instance_ids = [instance['InstanceId'] for instance in iter_instances(
+        ec2,
         Filters=[
             {'Name': 'instance-state-name', 'Values': ['running', 'stopped', 'stopping', 'pending']},
             {'Name': 'tag:Name', 'Values': ['Instance-VPC-R1-B', 'Instance-VPC-R2-A', 'Instance-VPC-West-1']}
         ]
-    )
-    
-    instance_ids = []
-    for reservation in instances['Reservations']:
-        for instance in reservation['Instances']:
-            instance_ids.append(instance['InstanceId'])
+    )]
     
     if instance_ids:
-        ec2.terminate_instances(InstanceIds=instance_ids)
         print(f"Terminando instancias: {instance_ids}")
-        
-        # Esperar a que las instancias se terminen
+        # Una sola llamada y una sola espera para todas las instancias de la región
         print("Esperando que las instancias se terminen...")
-        for instance_id in instance_ids:
-            while True:
-                try:
-                    response = ec2.describe_instances(InstanceIds=[instance_id])
-                    state = response['Reservations'][0]['Instances'][0]['State']['Name']
-                    if state == 'terminated':
-                        break
-                    time.sleep(10)
-                except:
-                    break
+        terminate_instances(ec2, instance_ids)
     
     # 2. Eliminar rutas personalizadas de las tablas de rutas
     print("Eliminando rutas personalizadas...")
@@ -54,7 +50,9 @@ def cleanup_region(region):
                     route.get('DestinationCidrBlock') not in ['0.0.0.0/0'] and
                     route.get('TransitGatewayId')):
                     try:
-                        ec2.delete_route(
+                        # Una ruta que ya no existe (InvalidRoute.NotFound) cuenta como borrada
+                        call_with_retry(
+                            ec2.delete_route,
                             RouteTableId=rt_id,
                             DestinationCidrBlock=route['DestinationCidrBlock']
                         )
@@ -64,160 +62,118 @@ def cleanup_region(region):
     except Exception as e:
         print(f"Error eliminando rutas: {e}")
     
-    # 3. Eliminar TGW Peering Attachments
-    print("Eliminando TGW Peering Attachments...")
-    try:
-        peering_attachments = ec2.describe_transit_gateway_peering_attachments(
-            Filters=[{'Name': 'state', 'Values': ['available', 'pending', 'pendingAcceptance']}]
-        )
-        
-        for attachment in peering_attachments['TransitGatewayPeeringAttachments']:
-            attachment_id = attachment['TransitGatewayAttachmentId']
-            try:
-                ec2.delete_transit_gateway_peering_attachment(TransitGatewayAttachmentId=attachment_id)
-                print(f"Eliminando TGW Peering: {attachment_id}")
-                
-                # Esperar a que se elimine
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateway_peering_attachments(
-                            TransitGatewayAttachmentIds=[attachment_id]
-                        )
-                        state = response['TransitGatewayPeeringAttachments'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(10)
-                    except:
-                        break
-            except Exception as e:
-                print(f"Error eliminando peering {attachment_id}: {e}")
-    except Exception as e:
-        print(f"No hay peering attachments o error: {e}")
-    
-    # 4. Eliminar TGW VPC Attachments
+    # 3. Eliminar TGW VPC Attachments
     print("Eliminando TGW VPC Attachments...")
     try:
-        vpc_attachments = ec2.describe_transit_gateway_vpc_attachments(
-            Filters=[{'Name': 'state', 'Values': ['available', 'pending']}]
-        )
-        
-        for attachment in vpc_attachments['TransitGatewayVpcAttachments']:
+        attachment_ids = []
+        for attachment in iter_resources(
+                ec2, 'describe_transit_gateway_vpc_attachments', 'TransitGatewayVpcAttachments',
+                Filters=[{'Name': 'state', 'Values': ['available', 'pending']}]
+        ):
             attachment_id = attachment['TransitGatewayAttachmentId']
             try:
-                ec2.delete_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment_id)
-                print(f"Eliminando TGW VPC Attachment: {attachment_id}")
-                
-                # Esperar a que se elimine
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateway_vpc_attachments(
-                            TransitGatewayAttachmentIds=[attachment_id]
-                        )
-                        state = response['TransitGatewayVpcAttachments'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(10)
-                    except:
-                        break
+                if delete_once(attachment_id, ec2.delete_transit_gateway_vpc_attachment,
+                               TransitGatewayAttachmentId=attachment_id):
+                    print(f"Eliminando TGW VPC Attachment: {attachment_id}")
+                    attachment_ids.append(attachment_id)
             except Exception as e:
                 print(f"Error eliminando attachment {attachment_id}: {e}")
+        
+        # Una sola espera para todos los attachments de la región
+        if attachment_ids:
+            shared_poller(ec2, 'tgw_vpc_attachment').wait(
+                attachment_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+            )
     except Exception as e:
         print(f"No hay VPC attachments o error: {e}")
     
-    # 5. Eliminar Transit Gateways
+    # 4. Eliminar Transit Gateways
     print("Eliminando Transit Gateways...")
     try:
-        tgws = ec2.describe_transit_gateways(
-            Filters=[
-                {'Name': 'state', 'Values': ['available']},
-                {'Name': 'tag:Name', 'Values': ['TGW-East', 'TGW-West']}
-            ]
-        )
-        
-        for tgw in tgws['TransitGateways']:
+        tgw_ids = []
+        for tgw in iter_resources(
+                ec2, 'describe_transit_gateways', 'TransitGateways',
+                Filters=[
+                    {'Name': 'state', 'Values': ['available']},
+                    {'Name': 'tag:Name', 'Values': ['TGW-East', 'TGW-West']}
+                ]
+        ):
             tgw_id = tgw['TransitGatewayId']
             try:
-                ec2.delete_transit_gateway(TransitGatewayId=tgw_id)
-                print(f"Eliminando TGW: {tgw_id}")
-                
-                # Esperar a que se elimine
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateways(TransitGatewayIds=[tgw_id])
-                        state = response['TransitGateways'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(15)
-                    except:
-                        break
+                # Mientras quedan attachments en 'deleting' el TGW responde IncorrectState y se reintenta
+                if delete_once(tgw_id, ec2.delete_transit_gateway, TransitGatewayId=tgw_id):
+                    print(f"Eliminando TGW: {tgw_id}")
+                    tgw_ids.append(tgw_id)
             except Exception as e:
                 print(f"Error eliminando TGW {tgw_id}: {e}")
+        
+        if tgw_ids:
+            shared_poller(ec2, 'transit_gateway').wait(
+                tgw_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+            )
     except Exception as e:
         print(f"No hay Transit Gateways o error: {e}")
     
-    # 6. Eliminar VPCs y recursos asociados
+    # 5. Eliminar VPCs y recursos asociados
     print("Eliminando VPCs y recursos asociados...")
-    vpcs = ec2.describe_vpcs(
+    vpcs = list(iter_resources(
+        ec2, 'describe_vpcs', 'Vpcs',
         Filters=[
             {'Name': 'tag:Name', 'Values': ['VPC-East-1', 'VPC-East-2', 'VPC-West-1']}
         ]
-    )
+    ))
+    # Una consulta por tipo de recurso para todas las VPCs, en lugar de una por VPC
+    inventory = build_inventory(ec2, [vpc['VpcId'] for vpc in vpcs], ['security_groups', 'subnets', 'internet_gateways'])
     
-    for vpc in vpcs['Vpcs']:
+    for vpc in vpcs:
         vpc_id = vpc['VpcId']
         print(f"Eliminando VPC: {vpc_id}")
         
         try:
             # Eliminar Security Groups (excepto el default)
-            sgs = ec2.describe_security_groups(
-                Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-            )
-            for sg in sgs['SecurityGroups']:
+            for sg in inventory[vpc_id]['security_groups']:
                 if sg['GroupName'] != 'default':
                     try:
-                        ec2.delete_security_group(GroupId=sg['GroupId'])
-                        print(f"  Security Group eliminado: {sg['GroupId']}")
+                        if delete_once(sg['GroupId'], ec2.delete_security_group, GroupId=sg['GroupId']):
+                            print(f"  Security Group eliminado: {sg['GroupId']}")
                     except Exception as e:
                         print(f"  Error eliminando SG {sg['GroupId']}: {e}")
             
             # Eliminar subredes
-            subnets = ec2.describe_subnets(
-                Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-            )
-            for subnet in subnets['Subnets']:
+            for subnet in inventory[vpc_id]['subnets']:
                 try:
-                    ec2.delete_subnet(SubnetId=subnet['SubnetId'])
-                    print(f"  Subred eliminada: {subnet['SubnetId']}")
+                    if delete_once(subnet['SubnetId'], ec2.delete_subnet, SubnetId=subnet['SubnetId']):
+                        print(f"  Subred eliminada: {subnet['SubnetId']}")
                 except Exception as e:
                     print(f"  Error eliminando subnet {subnet['SubnetId']}: {e}")
             
             # Desconectar y eliminar Internet Gateway
-            igws = ec2.describe_internet_gateways(
-                Filters=[{'Name': 'attachment.vpc-id', 'Values': [vpc_id]}]
-            )
-            for igw in igws['InternetGateways']:
+            for igw in inventory[vpc_id]['internet_gateways']:
+                if current_state().is_deleted(igw['InternetGatewayId']):
+                    continue
                 try:
-                    ec2.detach_internet_gateway(
+                    call_with_retry(
+                        ec2.detach_internet_gateway,
                         InternetGatewayId=igw['InternetGatewayId'],
                         VpcId=vpc_id
                     )
-                    ec2.delete_internet_gateway(InternetGatewayId=igw['InternetGatewayId'])
+                    delete_once(igw['InternetGatewayId'], ec2.delete_internet_gateway,
+                                InternetGatewayId=igw['InternetGatewayId'])
                     print(f"  Internet Gateway eliminado: {igw['InternetGatewayId']}")
                 except Exception as e:
                     print(f"  Error eliminando IGW {igw['InternetGatewayId']}: {e}")
             
-            # Eliminar VPC
-            time.sleep(5)
+            # Eliminar VPC (DependencyViolation se reintenta con backoff)
             try:
-                ec2.delete_vpc(VpcId=vpc_id)
-                print(f"  VPC eliminada: {vpc_id}")
+                if delete_once(vpc_id, ec2.delete_vpc, VpcId=vpc_id):
+                    print(f"  VPC eliminada: {vpc_id}")
             except Exception as e:
                 print(f"  Error eliminando VPC {vpc_id}: {e}")
                 
         except Exception as e:
             print(f"Error procesando VPC {vpc_id}: {e}")
 
-def main():
+def main(parallel=False, state=STATE_PATH):
     """Función principal para limpiar toda la infraestructura"""
     print("=== Iniciando limpieza de infraestructura Transit Gateway (3 VPCs) ===")
     print("⚠️  ADVERTENCIA: Este script eliminará TODOS los recursos creados")
@@ -227,42 +183,34 @@ def main():
     if confirm != 'ELIMINAR':
         print("Operación cancelada")
         return
+    use_state(state)
     
-    # Limpiar ambas regiones
-    regions = ['us-east-1', 'us-west-2']
+    # El peering entre regiones es lo único compartido: se elimina una sola vez, primero
+    print("Eliminando TGW Peering Attachments...")
+    try:
+        delete_tgw_peering_attachments(get_client('ec2', 'us-east-1'))
+    except Exception as e:
+        print(f"No hay peering attachments o error: {e}")
     
-    for region in regions:
+    def cleanup(region):
         try:
             cleanup_region(region)
             print(f"✅ Limpieza completada en {region}")
         except Exception as e:
             print(f"❌ Error en {region}: {e}")
     
+    # Limpiar ambas regiones (a la vez con --parallel)
+    run_per_region(cleanup, ['us-east-1', 'us-west-2'], parallel=parallel)
+    
     print("\n=== Limpieza completada ===")
     print("Todos los recursos han sido eliminados o marcados para eliminación")
 
 if __name__ == "__main__":
-    main()d}")
-            except Exception as e:
-                print(f"  Error eliminando VPC {vpc_id}: {e}")
-                
-        except Exception as e:
-            print(f"Error procesando VPC {vpc_id}: {e}")
-
-def main():
-    print("=== Iniciando limpieza de infraestructura Transit Gateway (3 VPCs) ===")
-    
-    regions = ['us-east-1', 'us-west-2']
-    
-    try:
-        for region in regions:
-            cleanup_region(region)
-        
-        print("\n✅ Limpieza completada exitosamente!")
-        print("🗑️ Todos los recursos de Transit Gateway han sido eliminados")
-        
-    except Exception as e:
-        print(f"❌ Error durante la limpieza: {e}")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza Transit Gateway (3 VPCs)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Limpia las dos regiones a la vez (el peering se elimina antes, una sola vez)")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+    
+    main(parallel=args.parallel, state=args.state)
@@ -1,192 +1,168 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.clients import get_client
+from aws_utils.dag import DagExecutor
+from aws_utils.inventory import build_inventory, iter_instances, iter_resources
+from aws_utils.plan import StepTimer, load_or_collect, print_plan, record_durations
+from aws_utils.poller import shared_poller
+from aws_utils.reconcile import call_with_retry, current_state, delete_once, use_state
+from aws_utils.teardown import delete_tgw_peering_attachments, run_per_region, terminate_instances
+
+REGIONS = ['us-east-1', 'us-west-2']
+INSTANCE_FILTERS = [
+    {'Name': 'instance-state-name', 'Values': ['running', 'stopped', 'stopping', 'pending']},
+    {'Name': 'tag:Name', 'Values': ['Instance-VPC-East-1', 'Instance-VPC-East-2', 'Instance-VPC-West-1']}
+]
+ATTACHMENT_FILTERS = [{'Name': 'state', 'Values': ['available', 'pending']}]
+TGW_FILTERS = [
+    {'Name': 'state', 'Values': ['available']},
+    {'Name': 'tag:Name', 'Values': ['TGW-East', 'TGW-West']}
+]
+VPC_FILTERS = [{'Name': 'tag:Name', 'Values': ['VPC-East-1', 'VPC-East-2', 'VPC-West-1']}]
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
 
 def cleanup_region(region):
     """Limpia todos los recursos de Transit Gateway en una región"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
+    # Duración de cada paso, para las estimaciones de --plan (solo los que borran algo sin fallar)
+    timer = StepTimer()
     
     print(f"\n=== Limpiando recursos en {region} ===")
     
     # 1. Terminar instancias EC2
     print("1. Terminando instancias EC2...")
+    timer.start(f'instances:{region}')
     try:
-        instances = ec2.describe_instances(
-            Filters=[
-                {'Name': 'instance-state-name', 'Values': ['running', 'stopped', 'stopping', 'pending']},
-                {'Name': 'tag:Name', 'Values': ['Instance-VPC-East-1', 'Instance-VPC-East-2', 'Instance-VPC-West-1']}
-            ]
-        )
-        
-        instance_ids = []
-        for reservation in instances['Reservations']:
-            for instance in reservation['Instances']:
-                instance_ids.append(instance['InstanceId'])
+        instance_ids = [instance['InstanceId'] for instance in iter_instances(ec2, Filters=INSTANCE_FILTERS)]
         
         if instance_ids:
-            ec2.terminate_instances(InstanceIds=instance_ids)
             print(f"   Terminando instancias: {instance_ids}")
-            
-            # Esperar terminación
-            for instance_id in instance_ids:
-                waiter = ec2.get_waiter('instance_terminated')
-                waiter.wait(InstanceIds=[instance_id], WaiterConfig={'Delay': 15, 'MaxAttempts': 40})
+            # Una sola llamada y una sola espera para todas las instancias de la región
+            if terminate_instances(ec2, instance_ids):
+                timer.done()
             print("   ✅ Instancias terminadas")
         else:
             print("   No hay instancias para terminar")
     except Exception as e:
         print(f"   ⚠️ Error terminando instancias: {e}")
 
-    # 2. Eliminar TGW Peering Attachments
-    print("2. Eliminando TGW Peering Attachments...")
-    try:
-        peering_attachments = ec2.describe_transit_gateway_peering_attachments(
-            Filters=[{'Name': 'state', 'Values': ['available', 'pending', 'pendingAcceptance']}]
-        )
-        
-        for attachment in peering_attachments['TransitGatewayPeeringAttachments']:
-            attachment_id = attachment['TransitGatewayAttachmentId']
-            try:
-                ec2.delete_transit_gateway_peering_attachment(TransitGatewayAttachmentId=attachment_id)
-                print(f"   Eliminando TGW Peering: {attachment_id}")
-                
-                # Esperar eliminación
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateway_peering_attachments(
-                            TransitGatewayAttachmentIds=[attachment_id]
-                        )
-                        state = response['TransitGatewayPeeringAttachments'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(10)
-                    except:
-                        break
-                print(f"   ✅ Peering eliminado: {attachment_id}")
-            except Exception as e:
-                print(f"   ⚠️ Error eliminando peering {attachment_id}: {e}")
-    except Exception as e:
-        print(f"   No hay peering attachments: {e}")
-
-    # 3. Eliminar TGW VPC Attachments
-    print("3. Eliminando TGW VPC Attachments...")
+    # 2. Eliminar TGW VPC Attachments
+    print("2. Eliminando TGW VPC Attachments...")
+    timer.start(f'tgw_vpc_attachments:{region}')
     try:
-        vpc_attachments = ec2.describe_transit_gateway_vpc_attachments(
-            Filters=[{'Name': 'state', 'Values': ['available', 'pending']}]
-        )
-        
-        for attachment in vpc_attachments['TransitGatewayVpcAttachments']:
+        attachment_ids = []
+        failed = False
+        for attachment in iter_resources(
+                ec2, 'describe_transit_gateway_vpc_attachments', 'TransitGatewayVpcAttachments',
+                Filters=ATTACHMENT_FILTERS
+        ):
             attachment_id = attachment['TransitGatewayAttachmentId']
             try:
-                ec2.delete_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment_id)
-                print(f"   Eliminando TGW VPC Attachment: {attachment_id}")
-                
-                # Esperar eliminación
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateway_vpc_attachments(
-                            TransitGatewayAttachmentIds=[attachment_id]
-                        )
-                        state = response['TransitGatewayVpcAttachments'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(10)
-                    except:
-                        break
-                print(f"   ✅ VPC Attachment eliminado: {attachment_id}")
+                if delete_once(attachment_id, ec2.delete_transit_gateway_vpc_attachment,
+                               TransitGatewayAttachmentId=attachment_id):
+                    print(f"   Eliminando TGW VPC Attachment: {attachment_id}")
+                    attachment_ids.append(attachment_id)
             except Exception as e:
+                failed = True
                 print(f"   ⚠️ Error eliminando attachment {attachment_id}: {e}")
+        
+        # Una sola espera para todos los attachments de la región
+        if attachment_ids:
+            shared_poller(ec2, 'tgw_vpc_attachment').wait(
+                attachment_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+            )
+            print(f"   ✅ VPC Attachments eliminados: {attachment_ids}")
+            if not failed:
+                timer.done()
     except Exception as e:
         print(f"   No hay VPC attachments: {e}")
 
-    # 4. Eliminar Transit Gateways
-    print("4. Eliminando Transit Gateways...")
+    # 3. Eliminar Transit Gateways
+    print("3. Eliminando Transit Gateways...")
+    timer.start(f'transit_gateways:{region}')
     try:
-        tgws = ec2.describe_transit_gateways(
-            Filters=[
-                {'Name': 'state', 'Values': ['available']},
-                {'Name': 'tag:Name', 'Values': ['TGW-East', 'TGW-West']}
-            ]
-        )
-        
-        for tgw in tgws['TransitGateways']:
+        tgw_ids = []
+        failed = False
+        for tgw in iter_resources(ec2, 'describe_transit_gateways', 'TransitGateways', Filters=TGW_FILTERS):
             tgw_id = tgw['TransitGatewayId']
             try:
-                ec2.delete_transit_gateway(TransitGatewayId=tgw_id)
-                print(f"   Eliminando TGW: {tgw_id}")
-                
-                # Esperar eliminación
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateways(TransitGatewayIds=[tgw_id])
-                        state = response['TransitGateways'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(15)
-                    except:
-                        break
-                print(f"   ✅ TGW eliminado: {tgw_id}")
+                # Mientras quedan attachments en 'deleting' el TGW responde IncorrectState y se reintenta
+                if delete_once(tgw_id, ec2.delete_transit_gateway, TransitGatewayId=tgw_id):
+                    print(f"   Eliminando TGW: {tgw_id}")
+                    tgw_ids.append(tgw_id)
             except Exception as e:
+                failed = True
                 print(f"   ⚠️ Error eliminando TGW {tgw_id}: {e}")
+        
+        if tgw_ids:
+            shared_poller(ec2, 'transit_gateway').wait(
+                tgw_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+            )
+            print(f"   ✅ TGWs eliminados: {tgw_ids}")
+            if not failed:
+                timer.done()
     except Exception as e:
         print(f"   No hay Transit Gateways: {e}")
 
-    # 5. Eliminar VPCs y recursos asociados
-    print("5. Eliminando VPCs y recursos asociados...")
+    # 4. Eliminar VPCs y recursos asociados
+    print("4. Eliminando VPCs y recursos asociados...")
     try:
-        vpcs = ec2.describe_vpcs(
-            Filters=[
-                {'Name': 'tag:Name', 'Values': ['VPC-East-1', 'VPC-East-2', 'VPC-West-1']}
-            ]
-        )
+        vpcs = list(iter_resources(ec2, 'describe_vpcs', 'Vpcs', Filters=VPC_FILTERS))
+        # Una consulta por tipo de recurso para todas las VPCs, en lugar de una por VPC
+        inventory = build_inventory(ec2, [vpc['VpcId'] for vpc in vpcs], ['security_groups', 'subnets', 'internet_gateways'])
         
-        for vpc in vpcs['Vpcs']:
+        for vpc in vpcs:
             vpc_id = vpc['VpcId']
             vpc_name = next((tag['Value'] for tag in vpc.get('Tags', []) if tag['Key'] == 'Name'), vpc_id)
             print(f"   Eliminando VPC: {vpc_name} ({vpc_id})")
+            timer.start(f'vpc_resources:{vpc_id}')
+            failed = False
             
             try:
                 # Eliminar Security Groups (excepto default)
-                sgs = ec2.describe_security_groups(
-                    Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-                )
-                for sg in sgs['SecurityGroups']:
+                for sg in inventory[vpc_id]['security_groups']:
                     if sg['GroupName'] != 'default':
                         try:
-                            ec2.delete_security_group(GroupId=sg['GroupId'])
-                            print(f"     Security Group eliminado: {sg['GroupId']}")
+                            if delete_once(sg['GroupId'], ec2.delete_security_group, GroupId=sg['GroupId']):
+                                print(f"     Security Group eliminado: {sg['GroupId']}")
                         except Exception as e:
+                            failed = True
                             print(f"     ⚠️ Error eliminando SG {sg['GroupId']}: {e}")
                 
                 # Eliminar subredes
-                subnets = ec2.describe_subnets(
-                    Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}]
-                )
-                for subnet in subnets['Subnets']:
+                for subnet in inventory[vpc_id]['subnets']:
                     try:
-                        ec2.delete_subnet(SubnetId=subnet['SubnetId'])
-                        print(f"     Subred eliminada: {subnet['SubnetId']}")
+                        if delete_once(subnet['SubnetId'], ec2.delete_subnet, SubnetId=subnet['SubnetId']):
+                            print(f"     Subred eliminada: {subnet['SubnetId']}")
                     except Exception as e:
+                        failed = True
                         print(f"     ⚠️ Error eliminando subnet {subnet['SubnetId']}: {e}")
                 
                 # Desconectar y eliminar Internet Gateway
-                igws = ec2.describe_internet_gateways(
-                    Filters=[{'Name': 'attachment.vpc-id', 'Values': [vpc_id]}]
-                )
-                for igw in igws['InternetGateways']:
+                for igw in inventory[vpc_id]['internet_gateways']:
+                    if current_state().is_deleted(igw['InternetGatewayId']):
+                        continue
                     try:
-                        ec2.detach_internet_gateway(
+                        call_with_retry(
+                            ec2.detach_internet_gateway,
                             InternetGatewayId=igw['InternetGatewayId'],
                             VpcId=vpc_id
                         )
-                        ec2.delete_internet_gateway(InternetGatewayId=igw['InternetGatewayId'])
+                        delete_once(igw['InternetGatewayId'], ec2.delete_internet_gateway,
+                                    InternetGatewayId=igw['InternetGatewayId'])
                         print(f"     Internet Gateway eliminado: {igw['InternetGatewayId']}")
                     except Exception as e:
+                        failed = True
                         print(f"     ⚠️ Error eliminando IGW {igw['InternetGatewayId']}: {e}")
                 
-                # Eliminar VPC
-                time.sleep(5)
-                ec2.delete_vpc(VpcId=vpc_id)
+                # Eliminar VPC (DependencyViolation se reintenta con backoff)
+                if delete_once(vpc_id, ec2.delete_vpc, VpcId=vpc_id) and not failed:
+                    timer.done()
                 print(f"   ✅ VPC eliminada: {vpc_name}")
                 
             except Exception as e:
@@ -194,9 +170,65 @@ def cleanup_region(region):
                 
     except Exception as e:
         print(f"   Error listando VPCs: {e}")
+    
+    timer.stop()
+    record_durations(timer.durations)
 
-def main():
+def collect_snapshot():
+    """Lo que borraría la limpieza en cada región, para --plan (solo llamadas describe_*)"""
+    snapshot = {
+        'tgw_peerings': [
+            attachment['TransitGatewayAttachmentId'] for attachment in iter_resources(
+                get_client('ec2', 'us-east-1'), 'describe_transit_gateway_peering_attachments',
+                'TransitGatewayPeeringAttachments',
+                Filters=[{'Name': 'state', 'Values': ['available', 'pending', 'pendingAcceptance']}]
+            )
+        ],
+        'regions': {}
+    }
+    for region in REGIONS:
+        ec2 = get_client('ec2', region)
+        snapshot['regions'][region] = {
+            'instances': [i['InstanceId'] for i in iter_instances(ec2, Filters=INSTANCE_FILTERS)],
+            'tgw_vpc_attachments': [
+                a['TransitGatewayAttachmentId'] for a in iter_resources(
+                    ec2, 'describe_transit_gateway_vpc_attachments', 'TransitGatewayVpcAttachments',
+                    Filters=ATTACHMENT_FILTERS
+                )
+            ],
+            'transit_gateways': [
+                t['TransitGatewayId'] for t in iter_resources(
+                    ec2, 'describe_transit_gateways', 'TransitGateways', Filters=TGW_FILTERS
+                )
+            ],
+            'vpcs': [v['VpcId'] for v in iter_resources(ec2, 'describe_vpcs', 'Vpcs', Filters=VPC_FILTERS)]
+        }
+    return snapshot
+
+def build_plan(snapshot, parallel=False):
+    """Grafo (sin ejecutar) con el mismo orden que main(): peering y luego cada región paso a paso"""
+    dag = DagExecutor()
+    noop = lambda *_: None
+    first = [dag.add('tgw_peering', noop)] if snapshot['tgw_peerings'] else []
+    previous = first
+    for region, resources in snapshot['regions'].items():
+        # Con --parallel cada región solo espera al peering; si no, a la región anterior
+        last = first if parallel else previous
+        for kind in ('instances', 'tgw_vpc_attachments', 'transit_gateways'):
+            if resources[kind]:
+                last = [dag.add(f'{kind}:{region}', noop, last)]
+        # Las VPCs de una región se borran una tras otra
+        for vpc_id in resources['vpcs']:
+            last = [dag.add(f'vpc_resources:{vpc_id}', noop, last)]
+        previous = last
+    return dag
+
+def main(parallel=False, plan=False, snapshot=None, state=STATE_PATH):
     """Función principal para limpiar toda la infraestructura"""
+    if plan:
+        print_plan(build_plan(load_or_collect(snapshot, collect_snapshot), parallel))
+        return
+    
     print("=== SCRIPT DE LIMPIEZA - TRANSIT GATEWAY (3 VPCs) ===")
     print("Este script eliminará TODA la infraestructura creada por transit_gateway_3vpcs.py")
     print("\nRecursos que se eliminarán:")
@@ -214,20 +246,44 @@ def main():
     if confirm != 'ELIMINAR':
         print("❌ Operación cancelada")
         return
+    use_state(state)
     
-    # Limpiar ambas regiones
-    regions = ['us-east-1', 'us-west-2']
+    # El peering entre regiones es lo único compartido: se elimina una sola vez, primero
+    print("\n=== Eliminando TGW Peering Attachments ===")
+    timer = StepTimer()
+    try:
+        timer.start('tgw_peering')
+        if delete_tgw_peering_attachments(get_client('ec2', 'us-east-1')):
+            timer.done()
+        timer.stop()
+        record_durations(timer.durations)
+    except Exception as e:
+        print(f"   No hay peering attachments: {e}")
     
-    for region in regions:
+    def cleanup(region):
         try:
             cleanup_region(region)
             print(f"✅ Limpieza completada en {region}")
         except Exception as e:
             print(f"❌ Error en {region}: {e}")
     
+    # Limpiar ambas regiones (a la vez con --parallel)
+    run_per_region(cleanup, REGIONS, parallel=parallel)
+    
     print("\n=== LIMPIEZA COMPLETADA ===")
     print("✅ Todos los recursos han sido eliminados o marcados para eliminación")
     print("💡 Verifica en la consola AWS que no queden recursos activos")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza Transit Gateway (3 VPCs)")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Limpia las dos regiones a la vez (el peering se elimina antes, una sola vez)")
+    parser.add_argument('--plan', action='store_true',
+                        help="Muestra las oleadas de borrado y el tiempo estimado sin borrar nada")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON del inventario para --plan (se crea si no existe)")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+    
+    main(parallel=args.parallel, plan=args.plan, snapshot=args.snapshot, state=args.state)
\ No newline at end of file
@@ -1,34 +1,38 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.clients import get_client
+from aws_utils.inventory import build_inventory, iter_instances, iter_resources
+from aws_utils.poller import shared_poller
+from aws_utils.reconcile import call_with_retry, current_state, delete_once, use_state
+from aws_utils.teardown import terminate_instances
+
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
 
 def cleanup_region(region, vpc_names):
     """Limpia recursos en una región específica"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     print(f"\n=== Limpiando {region} ===")
     
     # 1. Terminar instancias EC2
     print("1. Terminando instancias EC2...")
     try:
-        instances = ec2.describe_instances(
+        instance_ids = [instance['InstanceId'] for instance in iter_instances(
+            ec2,
             Filters=[
                 {'Name': 'instance-state-name', 'Values': ['running', 'stopped', 'stopping', 'pending']},
                 {'Name': 'tag:Name', 'Values': [f'Instance-{name}' for name in vpc_names]}
             ]
-        )
-        
-        instance_ids = []
-        for reservation in instances['Reservations']:
-            for instance in reservation['Instances']:
-                instance_ids.append(instance['InstanceId'])
+        )]
         
         if instance_ids:
-            ec2.terminate_instances(InstanceIds=instance_ids)
             print(f"   Terminando: {instance_ids}")
-            
-            for instance_id in instance_ids:
-                waiter = ec2.get_waiter('instance_terminated')
-                waiter.wait(InstanceIds=[instance_id], WaiterConfig={'Delay': 15, 'MaxAttempts': 40})
+            # Una sola llamada y una sola espera para todas las instancias de la región
+            terminate_instances(ec2, instance_ids)
             print("   ✅ Instancias terminadas")
         else:
             print("   No hay instancias")
@@ -37,7 +41,7 @@ def cleanup_region(region, vpc_names):
 
 def cleanup_vpc_peering():
     """Elimina todas las VPC Peering connections"""
-    ec2_east = boto3.client('ec2', region_name='us-east-1')
+    ec2_east = get_client('ec2', 'us-east-1')
     print("\n2. Eliminando VPC Peering Connections...")
     
     try:
@@ -51,8 +55,8 @@ def cleanup_vpc_peering():
         for peering in peerings['VpcPeeringConnections']:
             peering_id = peering['VpcPeeringConnectionId']
             try:
-                ec2_east.delete_vpc_peering_connection(VpcPeeringConnectionId=peering_id)
-                print(f"   ✅ Peering eliminado: {peering_id}")
+                if delete_once(peering_id, ec2_east.delete_vpc_peering_connection, VpcPeeringConnectionId=peering_id):
+                    print(f"   ✅ Peering eliminado: {peering_id}")
             except Exception as e:
                 print(f"   ⚠️ Error eliminando {peering_id}: {e}")
     except Exception as e:
@@ -60,34 +64,30 @@ def cleanup_vpc_peering():
 
 def cleanup_transit_gateway():
     """Elimina Transit Gateway y attachments en us-east-1"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = get_client('ec2', 'us-east-1')
     print("\n3. Eliminando Transit Gateway...")
     
     # Eliminar VPC Attachments
     try:
-        attachments = ec2.describe_transit_gateway_vpc_attachments(
-            Filters=[{'Name': 'state', 'Values': ['available']}]
-        )
-        
-        for attachment in attachments['TransitGatewayVpcAttachments']:
+        attachment_ids = []
+        for attachment in iter_resources(
+                ec2, 'describe_transit_gateway_vpc_attachments', 'TransitGatewayVpcAttachments',
+                Filters=[{'Name': 'state', 'Values': ['available']}]
+        ):
             attachment_id = attachment['TransitGatewayAttachmentId']
             try:
-                ec2.delete_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment_id)
-                print(f"   Eliminando attachment: {attachment_id}")
-                
-                while True:
-                    try:
-                        response = ec2.describe_transit_gateway_vpc_attachments(
-                            TransitGatewayAttachmentIds=[attachment_id]
-                        )
-                        state = response['TransitGatewayVpcAttachments'][0]['State']
-                        if state in ['deleted', 'deleting']:
-                            break
-                        time.sleep(10)
-                    except:
-                        break
+                if delete_once(attachment_id, ec2.delete_transit_gateway_vpc_attachment,
+                               TransitGatewayAttachmentId=attachment_id):
+                    print(f"   Eliminando attachment: {attachment_id}")
+                    attachment_ids.append(attachment_id)
             except Exception as e:
                 print(f"   ⚠️ Error: {e}")
+        
+        # Una sola espera para todos los attachments
+        if attachment_ids:
+            shared_poller(ec2, 'tgw_vpc_attachment').wait(
+                attachment_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+            )
     except Exception as e:
         print(f"   No attachments: {e}")
     
@@ -103,8 +103,9 @@ def cleanup_transit_gateway():
         for tgw in tgws['TransitGateways']:
             tgw_id = tgw['TransitGatewayId']
             try:
-                ec2.delete_transit_gateway(TransitGatewayId=tgw_id)
-                print(f"   ✅ TGW eliminado: {tgw_id}")
+                # Mientras quedan attachments en 'deleting' el TGW responde IncorrectState y se reintenta
+                if delete_once(tgw_id, ec2.delete_transit_gateway, TransitGatewayId=tgw_id):
+                    print(f"   ✅ TGW eliminado: {tgw_id}")
             except Exception as e:
                 print(f"   ⚠️ Error: {e}")
     except Exception as e:
@@ -112,57 +113,60 @@ def cleanup_transit_gateway():
 
 def cleanup_vpcs(region, vpc_names):
     """Elimina VPCs y recursos asociados"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     print(f"\n4. Eliminando VPCs en {region}...")
     
     try:
-        vpcs = ec2.describe_vpcs(
+        vpcs = list(iter_resources(
+            ec2, 'describe_vpcs', 'Vpcs',
             Filters=[{'Name': 'tag:Name', 'Values': vpc_names}]
-        )
+        ))
+        # Una consulta por tipo de recurso para todas las VPCs, en lugar de una por VPC
+        inventory = build_inventory(ec2, [vpc['VpcId'] for vpc in vpcs], ['security_groups', 'subnets', 'internet_gateways'])
         
-        for vpc in vpcs['Vpcs']:
+        for vpc in vpcs:
             vpc_id = vpc['VpcId']
             vpc_name = next((tag['Value'] for tag in vpc.get('Tags', []) if tag['Key'] == 'Name'), vpc_id)
             print(f"   Eliminando {vpc_name} ({vpc_id})")
             
             # Security Groups
-            sgs = ec2.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-            for sg in sgs['SecurityGroups']:
+            for sg in inventory[vpc_id]['security_groups']:
                 if sg['GroupName'] != 'default':
                     try:
-                        ec2.delete_security_group(GroupId=sg['GroupId'])
+                        delete_once(sg['GroupId'], ec2.delete_security_group, GroupId=sg['GroupId'])
                     except Exception as e:
                         print(f"     ⚠️ SG error: {e}")
             
             # Subredes
-            subnets = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-            for subnet in subnets['Subnets']:
+            for subnet in inventory[vpc_id]['subnets']:
                 try:
-                    ec2.delete_subnet(SubnetId=subnet['SubnetId'])
+                    delete_once(subnet['SubnetId'], ec2.delete_subnet, SubnetId=subnet['SubnetId'])
                 except Exception as e:
                     print(f"     ⚠️ Subnet error: {e}")
             
             # Internet Gateways
-            igws = ec2.describe_internet_gateways(Filters=[{'Name': 'attachment.vpc-id', 'Values': [vpc_id]}])
-            for igw in igws['InternetGateways']:
+            for igw in inventory[vpc_id]['internet_gateways']:
+                if current_state().is_deleted(igw['InternetGatewayId']):
+                    continue
                 try:
-                    ec2.detach_internet_gateway(InternetGatewayId=igw['InternetGatewayId'], VpcId=vpc_id)
-                    ec2.delete_internet_gateway(InternetGatewayId=igw['InternetGatewayId'])
+                    call_with_retry(ec2.detach_internet_gateway,
+                                    InternetGatewayId=igw['InternetGatewayId'], VpcId=vpc_id)
+                    delete_once(igw['InternetGatewayId'], ec2.delete_internet_gateway,
+                                InternetGatewayId=igw['InternetGatewayId'])
                 except Exception as e:
                     print(f"     ⚠️ IGW error: {e}")
             
-            # VPC
-            time.sleep(5)
+            # VPC (DependencyViolation se reintenta con backoff)
             try:
-                ec2.delete_vpc(VpcId=vpc_id)
-                print(f"   ✅ VPC eliminada: {vpc_name}")
+                if delete_once(vpc_id, ec2.delete_vpc, VpcId=vpc_id):
+                    print(f"   ✅ VPC eliminada: {vpc_name}")
             except Exception as e:
                 print(f"   ⚠️ VPC error: {e}")
                 
     except Exception as e:
         print(f"   Error: {e}")
 
-def main():
+def main(state=STATE_PATH):
     """Función principal de limpieza"""
     print("=== LIMPIEZA INFRAESTRUCTURA HÍBRIDA VPC PEERING + TGW ===")
     print("\nRecursos a eliminar:")
@@ -176,6 +180,7 @@ def main():
     if confirm != 'ELIMINAR':
         print("❌ Cancelado")
         return
+    use_state(state)
     
     # Definir VPCs por región
     region1_vpcs = ['VPC-R1-A', 'VPC-R1-B']
@@ -202,4 +207,9 @@ def main():
         print(f"\n❌ Error general: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza VPC Peering + Transit Gateway")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+    
+    main(state=args.state)
\ No newline at end of file
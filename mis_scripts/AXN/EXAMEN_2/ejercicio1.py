@@ -1,6 +1,10 @@
 import boto3
 import time
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.cidr import validate_topology
 
 # --- CONFIGURACIÓN ---
 REGION = 'us-east-1'
@@ -18,6 +22,12 @@ ec2 = boto3.client('ec2', region_name=REGION)
 def create_3tier_architecture():
     print(f"--- INICIANDO DESPLIEGUE EN {REGION} ---")
 
+    # Plan de CIDRs comprobado antes de cualquier llamada a AWS; el rango
+    # público 15.0.0.0/20 es el que pide el enunciado
+    subnet_cidrs = {f'Subnet-{name}': info['cidr'] for name, info in SUBNETS_INFO.items()}
+    if not validate_topology({'VPC-3Capas': (VPC_CIDR, subnet_cidrs)}, allow_public={'VPC-3Capas'}):
+        return
+
     # 1. Crear VPC
     print(f"Creando VPC {VPC_CIDR}...")
     vpc = ec2.create_vpc(CidrBlock=VPC_CIDR, TagSpecifications=[{'ResourceType': 'vpc', 'Tags': [{'Key': 'Name', 'Value': 'VPC-3Capas'}]}])
@@ -1,18 +1,22 @@
 #!/usr/bin/env python3
-import boto3
+import argparse
+import concurrent.futures
+import os
+import sys
 import time
 
-def get_ubuntu_ami(ec2_client):
-    """Obtiene la AMI más reciente de Ubuntu 22.04 LTS"""
-    response = ec2_client.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-id', 'Values': ['099720109477']},
-            {'Name': 'state', 'Values': ['available']}
-        ]
-    )
-    images = sorted(response['Images'], key=lambda x: x['CreationDate'], reverse=True)
-    return images[0]['ImageId']
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils import instrumentation
+from aws_utils.ami import get_ubuntu_ami
+from aws_utils.cidr import topology_from_configs, validate_topology
+from aws_utils.clients import get_client
+from aws_utils.dag import DagExecutor
+from aws_utils.poller import shared_poller
+from aws_utils.reachability import verify_mesh
+from aws_utils.readiness import tgw_peering_route_table, vpcs_ready_for_tgw_routes, wait_each
+
+# Métricas opcionales con AWS_UTILS_METRICS=1
+instrumentation.enable_from_env()
 
 def wait_for_instances_running(ec2_client, instance_ids):
     """Espera a que las instancias estén en estado running, manejando instancias que no existen"""
@@ -74,52 +78,49 @@ def wait_for_instances_running(ec2_client, instance_ids):
     
     print(f"⚠️ Timeout esperando instancias, continuando con {len(valid_instances)} instancias válidas")
 
-def create_vpc_infrastructure(region, vpc_configs):
-    """Crea VPCs, subredes, IGW e instancias EC2 en una región"""
-    ec2 = boto3.client('ec2', region_name=region)
-    
-    print(f"\n=== Creando VPCs en {region} ===")
+def add_vpc_nodes(dag, ec2, config):
+    """Añade al grafo los nodos de una VPC (VPC, IGW, subred, rutas, SG e instancia)"""
+    vpc_name = config['name']
+    vpc_cidr = config['vpc_cidr']
+    subnet_cidr = config['subnet_cidr']
     
-    ubuntu_ami = get_ubuntu_ami(ec2)
-    created_resources = []
-    
-    for config in vpc_configs:
-        vpc_name = config['name']
-        vpc_cidr = config['vpc_cidr']
-        subnet_cidr = config['subnet_cidr']
-        
+    def create_vpc():
         print(f"\n--- Creando {vpc_name} ---")
-        
-        # Crear VPC
         vpc_response = ec2.create_vpc(CidrBlock=vpc_cidr)
         vpc_id = vpc_response['Vpc']['VpcId']
         ec2.create_tags(Resources=[vpc_id], Tags=[{'Key': 'Name', 'Value': vpc_name}])
-        
-        # Habilitar DNS
+        return vpc_id
+    
+    def enable_dns_hostnames(vpc_id):
         ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
+    
+    def enable_dns_support(vpc_id):
         ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={'Value': True})
-        
-        # Crear Internet Gateway
+    
+    def create_igw():
         igw_response = ec2.create_internet_gateway()
         igw_id = igw_response['InternetGateway']['InternetGatewayId']
-        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
         ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': f'IGW-{vpc_name}'}])
-        
-        # Crear subred pública
-        azs = ec2.describe_availability_zones(Filters=[{'Name': 'state', 'Values': ['available']}])
-        az = azs['AvailabilityZones'][0]['ZoneName']
-        
+        return igw_id
+    
+    def attach_igw(vpc_id, igw_id):
+        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+    
+    def create_subnet(vpc_id, az):
         subnet_response = ec2.create_subnet(VpcId=vpc_id, CidrBlock=subnet_cidr, AvailabilityZone=az)
         subnet_id = subnet_response['Subnet']['SubnetId']
         ec2.create_tags(Resources=[subnet_id], Tags=[{'Key': 'Name', 'Value': f'Subnet-{vpc_name}'}])
         ec2.modify_subnet_attribute(SubnetId=subnet_id, MapPublicIpOnLaunch={'Value': True})
-        
-        # Configurar tabla de rutas
+        return subnet_id
+    
+    def get_main_route_table(vpc_id):
         route_tables = ec2.describe_route_tables(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-        main_rt_id = route_tables['RouteTables'][0]['RouteTableId']
+        return route_tables['RouteTables'][0]['RouteTableId']
+    
+    def create_default_route(main_rt_id, igw_id, _attached):
         ec2.create_route(RouteTableId=main_rt_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
-        
-        # Crear Security Group
+    
+    def create_sg(vpc_id):
         sg_response = ec2.create_security_group(
             GroupName=f'SG-{vpc_name}',
             Description=f'Security group for {vpc_name}',
@@ -127,8 +128,9 @@ def create_vpc_infrastructure(region, vpc_configs):
         )
         sg_id = sg_response['GroupId']
         ec2.create_tags(Resources=[sg_id], Tags=[{'Key': 'Name', 'Value': f'SG-{vpc_name}'}])
-        
-        # Reglas de seguridad
+        return sg_id
+    
+    def authorize_sg(sg_id):
         ec2.authorize_security_group_ingress(
             GroupId=sg_id,
             IpPermissions=[
@@ -136,8 +138,8 @@ def create_vpc_infrastructure(region, vpc_configs):
                 {'IpProtocol': 'icmp', 'FromPort': -1, 'ToPort': -1, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
             ]
         )
-        
-        # Crear instancia EC2
+    
+    def run_instance(ubuntu_ami, subnet_id, sg_id, _rules):
         print(f"Creando instancia en {vpc_name}...")
         instance_response = ec2.run_instances(
             ImageId=ubuntu_ami,
@@ -168,19 +170,51 @@ def create_vpc_infrastructure(region, vpc_configs):
         except Exception as e:
             print(f"⚠️ Error verificando estado de instancia: {e}")
         
-        print(f"VPC: {vpc_id}, Subnet: {subnet_id}, Instance: {instance_id}")
-        
-        created_resources.append({
-            'vpc_id': vpc_id,
-            'subnet_id': subnet_id,
-            'instance_id': instance_id,
-            'igw_id': igw_id,
-            'sg_id': sg_id,
-            'route_table_id': main_rt_id
-        })
-        
-        # Pausa entre creaciones para evitar problemas de límites
-        time.sleep(10)
+        return instance_id
+    
+    # Cada nodo declara solo sus dependencias reales
+    vpc = dag.add(f'{vpc_name}:vpc', create_vpc)
+    dag.add(f'{vpc_name}:dns_hostnames', enable_dns_hostnames, [vpc])
+    dag.add(f'{vpc_name}:dns_support', enable_dns_support, [vpc])
+    igw = dag.add(f'{vpc_name}:igw', create_igw)
+    attached = dag.add(f'{vpc_name}:igw_attach', attach_igw, [vpc, igw])
+    subnet = dag.add(f'{vpc_name}:subnet', create_subnet, [vpc, 'az'])
+    rt = dag.add(f'{vpc_name}:route_table', get_main_route_table, [vpc])
+    dag.add(f'{vpc_name}:default_route', create_default_route, [rt, igw, attached])
+    sg = dag.add(f'{vpc_name}:sg', create_sg, [vpc])
+    rules = dag.add(f'{vpc_name}:sg_rules', authorize_sg, [sg])
+    dag.add(f'{vpc_name}:instance', run_instance, ['ami', subnet, sg, rules])
+
+def create_vpc_infrastructure(region, vpc_configs, max_workers=8):
+    """Crea VPCs, subredes, IGW e instancias EC2 en una región"""
+    ec2 = get_client('ec2', region)
+    
+    print(f"\n=== Creando VPCs en {region} ===")
+    
+    # Grafo de dependencias: los recursos independientes se crean en paralelo
+    dag = DagExecutor(max_workers=max_workers)
+    dag.add('ami', lambda: get_ubuntu_ami(ec2))
+    dag.add('az', lambda: ec2.describe_availability_zones(
+        Filters=[{'Name': 'state', 'Values': ['available']}]
+    )['AvailabilityZones'][0]['ZoneName'])
+    for config in vpc_configs:
+        add_vpc_nodes(dag, ec2, config)
+    
+    results = dag.run()
+    
+    created_resources = []
+    for config in vpc_configs:
+        vpc_name = config['name']
+        resource = {
+            'vpc_id': results[f'{vpc_name}:vpc'],
+            'subnet_id': results[f'{vpc_name}:subnet'],
+            'instance_id': results[f'{vpc_name}:instance'],
+            'igw_id': results[f'{vpc_name}:igw'],
+            'sg_id': results[f'{vpc_name}:sg'],
+            'route_table_id': results[f'{vpc_name}:route_table']
+        }
+        print(f"{vpc_name} -> VPC: {resource['vpc_id']}, Subnet: {resource['subnet_id']}, Instance: {resource['instance_id']}")
+        created_resources.append(resource)
     
     # Esperar a que todas las instancias estén ejecutándose
     all_instance_ids = [res['instance_id'] for res in created_resources]
@@ -210,7 +244,7 @@ def create_vpc_infrastructure(region, vpc_configs):
 
 def create_transit_gateway(region, asn, name):
     """Crea Transit Gateway en una región"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n--- Creando Transit Gateway en {region} ---")
     
@@ -226,19 +260,14 @@ def create_transit_gateway(region, asn, name):
     
     # Esperar a que esté disponible
     print(f"Esperando que TGW {tgw_id} esté disponible...")
-    while True:
-        response = ec2.describe_transit_gateways(TransitGatewayIds=[tgw_id])
-        state = response['TransitGateways'][0]['State']
-        if state == 'available':
-            break
-        time.sleep(10)
+    shared_poller(ec2, 'transit_gateway').wait([tgw_id], ['available'], failed_states=['deleted'])
     
     print(f"Transit Gateway creado: {tgw_id}")
     return tgw_id
 
 def attach_vpcs_to_tgw(region, tgw_id, vpc_resources):
     """Conecta VPCs al Transit Gateway"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n--- Conectando VPCs al TGW en {region} ---")
     
@@ -263,20 +292,17 @@ def attach_vpcs_to_tgw(region, tgw_id, vpc_resources):
     
     # Esperar a que los attachments estén disponibles
     print("Esperando que los attachments estén disponibles...")
-    for attachment_id in attachments:
-        while True:
-            response = ec2.describe_transit_gateway_vpc_attachments(TransitGatewayAttachmentIds=[attachment_id])
-            state = response['TransitGatewayVpcAttachments'][0]['State']
-            if state == 'available':
-                break
-            time.sleep(10)
+    # Un único describe por tick para todos los attachments pendientes
+    shared_poller(ec2, 'tgw_vpc_attachment').wait(
+        attachments, ['available'], failed_states=['failed', 'rejected']
+    )
     
     return attachments
 
 def create_tgw_peering(tgw_east_id, tgw_west_id):
     """Crea peering entre Transit Gateways"""
-    ec2_east = boto3.client('ec2', region_name='us-east-1')
-    sts = boto3.client('sts')
+    ec2_east = get_client('ec2', 'us-east-1')
+    sts = get_client('sts')
     
     print("\n--- Creando TGW Peering ---")
     
@@ -298,63 +324,52 @@ def create_tgw_peering(tgw_east_id, tgw_west_id):
     
     # Esperar a que el peering esté en estado pendingAcceptance
     print("Esperando que el peering esté listo para aceptar...")
-    while True:
-        response = ec2_east.describe_transit_gateway_peering_attachments(TransitGatewayAttachmentIds=[peering_id])
-        state = response['TransitGatewayPeeringAttachments'][0]['State']
-        if state == 'pendingAcceptance':
-            break
-        time.sleep(5)
+    peering_poller = shared_poller(ec2_east, 'tgw_peering_attachment')
+    peering_poller.wait([peering_id], ['pendingAcceptance'], failed_states=['failed', 'rejected'])
     
     # Aceptar peering desde us-west-2
-    ec2_west = boto3.client('ec2', region_name='us-west-2')
+    ec2_west = get_client('ec2', 'us-west-2')
     print("Aceptando peering desde us-west-2...")
     ec2_west.accept_transit_gateway_peering_attachment(TransitGatewayAttachmentId=peering_id)
     
     # Esperar a que esté disponible
     print("Esperando que el peering esté disponible...")
-    while True:
-        response = ec2_east.describe_transit_gateway_peering_attachments(TransitGatewayAttachmentIds=[peering_id])
-        state = response['TransitGatewayPeeringAttachments'][0]['State']
-        if state == 'available':
-            break
-        time.sleep(10)
+    peering_poller.wait([peering_id], ['available'], failed_states=['failed', 'rejected'])
     
     return peering_id
 
 def configure_tgw_routes(tgw_east_id, tgw_west_id, peering_id):
     """Configura rutas en los Transit Gateways"""
-    ec2_east = boto3.client('ec2', region_name='us-east-1')
-    ec2_west = boto3.client('ec2', region_name='us-west-2')
+    ec2_east = get_client('ec2', 'us-east-1')
+    ec2_west = get_client('ec2', 'us-west-2')
     
     print("\n--- Configurando rutas TGW ---")
     
-    # Esperar un poco más para asegurar propagación del peering
-    time.sleep(30)
+    # Cada TGW: cliente, ID y destino hacia las redes de la otra región
+    sides = {
+        'us-east-1': (ec2_east, tgw_east_id, '192.0.0.0/8'),  # Hacia redes de West (192.x.x.x)
+        'us-west-2': (ec2_west, tgw_west_id, '10.0.0.0/8')    # Hacia redes de East (10.x.x.x)
+    }
+    route_tables = {}
     
-    try:
-        # Obtener tablas de rutas por defecto
-        east_rt = ec2_east.describe_transit_gateway_route_tables(
-            Filters=[{'Name': 'transit-gateway-id', 'Values': [tgw_east_id]}]
-        )['TransitGatewayRouteTables'][0]['TransitGatewayRouteTableId']
-        
-        west_rt = ec2_west.describe_transit_gateway_route_tables(
-            Filters=[{'Name': 'transit-gateway-id', 'Values': [tgw_west_id]}]
-        )['TransitGatewayRouteTables'][0]['TransitGatewayRouteTableId']
-        
-        # Ruta en TGW-East hacia redes de West (192.x.x.x)
-        ec2_east.create_transit_gateway_route(
-            DestinationCidrBlock='192.168.0.0/16',
-            TransitGatewayRouteTableId=east_rt,
-            TransitGatewayAttachmentId=peering_id
-        )
-        
-        # Ruta en TGW-West hacia redes de East (10.x.x.x)
-        ec2_west.create_transit_gateway_route(
-            DestinationCidrBlock='10.0.0.0/8',
-            TransitGatewayRouteTableId=west_rt,
+    def ready_sides(pending):
+        # Un lado está listo cuando el peering y la tabla por defecto de su TGW están disponibles
+        for region in pending:
+            ec2, tgw_id, _ = sides[region]
+            route_tables[region] = tgw_peering_route_table(ec2, tgw_id, peering_id)
+        return [region for region in pending if route_tables[region]]
+    
+    def add_route(region):
+        ec2, _, destination = sides[region]
+        ec2.create_transit_gateway_route(
+            DestinationCidrBlock=destination,
+            TransitGatewayRouteTableId=route_tables[region],
             TransitGatewayAttachmentId=peering_id
         )
-        
+        print(f"  Ruta {destination} -> peering en el TGW de {region}")
+    
+    try:
+        wait_each(sides, ready_sides, add_route, 'el peering y las tablas de rutas TGW', timeout=300)
         print("Rutas TGW configuradas")
         
     except Exception as e:
@@ -363,16 +378,16 @@ def configure_tgw_routes(tgw_east_id, tgw_west_id, peering_id):
 
 def configure_vpc_routes(region, vpc_resources, tgw_id, vpc_configs):
     """Configura rutas en las VPCs hacia el Transit Gateway"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n--- Configurando rutas VPC en {region} ---")
     
-    print("Esperando propagación de attachments...")
-    time.sleep(30)
+    vpc_names = {resource['vpc_id']: vpc_configs[i]['name'] for i, resource in enumerate(vpc_resources)}
+    resources_by_vpc = {resource['vpc_id']: resource for resource in vpc_resources}
     
-    for i, resource in enumerate(vpc_resources):
-        rt_id = resource['route_table_id']
-        current_vpc_name = vpc_configs[i]['name']
+    def add_routes(vpc_id):
+        rt_id = resources_by_vpc[vpc_id]['route_table_id']
+        current_vpc_name = vpc_names[vpc_id]
         
         print(f"Configurando rutas para {current_vpc_name}...")
         
@@ -405,9 +420,30 @@ def configure_vpc_routes(region, vpc_resources, tgw_id, vpc_configs):
                     print(f"  Ruta Local a {neighbor_name} ({neighbor_cidr}) -> TGW configurada")
                 except Exception as e:
                     if "RouteAlreadyExists" not in str(e): print(f"  Error ruta local: {e}")
-        time.sleep(5)
+    
+    # Las rutas de cada VPC se crean en cuanto su attachment está disponible
+    # y su subred asociada a la tabla de rutas
+    print("Esperando attachments y asociaciones de tablas de rutas...")
+    wait_each(
+        vpc_names,
+        lambda pending: vpcs_ready_for_tgw_routes(ec2, tgw_id, [resources_by_vpc[v] for v in pending]),
+        add_routes,
+        f'los attachments de {region}',
+        timeout=300
+    )
+
+def deploy_region(region, vpc_configs, asn, tgw_name):
+    """Pipeline completo de una región: VPCs y TGW (en paralelo) y después attachments"""
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        vpcs_future = pool.submit(create_vpc_infrastructure, region, vpc_configs)
+        tgw_future = pool.submit(create_transit_gateway, region, asn, tgw_name)
+        resources = vpcs_future.result()
+        tgw_id = tgw_future.result()
+    
+    attachments = attach_vpcs_to_tgw(region, tgw_id, resources)
+    return resources, tgw_id, attachments
 
-def main():
+def main(parallel=False):
     print("=== Iniciando despliegue de infraestructura Transit Gateway ===")
     
     # Configuraciones de VPCs
@@ -420,26 +456,49 @@ def main():
         {'name': 'VPC-West-1', 'vpc_cidr': '192.168.0.0/16', 'subnet_cidr': '192.168.1.0/24'}
     ]
     
+    # Plan de CIDRs comprobado antes de cualquier llamada a AWS
+    if not validate_topology(topology_from_configs(east_configs + west_configs)):
+        return
+    
     try:
-        # 1. Crear VPCs en ambas regiones
-        east_resources = create_vpc_infrastructure('us-east-1', east_configs)
-        west_resources = create_vpc_infrastructure('us-west-2', west_configs)
-        
-        # 2. Crear Transit Gateways
-        tgw_east_id = create_transit_gateway('us-east-1', 64512, 'TGW-East')
-        tgw_west_id = create_transit_gateway('us-west-2', 64513, 'TGW-West')
-        
-        # 3. Conectar VPCs a TGWs
-        attach_vpcs_to_tgw('us-east-1', tgw_east_id, east_resources)
-        attach_vpcs_to_tgw('us-west-2', tgw_west_id, west_resources)
+        if parallel:
+            # 1-3. Pipelines de cada región en paralelo; solo se unen en el peering
+            with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+                east_future = pool.submit(deploy_region, 'us-east-1', east_configs, 64512, 'TGW-East')
+                west_future = pool.submit(deploy_region, 'us-west-2', west_configs, 64513, 'TGW-West')
+                east_resources, tgw_east_id, _ = east_future.result()
+                west_resources, tgw_west_id, _ = west_future.result()
+        else:
+            # 1. Crear VPCs en ambas regiones
+            east_resources = create_vpc_infrastructure('us-east-1', east_configs)
+            west_resources = create_vpc_infrastructure('us-west-2', west_configs)
+            
+            # 2. Crear Transit Gateways
+            tgw_east_id = create_transit_gateway('us-east-1', 64512, 'TGW-East')
+            tgw_west_id = create_transit_gateway('us-west-2', 64513, 'TGW-West')
+            
+            # 3. Conectar VPCs a TGWs
+            attach_vpcs_to_tgw('us-east-1', tgw_east_id, east_resources)
+            attach_vpcs_to_tgw('us-west-2', tgw_west_id, west_resources)
         
-        # 4. Crear peering entre TGWs
+        # 4. Crear peering entre TGWs (necesita ambas regiones)
         peering_id = create_tgw_peering(tgw_east_id, tgw_west_id)
         
         # 5. Configurar rutas
-        configure_tgw_routes(tgw_east_id, tgw_west_id, peering_id)
-        configure_vpc_routes('us-east-1', east_resources, tgw_east_id, east_configs)
-        configure_vpc_routes('us-west-2', west_resources, tgw_west_id, west_configs)
+        if parallel:
+            # Las rutas de cada TGW y de cada región son independientes entre sí
+            with concurrent.futures.ThreadPoolExecutor(max_workers=3) as pool:
+                futures = [
+                    pool.submit(configure_tgw_routes, tgw_east_id, tgw_west_id, peering_id),
+                    pool.submit(configure_vpc_routes, 'us-east-1', east_resources, tgw_east_id, east_configs),
+                    pool.submit(configure_vpc_routes, 'us-west-2', west_resources, tgw_west_id, west_configs)
+                ]
+                for future in futures:
+                    future.result()
+        else:
+            configure_tgw_routes(tgw_east_id, tgw_west_id, peering_id)
+            configure_vpc_routes('us-east-1', east_resources, tgw_east_id, east_configs)
+            configure_vpc_routes('us-west-2', west_resources, tgw_west_id, west_configs)
         
         print("\n=== RESUMEN DE RECURSOS CREADOS ===")
         print(f"TGW East: {tgw_east_id}")
@@ -455,10 +514,20 @@ def main():
             print(f"  {west_configs[i]['name']}: {resource['vpc_id']}")
         
         print("\n✅ Infraestructura Transit Gateway creada exitosamente!")
-        print("🔗 Conectividad entre todas las VPCs habilitada")
+        
+        # Conectividad comprobada sobre las tablas de rutas reales (prefijo más largo)
+        print("\n🔍 Comprobando la conectividad entre VPCs...")
+        vpc_ids = [resource['vpc_id'] for resource in east_resources + west_resources]
+        if verify_mesh(['us-east-1', 'us-west-2'], vpc_ids):
+            print("🔗 Conectividad entre todas las VPCs verificada")
         
     except Exception as e:
         print(f"❌ Error: {e}")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Despliegue Transit Gateway multi-región")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Ejecuta el pipeline de cada región en paralelo (se unen en el peering)")
+    args = parser.parse_args()
+    
+    main(parallel=args.parallel)
\ No newline at end of file
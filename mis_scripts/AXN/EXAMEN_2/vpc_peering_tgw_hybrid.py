@@ -1,65 +1,62 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import os
+import sys
 
-def get_ubuntu_ami(ec2_client):
-    """Obtiene la AMI más reciente de Ubuntu 22.04 LTS"""
-    response = ec2_client.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-id', 'Values': ['099720109477']},
-            {'Name': 'state', 'Values': ['available']}
-        ]
-    )
-    images = sorted(response['Images'], key=lambda x: x['CreationDate'], reverse=True)
-    return images[0]['ImageId']
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils import instrumentation
+from aws_utils.ami import get_ubuntu_ami
+from aws_utils.clients import get_client
+from aws_utils.dag import DagExecutor
+from aws_utils.poller import shared_poller
+from aws_utils.reachability import verify_mesh
+from aws_utils.readiness import tgw_route_table_ready, wait_until
 
-def create_vpc_infrastructure(region, vpc_configs):
-    """Crea VPCs, subredes, IGW e instancias EC2 en una región"""
-    ec2 = boto3.client('ec2', region_name=region)
-    
-    print(f"\n=== Creando VPCs en {region} ===")
-    
-    ubuntu_ami = get_ubuntu_ami(ec2)
-    created_resources = []
+# Métricas opcionales con AWS_UTILS_METRICS=1
+instrumentation.enable_from_env()
+
+def add_vpc_nodes(dag, ec2, config):
+    """Añade al grafo los nodos de una VPC (VPC, IGW, subred, rutas, SG e instancia)"""
+    vpc_name = config['name']
+    vpc_cidr = config['vpc_cidr']
+    subnet_cidr = config['subnet_cidr']
     
-    for config in vpc_configs:
-        vpc_name = config['name']
-        vpc_cidr = config['vpc_cidr']
-        subnet_cidr = config['subnet_cidr']
-        
+    def create_vpc():
         print(f"\n--- Creando {vpc_name} ---")
-        
-        # Crear VPC
         vpc_response = ec2.create_vpc(CidrBlock=vpc_cidr)
         vpc_id = vpc_response['Vpc']['VpcId']
         ec2.create_tags(Resources=[vpc_id], Tags=[{'Key': 'Name', 'Value': vpc_name}])
-        
-        # Habilitar DNS
+        return vpc_id
+    
+    def enable_dns_hostnames(vpc_id):
         ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
+    
+    def enable_dns_support(vpc_id):
         ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={'Value': True})
-        
-        # Crear Internet Gateway
+    
+    def create_igw():
         igw_response = ec2.create_internet_gateway()
         igw_id = igw_response['InternetGateway']['InternetGatewayId']
-        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
         ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': f'IGW-{vpc_name}'}])
-        
-        # Crear subred pública
-        azs = ec2.describe_availability_zones(Filters=[{'Name': 'state', 'Values': ['available']}])
-        az = azs['AvailabilityZones'][0]['ZoneName']
-        
+        return igw_id
+    
+    def attach_igw(vpc_id, igw_id):
+        ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
+    
+    def create_subnet(vpc_id, az):
         subnet_response = ec2.create_subnet(VpcId=vpc_id, CidrBlock=subnet_cidr, AvailabilityZone=az)
         subnet_id = subnet_response['Subnet']['SubnetId']
         ec2.create_tags(Resources=[subnet_id], Tags=[{'Key': 'Name', 'Value': f'Subnet-{vpc_name}'}])
         ec2.modify_subnet_attribute(SubnetId=subnet_id, MapPublicIpOnLaunch={'Value': True})
-        
-        # Configurar tabla de rutas
+        return subnet_id
+    
+    def get_main_route_table(vpc_id):
         route_tables = ec2.describe_route_tables(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-        main_rt_id = route_tables['RouteTables'][0]['RouteTableId']
+        return route_tables['RouteTables'][0]['RouteTableId']
+    
+    def create_default_route(main_rt_id, igw_id, _attached):
         ec2.create_route(RouteTableId=main_rt_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
-        
-        # Crear Security Group
+    
+    def create_sg(vpc_id):
         sg_response = ec2.create_security_group(
             GroupName=f'SG-{vpc_name}',
             Description=f'Security group for {vpc_name}',
@@ -67,8 +64,9 @@ def create_vpc_infrastructure(region, vpc_configs):
         )
         sg_id = sg_response['GroupId']
         ec2.create_tags(Resources=[sg_id], Tags=[{'Key': 'Name', 'Value': f'SG-{vpc_name}'}])
-        
-        # Reglas de seguridad
+        return sg_id
+    
+    def authorize_sg(sg_id):
         ec2.authorize_security_group_ingress(
             GroupId=sg_id,
             IpPermissions=[
@@ -76,8 +74,8 @@ def create_vpc_infrastructure(region, vpc_configs):
                 {'IpProtocol': 'icmp', 'FromPort': -1, 'ToPort': -1, 'IpRanges': [{'CidrIp': '0.0.0.0/0'}]}
             ]
         )
-        
-        # Crear instancia EC2
+    
+    def run_instance(ubuntu_ami, subnet_id, sg_id, _rules):
         print(f"Creando instancia en {vpc_name}...")
         instance_response = ec2.run_instances(
             ImageId=ubuntu_ami,
@@ -91,27 +89,58 @@ def create_vpc_infrastructure(region, vpc_configs):
                 'Tags': [{'Key': 'Name', 'Value': f'Instance-{vpc_name}'}]
             }]
         )
-        instance_id = instance_response['Instances'][0]['InstanceId']
-        
-        print(f"VPC: {vpc_id}, Subnet: {subnet_id}, Instance: {instance_id}")
-        
-        created_resources.append({
-            'vpc_id': vpc_id,
-            'subnet_id': subnet_id,
-            'instance_id': instance_id,
-            'igw_id': igw_id,
-            'sg_id': sg_id,
-            'route_table_id': main_rt_id,
-            'vpc_cidr': vpc_cidr
-        })
-        
-        time.sleep(10)
+        return instance_response['Instances'][0]['InstanceId']
+    
+    # Cada nodo declara solo sus dependencias reales
+    vpc = dag.add(f'{vpc_name}:vpc', create_vpc)
+    dag.add(f'{vpc_name}:dns_hostnames', enable_dns_hostnames, [vpc])
+    dag.add(f'{vpc_name}:dns_support', enable_dns_support, [vpc])
+    igw = dag.add(f'{vpc_name}:igw', create_igw)
+    attached = dag.add(f'{vpc_name}:igw_attach', attach_igw, [vpc, igw])
+    subnet = dag.add(f'{vpc_name}:subnet', create_subnet, [vpc, 'az'])
+    rt = dag.add(f'{vpc_name}:route_table', get_main_route_table, [vpc])
+    dag.add(f'{vpc_name}:default_route', create_default_route, [rt, igw, attached])
+    sg = dag.add(f'{vpc_name}:sg', create_sg, [vpc])
+    rules = dag.add(f'{vpc_name}:sg_rules', authorize_sg, [sg])
+    dag.add(f'{vpc_name}:instance', run_instance, ['ami', subnet, sg, rules])
+
+def create_vpc_infrastructure(region, vpc_configs, max_workers=8):
+    """Crea VPCs, subredes, IGW e instancias EC2 en una región"""
+    ec2 = get_client('ec2', region)
+    
+    print(f"\n=== Creando VPCs en {region} ===")
+    
+    # Grafo de dependencias: los recursos independientes se crean en paralelo
+    dag = DagExecutor(max_workers=max_workers)
+    dag.add('ami', lambda: get_ubuntu_ami(ec2))
+    dag.add('az', lambda: ec2.describe_availability_zones(
+        Filters=[{'Name': 'state', 'Values': ['available']}]
+    )['AvailabilityZones'][0]['ZoneName'])
+    for config in vpc_configs:
+        add_vpc_nodes(dag, ec2, config)
+    
+    results = dag.run()
+    
+    created_resources = []
+    for config in vpc_configs:
+        vpc_name = config['name']
+        resource = {
+            'vpc_id': results[f'{vpc_name}:vpc'],
+            'subnet_id': results[f'{vpc_name}:subnet'],
+            'instance_id': results[f'{vpc_name}:instance'],
+            'igw_id': results[f'{vpc_name}:igw'],
+            'sg_id': results[f'{vpc_name}:sg'],
+            'route_table_id': results[f'{vpc_name}:route_table'],
+            'vpc_cidr': config['vpc_cidr']
+        }
+        print(f"{vpc_name} -> VPC: {resource['vpc_id']}, Subnet: {resource['subnet_id']}, Instance: {resource['instance_id']}")
+        created_resources.append(resource)
     
     return created_resources
 
 def create_transit_gateway(region):
     """Crea Transit Gateway en Región 1"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n--- Creando Transit Gateway en {region} ---")
     
@@ -127,19 +156,14 @@ def create_transit_gateway(region):
     
     # Esperar a que esté disponible
     print(f"Esperando que TGW {tgw_id} esté disponible...")
-    while True:
-        response = ec2.describe_transit_gateways(TransitGatewayIds=[tgw_id])
-        state = response['TransitGateways'][0]['State']
-        if state == 'available':
-            break
-        time.sleep(10)
+    shared_poller(ec2, 'transit_gateway').wait([tgw_id], ['available'], failed_states=['deleted'])
     
     print(f"Transit Gateway creado: {tgw_id}")
     return tgw_id
 
 def attach_vpcs_to_tgw(region, tgw_id, vpc_resources):
     """Conecta las 2 VPCs de Región 1 al Transit Gateway"""
-    ec2 = boto3.client('ec2', region_name=region)
+    ec2 = get_client('ec2', region)
     
     print(f"\n--- Conectando VPCs al TGW en {region} ---")
     
@@ -164,20 +188,17 @@ def attach_vpcs_to_tgw(region, tgw_id, vpc_resources):
     
     # Esperar a que los attachments estén disponibles
     print("Esperando que los attachments estén disponibles...")
-    for attachment_id in attachments:
-        while True:
-            response = ec2.describe_transit_gateway_vpc_attachments(TransitGatewayAttachmentIds=[attachment_id])
-            state = response['TransitGatewayVpcAttachments'][0]['State']
-            if state == 'available':
-                break
-            time.sleep(10)
+    # Un único describe por tick para todos los attachments pendientes
+    shared_poller(ec2, 'tgw_vpc_attachment').wait(
+        attachments, ['available'], failed_states=['failed', 'rejected']
+    )
     
     return attachments
 
 def create_vpc_peering_connections(region1_resources, region2_resources):
     """Crea VPC Peering entre cada VPC de Región 1 y la VPC de Región 2"""
-    ec2_region1 = boto3.client('ec2', region_name='us-east-1')
-    ec2_region2 = boto3.client('ec2', region_name='us-west-2')
+    ec2_region1 = get_client('ec2', 'us-east-1')
+    ec2_region2 = get_client('ec2', 'us-west-2')
     
     print("\n--- Creando VPC Peering Connections ---")
     
@@ -199,51 +220,50 @@ def create_vpc_peering_connections(region1_resources, region2_resources):
         )
         peering_id = peering_response['VpcPeeringConnection']['VpcPeeringConnectionId']
         
-        # Esperar a que esté en estado pendingAcceptance
-        while True:
-            response = ec2_region1.describe_vpc_peering_connections(VpcPeeringConnectionIds=[peering_id])
-            state = response['VpcPeeringConnections'][0]['Status']['Code']
-            if state == 'pending-acceptance':
-                break
-            time.sleep(5)
-        
-        # Aceptar desde región 2
-        print(f"Aceptando peering {peering_id} desde región 2...")
-        ec2_region2.accept_vpc_peering_connection(VpcPeeringConnectionId=peering_id)
-        
-        # Esperar a que esté activo
-        while True:
-            response = ec2_region1.describe_vpc_peering_connections(VpcPeeringConnectionIds=[peering_id])
-            state = response['VpcPeeringConnections'][0]['Status']['Code']
-            if state == 'active':
-                break
-            time.sleep(10)
-        
         peering_connections.append({
             'peering_id': peering_id,
             'region1_vpc': region1_vpc,
             'region2_vpc': region2_vpc
         })
-        
+    
+    peering_ids = [peering['peering_id'] for peering in peering_connections]
+    peering_poller = shared_poller(ec2_region1, 'vpc_peering')
+    
+    # Esperar a que todos estén en estado pendingAcceptance (un describe por tick)
+    peering_poller.wait(peering_ids, ['pending-acceptance'], failed_states=['failed', 'rejected', 'expired'])
+    
+    # Aceptar desde región 2
+    for peering_id in peering_ids:
+        print(f"Aceptando peering {peering_id} desde región 2...")
+        ec2_region2.accept_vpc_peering_connection(VpcPeeringConnectionId=peering_id)
+    
+    # Esperar a que estén activos
+    peering_poller.wait(peering_ids, ['active'], failed_states=['failed', 'rejected', 'expired'])
+    for peering_id in peering_ids:
         print(f"Peering {peering_id} activo")
     
     return peering_connections
 
 def configure_tgw_routes(tgw_id, region1_resources):
     """Configura rutas en el Transit Gateway para comunicación entre VPCs locales"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = get_client('ec2', 'us-east-1')
     
     print("\n--- Configurando rutas TGW ---")
     
-    # Las rutas se propagan automáticamente entre las VPCs conectadas al TGW
-    # Solo necesitamos esperar a que se propaguen
-    time.sleep(30)
-    print("Rutas TGW configuradas automáticamente")
+    # Las rutas se propagan automáticamente entre las VPCs conectadas al TGW:
+    # basta con que sus attachments estén asociados a la tabla de rutas por defecto
+    vpc_ids = [resource['vpc_id'] for resource in region1_resources]
+    route_table_id = wait_until(
+        lambda: tgw_route_table_ready(ec2, tgw_id, vpc_ids),
+        'las asociaciones de la tabla de rutas del TGW',
+        timeout=300
+    )
+    print(f"Rutas TGW configuradas automáticamente ({route_table_id})")
 
 def configure_peering_routes(peering_connections):
     """Configura rutas para VPC Peering"""
-    ec2_region1 = boto3.client('ec2', region_name='us-east-1')
-    ec2_region2 = boto3.client('ec2', region_name='us-west-2')
+    ec2_region1 = get_client('ec2', 'us-east-1')
+    ec2_region2 = get_client('ec2', 'us-west-2')
     
     print("\n--- Configurando rutas VPC Peering ---")
     
@@ -327,6 +347,12 @@ def main():
         print("   - VPCs en Región 1 conectadas via Transit Gateway")
         print("   - VPC en Región 2 conectada a cada VPC de Región 1 via VPC Peering")
         
+        # Conectividad comprobada sobre las tablas de rutas reales (prefijo más largo)
+        print("\n🔍 Comprobando la conectividad entre VPCs...")
+        vpc_ids = [resource['vpc_id'] for resource in region1_resources + region2_resources]
+        if verify_mesh(['us-east-1', 'us-west-2'], vpc_ids):
+            print("🔗 Todas las VPCs se alcanzan entre sí")
+        
     except Exception as e:
         print(f"❌ Error: {e}")
 
@@ -1,15 +1,56 @@
 #!/usr/bin/env python3
-import boto3
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.ami import get_ubuntu_ami
+from aws_utils.clients import get_client
+from aws_utils.coalescing import CoalescingClient
+from aws_utils.journal import Journal
+from aws_utils.nacl import CompiledNacl, evaluate_flow, print_flow
+
+# Diario de pasos completados, para poder reanudar con --resume
+JOURNAL_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.journal.sqlite'
+
+# Reglas de la NACL de Subred-App (mismo formato que create_network_acl_entry)
+_SSH_ENTRADA = dict(RuleNumber=100, Protocol='6', RuleAction='allow',  # SSH (puerto 22)
+                    PortRange={'From': 22, 'To': 22}, CidrBlock='0.0.0.0/0', Egress=False)
+_ICMP_ENTRADA = dict(RuleNumber=110, Protocol='1', RuleAction='allow',  # ICMP (para recibir ping)
+                     IcmpTypeCode={'Type': -1, 'Code': -1}, CidrBlock='0.0.0.0/0', Egress=False)
+_EFIMEROS_SALIDA = dict(RuleNumber=100, Protocol='6', RuleAction='allow',  # Respuestas SSH (1024-65535)
+                        PortRange={'From': 1024, 'To': 65535}, CidrBlock='0.0.0.0/0', Egress=True)
+_ICMP_SALIDA = dict(RuleNumber=110, Protocol='1', RuleAction='allow',  # ICMP de salida
+                    IcmpTypeCode={'Type': -1, 'Code': -1}, CidrBlock='0.0.0.0/0', Egress=True)
+NACL_PRUEBA_ENTRIES = [_SSH_ENTRADA, _ICMP_ENTRADA, _EFIMEROS_SALIDA, _ICMP_SALIDA]
+# *** SIN REGLA ICMP DE SALIDA: las respuestas al ping se bloquean (stateless) ***
+NACL_FALLO_PING_ENTRIES = [_SSH_ENTRADA, _ICMP_ENTRADA, _EFIMEROS_SALIDA]
+
+# Flujos desde Internet hacia una instancia de Subred-App (10.0.2.0/24)
+FLUJOS_SUBRED_APP = [
+    ('ping desde Internet', {'protocol': 'icmp', 'source': '203.0.113.10', 'destination': '10.0.2.10'}),
+    ('SSH desde Internet', {'protocol': 'tcp', 'source': '203.0.113.10', 'destination': '10.0.2.10', 'port': 22}),
+]
+
+def simular_nacl(nombre, entries):
+    """Evalúa los flujos de prueba contra la NACL antes de crearla (sin desplegar ni hacer ping)"""
+    nacl = CompiledNacl(entries, nombre)
+    print(f"Simulación de {nombre} (ida y vuelta, stateless):")
+    for descripcion, flow in FLUJOS_SUBRED_APP:
+        print_flow(descripcion, evaluate_flow(flow, destination_nacl=nacl))
 
 def ejercicio1_crear_vpc():
     """Ejercicio 1: Crear VPC con configuración básica"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 1: Creando VPC ===")
     
     # Crear VPC con CIDR 10.0.0.0/16
     print("Creando VPC...")
-    vpc_response = ec2.create_vpc(CidrBlock='10.0.0.0/16')
+    vpc_response = ec2.create_vpc(
+        CidrBlock='10.0.0.0/16',
+        Tags=[{'Key': 'Name', 'Value': 'Examen-VPC-Ricardo'}]
+    )
     vpc_id = vpc_response['Vpc']['VpcId']
     print(f"VPC creada con ID: {vpc_id}")
     
@@ -20,52 +61,43 @@ def ejercicio1_crear_vpc():
     print("Habilitando DNS Hostnames...")
     ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsHostnames={'Value': True})
     
-    # Etiquetar VPC
-    print("Etiquetando VPC...")
-    ec2.create_tags(
-        Resources=[vpc_id],
-        Tags=[{'Key': 'Name', 'Value': 'Examen-VPC-Ricardo'}]
-    )
-    
     print(f"✅ VPC creada exitosamente: {vpc_id}\n")
     return vpc_id
 
 def ejercicio2_crear_infraestructura(vpc_id):
     """Ejercicio 2: Crear subredes, IGW y configurar enrutamiento"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 2: Creando infraestructura de red ===")
     
     # Crear Subredes
     print("Creando Subred-Publica...")
     subnet_publica_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.1.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock='10.0.1.0/24', AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-Publica'}]
     )
     subnet_publica_id = subnet_publica_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_publica_id], Tags=[{'Key': 'Name', 'Value': 'Subred-Publica'}])
     print(f"Subred-Publica creada: {subnet_publica_id}")
     
     print("Creando Subred-App...")
     subnet_app_response = ec2.create_subnet(
-        VpcId=vpc_id, CidrBlock='10.0.2.0/24', AvailabilityZone='us-east-1a'
+        VpcId=vpc_id, CidrBlock='10.0.2.0/24', AvailabilityZone='us-east-1a',
+        Tags=[{'Key': 'Name', 'Value': 'Subred-App'}]
     )
     subnet_app_id = subnet_app_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet_app_id], Tags=[{'Key': 'Name', 'Value': 'Subred-App'}])
     print(f"Subred-App creada: {subnet_app_id}")
     
     # Crear Internet Gateway
     print("Creando Internet Gateway...")
-    igw_response = ec2.create_internet_gateway()
+    igw_response = ec2.create_internet_gateway(Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     igw_id = igw_response['InternetGateway']['InternetGatewayId']
-    ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': 'Examen-IGW'}])
     ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
     print(f"Internet Gateway creado y adjuntado: {igw_id}")
     
     # Configurar Enrutamiento
     print("Configurando enrutamiento...")
-    route_table_response = ec2.create_route_table(VpcId=vpc_id)
+    route_table_response = ec2.create_route_table(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'RT-Subred-Publica'}])
     route_table_id = route_table_response['RouteTable']['RouteTableId']
-    ec2.create_tags(Resources=[route_table_id], Tags=[{'Key': 'Name', 'Value': 'RT-Subred-Publica'}])
     ec2.create_route(RouteTableId=route_table_id, DestinationCidrBlock='0.0.0.0/0', GatewayId=igw_id)
     ec2.associate_route_table(RouteTableId=route_table_id, SubnetId=subnet_publica_id)
     print(f"Tabla de enrutamiento creada y asociada: {route_table_id}")
@@ -80,7 +112,7 @@ def ejercicio2_crear_infraestructura(vpc_id):
 
 def ejercicio3_crear_instancias(vpc_id, subnet_publica_id, subnet_app_id):
     """Ejercicio 3: Crear grupos de seguridad e instancias EC2"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 3: Creando grupos de seguridad e instancias ===")
     
@@ -89,10 +121,10 @@ def ejercicio3_crear_instancias(vpc_id, subnet_publica_id, subnet_app_id):
     sg_bastion_response = ec2.create_security_group(
         GroupName='GS-Bastion',
         Description='Security Group para Bastion Host',
-        VpcId=vpc_id
+        VpcId=vpc_id,
+        Tags=[{'Key': 'Name', 'Value': 'GS-Bastion'}]
     )
     sg_bastion_id = sg_bastion_response['GroupId']
-    ec2.create_tags(Resources=[sg_bastion_id], Tags=[{'Key': 'Name', 'Value': 'GS-Bastion'}])
     
     # Regla SSH para GS-Bastion
     ec2.authorize_security_group_ingress(
@@ -111,10 +143,10 @@ def ejercicio3_crear_instancias(vpc_id, subnet_publica_id, subnet_app_id):
     sg_app_response = ec2.create_security_group(
         GroupName='GS-App',
         Description='Security Group para App Server',
-        VpcId=vpc_id
+        VpcId=vpc_id,
+        Tags=[{'Key': 'Name', 'Value': 'GS-App'}]
     )
     sg_app_id = sg_app_response['GroupId']
-    ec2.create_tags(Resources=[sg_app_id], Tags=[{'Key': 'Name', 'Value': 'GS-App'}])
     
     # Reglas para GS-App (SSH y ICMP desde GS-Bastion)
     ec2.authorize_security_group_ingress(
@@ -138,14 +170,7 @@ def ejercicio3_crear_instancias(vpc_id, subnet_publica_id, subnet_app_id):
     
     # Obtener AMI de Ubuntu
     print("Obteniendo AMI de Ubuntu...")
-    images = ec2.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
-            {'Name': 'owner-id', 'Values': ['099720109477']}
-        ],
-        Owners=['099720109477']
-    )
-    ami_id = sorted(images['Images'], key=lambda x: x['CreationDate'], reverse=True)[0]['ImageId']
+    ami_id = get_ubuntu_ami(ec2)
     
     # Lanzar instancia Bastion-Host
     print("Lanzando instancia Bastion-Host...")
@@ -197,7 +222,7 @@ def ejercicio3_crear_instancias(vpc_id, subnet_publica_id, subnet_app_id):
 
 def ejercicio4_crear_nat_gateway(vpc_id, subnet_publica_id, subnet_app_id):
     """Ejercicio 4: Implementación de NAT Gateway para Salida Privada"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 4: Implementación de NAT Gateway para Salida Privada ===")
     
@@ -217,12 +242,12 @@ def ejercicio4_crear_nat_gateway(vpc_id, subnet_publica_id, subnet_app_id):
     print("Creando NAT Gateway...")
     nat_gw_response = ec2.create_nat_gateway(
         SubnetId=subnet_publica_id,
-        AllocationId=elastic_ip_alloc
+        AllocationId=elastic_ip_alloc,
+        Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}]
     )
     nat_gw_id = nat_gw_response['NatGateway']['NatGatewayId']
     
     # Etiquetar NAT Gateway
-    ec2.create_tags(Resources=[nat_gw_id], Tags=[{'Key': 'Name', 'Value': 'Examen-NAT-GW'}])
     print(f"NAT Gateway creado: {nat_gw_id}")
     
     # Esperar a que el NAT Gateway esté disponible
@@ -268,15 +293,15 @@ def ejercicio4_crear_nat_gateway(vpc_id, subnet_publica_id, subnet_app_id):
 
 def ejercicio5_configurar_nacl_fallo_ping(vpc_id, subnet_app_id):
     """Ejercicio 5 ALTERNATIVO: NACL que bloquea respuestas ICMP para demostrar comportamiento stateless"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 5: Configurando Network ACL (FALLO PING) ===")
+    simular_nacl('NACL-Fallo-Ping', NACL_FALLO_PING_ENTRIES)
     
     # Crear Network ACL
     print("Creando Network ACL...")
-    nacl_response = ec2.create_network_acl(VpcId=vpc_id)
+    nacl_response = ec2.create_network_acl(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'NACL-Fallo-Ping'}])
     nacl_id = nacl_response['NetworkAcl']['NetworkAclId']
-    ec2.create_tags(Resources=[nacl_id], Tags=[{'Key': 'Name', 'Value': 'NACL-Fallo-Ping'}])
     print(f"Network ACL creada: {nacl_id}")
     
     # Asociar NACL a Subred-App
@@ -290,45 +315,10 @@ def ejercicio5_configurar_nacl_fallo_ping(vpc_id, subnet_app_id):
     )
     print("NACL asociada a Subred-App")
     
-    # Reglas de entrada (Inbound) - PERMITIR TODO
-    print("Configurando reglas de entrada...")
-    # SSH (puerto 22)
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=100,
-        Protocol='6',  # TCP
-        RuleAction='allow',
-        PortRange={'From': 22, 'To': 22},
-        CidrBlock='0.0.0.0/0',
-        Egress=False
-    )
-    
-    # ICMP de entrada - PERMITIR (para recibir ping)
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=110,
-        Protocol='1',  # ICMP
-        RuleAction='allow',
-        IcmpTypeCode={'Type': -1, 'Code': -1},
-        CidrBlock='0.0.0.0/0',
-        Egress=False
-    )
-    
-    # Reglas de salida (Outbound) - BLOQUEAR ICMP
-    print("Configurando reglas de salida (SIN ICMP)...")
-    # Puertos efímeros para respuestas SSH (1024-65535) - PERMITIR
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=100,
-        Protocol='6',  # TCP
-        RuleAction='allow',
-        PortRange={'From': 1024, 'To': 65535},
-        CidrBlock='0.0.0.0/0',
-        Egress=True
-    )
-    
-    # *** NO AÑADIR REGLA ICMP DE SALIDA - ESTO CAUSA EL FALLO ***
-    # Las respuestas ICMP serán bloqueadas, demostrando el comportamiento stateless
+    # Reglas de entrada (SSH e ICMP) y de salida SIN ICMP: esto causa el fallo
+    print("Configurando reglas de entrada y salida (SIN ICMP de salida)...")
+    for entry in NACL_FALLO_PING_ENTRIES:
+        ec2.create_network_acl_entry(NetworkAclId=nacl_id, **entry)
     
     print("⚠️  Network ACL configurada SIN reglas ICMP de salida")
     print("⚠️  El ping FALLARÁ porque las respuestas ICMP están bloqueadas")
@@ -338,15 +328,15 @@ def ejercicio5_configurar_nacl_fallo_ping(vpc_id, subnet_app_id):
 
 def ejercicio5_configurar_nacl(vpc_id, subnet_app_id):
     """Ejercicio 4: Crear y configurar Network ACL"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
     
     print("=== EJERCICIO 5: Configurando Network ACL ===")
+    simular_nacl('NACL-Prueba', NACL_PRUEBA_ENTRIES)
     
     # Crear Network ACL
     print("Creando Network ACL...")
-    nacl_response = ec2.create_network_acl(VpcId=vpc_id)
+    nacl_response = ec2.create_network_acl(VpcId=vpc_id, Tags=[{'Key': 'Name', 'Value': 'NACL-Prueba'}])
     nacl_id = nacl_response['NetworkAcl']['NetworkAclId']
-    ec2.create_tags(Resources=[nacl_id], Tags=[{'Key': 'Name', 'Value': 'NACL-Prueba'}])
     print(f"Network ACL creada: {nacl_id}")
     
     # Asociar NACL a Subred-App
@@ -362,62 +352,22 @@ def ejercicio5_configurar_nacl(vpc_id, subnet_app_id):
     )
     print("NACL asociada a Subred-App")
     
-    # Reglas de entrada (Inbound)
-    print("Configurando reglas de entrada...")
-    # SSH (puerto 22)
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=100,
-        Protocol='6',  # TCP
-        RuleAction='allow',
-        PortRange={'From': 22, 'To': 22},
-        CidrBlock='0.0.0.0/0',
-        Egress=False
-    )
-    
-    # ICMP
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=110,
-        Protocol='1',  # ICMP
-        RuleAction='allow',
-        IcmpTypeCode={'Type': -1, 'Code': -1},
-        CidrBlock='0.0.0.0/0',
-        Egress=False
-    )
-    
-    # Reglas de salida (Outbound)
-    print("Configurando reglas de salida...")
-    # Puertos efímeros para respuestas SSH (1024-65535)
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=100,
-        Protocol='6',  # TCP
-        RuleAction='allow',
-        PortRange={'From': 1024, 'To': 65535},
-        CidrBlock='0.0.0.0/0',
-        Egress=True
-    )
-    
-    # ICMP de salida
-    ec2.create_network_acl_entry(
-        NetworkAclId=nacl_id,
-        RuleNumber=110,
-        Protocol='1',  # ICMP
-        RuleAction='allow',
-        IcmpTypeCode={'Type': -1, 'Code': -1},
-        CidrBlock='0.0.0.0/0',
-        Egress=True
-    )
+    # Reglas de entrada (SSH, ICMP) y de salida (puertos efímeros, ICMP)
+    print("Configurando reglas de entrada y salida...")
+    for entry in NACL_PRUEBA_ENTRIES:
+        ec2.create_network_acl_entry(NetworkAclId=nacl_id, **entry)
     
     print(f"✅ Network ACL configurada exitosamente!")
     return {'nacl_id': nacl_id}
 
-def main():
+def main(resume=False, journal_path=JOURNAL_PATH):
+    journal = Journal(journal_path, resume=resume).attach()
+    
     # Ejecutar ejercicios
-    vpc_id = ejercicio1_crear_vpc()
-    recursos_red = ejercicio2_crear_infraestructura(vpc_id)
-    recursos_instancias = ejercicio3_crear_instancias(
+    vpc_id = journal.step('ejercicio1', ejercicio1_crear_vpc)
+    recursos_red = journal.step('ejercicio2', ejercicio2_crear_infraestructura, vpc_id)
+    recursos_instancias = journal.step(
+        'ejercicio3', ejercicio3_crear_instancias,
         vpc_id, 
         recursos_red['subnet_publica_id'], 
         recursos_red['subnet_app_id']
@@ -429,13 +379,14 @@ def main():
 #Conexion a instancia Bastion  ssh -A ubuntu@<IP_PUBLICA_BASTION>. 
 # Dentro del Bastión conexion a la instancia sin ip publica
 # ssh -A -i vockey.pem ubuntu@54.211.50.100
-    recursos_nat = ejercicio4_crear_nat_gateway(
+    recursos_nat = journal.step(
+        'ejercicio4', ejercicio4_crear_nat_gateway,
         vpc_id,
         recursos_red['subnet_publica_id'],
         recursos_red['subnet_app_id']
     )
     # Usar la función normal o la de fallo según se necesite
-    recursos_nacl = ejercicio5_configurar_nacl(vpc_id, recursos_red['subnet_app_id'])
+    recursos_nacl = journal.step('ejercicio5', ejercicio5_configurar_nacl, vpc_id, recursos_red['subnet_app_id'])
     # recursos_nacl = ejercicio5_configurar_nacl_fallo_ping(vpc_id, recursos_red['subnet_app_id'])  # Para demostrar fallo
 
 
@@ -487,5 +438,11 @@ def main():
     print("Nota: NACL-Prueba está asociada a Subred-App con reglas stateless para SSH e ICMP")
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description='Ejemplo examen 1: VPC con Bastion, App-Server, NAT y NACL')
+    parser.add_argument('--resume', action='store_true',
+                        help="Reanuda un despliegue fallido saltando los pasos ya completados")
+    parser.add_argument('--journal', metavar='RUTA', default=JOURNAL_PATH,
+                        help="Diario SQLite del despliegue (por defecto junto al script)")
+    args = parser.parse_args()
+    main(resume=args.resume, journal_path=args.journal)
 
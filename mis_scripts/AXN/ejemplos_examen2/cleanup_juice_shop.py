@@ -1,127 +1,180 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import argparse
+import concurrent.futures
+import os
+import sys
 
-def cleanup_juice_shop_infrastructure():
+from botocore.exceptions import ClientError
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.clients import get_client
+from aws_utils.dag import DagExecutor
+from aws_utils.inventory import find_resource, iter_resources
+from aws_utils.plan import load_or_collect, print_plan
+from aws_utils.reconcile import call_with_retry, current_state, delete_once, use_state
+from aws_utils.teardown import logged_step, plan_vpc_teardown, run_teardown, vpc_inventories
+
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
+
+def collect_inventory():
+    """Todo lo que hay que borrar, leído una sola vez (solo llamadas describe_*/list_*)"""
+    ec2 = get_client('ec2', 'us-east-1')
+    elbv2 = get_client('elbv2', 'us-east-1')
+    wafv2 = get_client('wafv2', 'us-east-1')
+
+    # Se deja de paginar en cuanto aparecen el ALB y la Web ACL
+    alb = find_resource(elbv2, 'describe_load_balancers', 'LoadBalancers',
+                        lambda lb: lb['LoadBalancerName'] == 'JuiceShop-ALB')
+    web_acl = find_resource(wafv2, 'list_web_acls', 'WebACLs',
+                            lambda acl: acl['Name'] == 'JuiceShop-WebACL', Scope='REGIONAL')
+    listeners = []
+    if alb:
+        listeners = list(iter_resources(elbv2, 'describe_listeners', 'Listeners',
+                                        LoadBalancerArn=alb['LoadBalancerArn']))
+    target_groups = [
+        tg for tg in iter_resources(elbv2, 'describe_target_groups', 'TargetGroups')
+        if tg['TargetGroupName'] == 'JuiceShop-TG'
+    ]
+    vpc_ids = [vpc['VpcId'] for vpc in iter_resources(
+        ec2, 'describe_vpcs', 'Vpcs', Filters=[{'Name': 'tag:Name', 'Values': ['JuiceShop-VPC']}]
+    )]
+    return {
+        'web_acl': web_acl,
+        'load_balancer': alb,
+        'listeners': listeners,
+        'target_groups': target_groups,
+        'vpcs': vpc_inventories(ec2, vpc_ids)
+    }
+
+def in_parallel(func, items):
+    """Aplica `func` a todos los elementos a la vez; devuelve sus resultados y propaga el primer error"""
+    if not items:
+        return []
+    with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(items), 8)) as pool:
+        return [future.result() for future in [pool.submit(func, item) for item in items]]
+
+def disassociate_web_acl(wafv2, alb):
+    if current_state().is_deleted(alb['LoadBalancerArn']):
+        return False
+    call_with_retry(wafv2.disassociate_web_acl, ResourceArn=alb['LoadBalancerArn'])
+    print("Web ACL desasociada del ALB")
+    return True
+
+def _delete_web_acl(wafv2, web_acl):
+    params = dict(Name=web_acl['Name'], Scope='REGIONAL', Id=web_acl['Id'])
+    try:
+        # El LockToken de list_web_acls sirve salvo que la ACL haya cambiado desde entonces
+        wafv2.delete_web_acl(LockToken=web_acl['LockToken'], **params)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'WAFOptimisticLockException':
+            raise
+        wafv2.delete_web_acl(LockToken=wafv2.get_web_acl(**params)['LockToken'], **params)
+
+def delete_web_acl(wafv2, web_acl):
+    if not delete_once(web_acl['ARN'], _delete_web_acl, wafv2, web_acl):
+        return False
+    print(f"Web ACL eliminada: {web_acl['ARN']}")
+    return True
+
+def delete_listeners(elbv2, listeners):
+    def delete(listener):
+        if not delete_once(listener['ListenerArn'], elbv2.delete_listener, ListenerArn=listener['ListenerArn']):
+            return False
+        print(f"Listener eliminado: {listener['ListenerArn']}")
+        return True
+    return any(in_parallel(delete, listeners))
+
+def delete_load_balancer(elbv2, alb):
+    alb_arn = alb['LoadBalancerArn']
+    if current_state().is_deleted(alb_arn):
+        return False
+    call_with_retry(elbv2.delete_load_balancer, LoadBalancerArn=alb_arn)
+    # Las ENIs del ALB siguen en las subredes hasta que termina de borrarse
+    elbv2.get_waiter('load_balancers_deleted').wait(LoadBalancerArns=[alb_arn])
+    current_state().mark_deleted(alb_arn)
+    print(f"ALB eliminado: {alb_arn}")
+    return True
+
+def delete_target_groups(elbv2, target_groups):
+    def delete(tg):
+        if not delete_once(tg['TargetGroupArn'], elbv2.delete_target_group, TargetGroupArn=tg['TargetGroupArn']):
+            return False
+        print(f"Target Group eliminado: {tg['TargetGroupArn']}")
+        return True
+    return any(in_parallel(delete, target_groups))
+
+def plan_juice_shop_teardown(inventory, ec2=None, elbv2=None, wafv2=None):
+    """Grafo de borrado (sin ejecutar).
+
+    La desasociación de la WAF va a la vez que el borrado de los listeners; los
+    Target Groups solo esperan a los listeners que los usan, y los SGs, subredes
+    e IGW de la VPC esperan a que el ALB (y sus ENIs) haya desaparecido.
+    """
+    dag = DagExecutor()
+
+    def node(name, description, func, *args, deps=()):
+        return dag.add(name, lambda *_: logged_step(description, func, *args), deps)
+
+    web_acl, alb = inventory['web_acl'], inventory['load_balancer']
+    disassociation = []
+    if web_acl and alb:
+        disassociation.append(node('waf_disassociation', 'asociación Web ACL', disassociate_web_acl, wafv2, alb))
+    if web_acl:
+        node('web_acl', 'Web ACL', delete_web_acl, wafv2, web_acl, deps=disassociation)
+
+    listeners = []
+    if inventory['listeners']:
+        listeners.append(node('listeners', 'listeners', delete_listeners, elbv2, inventory['listeners']))
+    load_balancer = []
+    if alb:
+        load_balancer.append(node('load_balancer', 'ALB', delete_load_balancer, elbv2, alb,
+                                  deps=listeners + disassociation))
+    if inventory['target_groups']:
+        node('target_groups', 'Target Groups', delete_target_groups, elbv2, inventory['target_groups'],
+             deps=listeners)
+
+    for vpc_id, vpc_inventory in inventory['vpcs'].items():
+        plan_vpc_teardown(ec2, vpc_id, inventory=vpc_inventory, dag=dag, after=load_balancer)
+    return dag
+
+def cleanup_juice_shop_infrastructure(state=STATE_PATH):
     """Elimina toda la infraestructura de Juice Shop"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
-    elbv2 = boto3.client('elbv2', region_name='us-east-1')
-    wafv2 = boto3.client('wafv2', region_name='us-east-1')
-    
     print("=== Limpiando infraestructura Juice Shop ===")
-    
+    use_state(state)
+
     try:
-        # 1. Desasociar y eliminar Web ACL
-        try:
-            web_acls = wafv2.list_web_acls(Scope='REGIONAL')
-            for web_acl in web_acls['WebACLs']:
-                if web_acl['Name'] == 'JuiceShop-WebACL':
-                    web_acl_arn = web_acl['ARN']
-                    web_acl_id = web_acl['Id']
-                    
-                    # Obtener ALB para desasociar
-                    albs = elbv2.describe_load_balancers()
-                    for alb in albs['LoadBalancers']:
-                        if alb['LoadBalancerName'] == 'JuiceShop-ALB':
-                            try:
-                                wafv2.disassociate_web_acl(ResourceArn=alb['LoadBalancerArn'])
-                                print("Web ACL desasociada del ALB")
-                            except:
-                                pass
-                    
-                    # Eliminar Web ACL
-                    wafv2.delete_web_acl(
-                        Scope='REGIONAL',
-                        Id=web_acl_id,
-                        LockToken=wafv2.get_web_acl(Scope='REGIONAL', Id=web_acl_id)['LockToken']
-                    )
-                    print(f"Web ACL eliminada: {web_acl_arn}")
-        except Exception as e:
-            print(f"Error eliminando Web ACL: {e}")
-        
-        # 2. Eliminar ALB y Target Groups
-        try:
-            albs = elbv2.describe_load_balancers()
-            for alb in albs['LoadBalancers']:
-                if alb['LoadBalancerName'] == 'JuiceShop-ALB':
-                    alb_arn = alb['LoadBalancerArn']
-                    
-                    # Eliminar listeners
-                    listeners = elbv2.describe_listeners(LoadBalancerArn=alb_arn)
-                    for listener in listeners['Listeners']:
-                        elbv2.delete_listener(ListenerArn=listener['ListenerArn'])
-                    
-                    # Eliminar ALB
-                    elbv2.delete_load_balancer(LoadBalancerArn=alb_arn)
-                    print(f"ALB eliminado: {alb_arn}")
-                    
-                    # Esperar a que se elimine
-                    time.sleep(10)
-            
-            # Eliminar Target Groups
-            tgs = elbv2.describe_target_groups()
-            for tg in tgs['TargetGroups']:
-                if tg['TargetGroupName'] == 'JuiceShop-TG':
-                    elbv2.delete_target_group(TargetGroupArn=tg['TargetGroupArn'])
-                    print(f"Target Group eliminado: {tg['TargetGroupArn']}")
-        except Exception as e:
-            print(f"Error eliminando ALB/TG: {e}")
-        
-        # 3. Obtener VPC de Juice Shop
-        vpcs = ec2.describe_vpcs(Filters=[{'Name': 'tag:Name', 'Values': ['JuiceShop-VPC']}])
-        
-        for vpc in vpcs['Vpcs']:
-            vpc_id = vpc['VpcId']
+        inventory = collect_inventory()
+        for vpc_id in inventory['vpcs']:
             print(f"Limpiando VPC: {vpc_id}")
-            
-            # Terminar instancias
-            instances = ec2.describe_instances(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-            instance_ids = []
-            for reservation in instances['Reservations']:
-                for instance in reservation['Instances']:
-                    if instance['State']['Name'] != 'terminated':
-                        instance_ids.append(instance['InstanceId'])
-                        print(f"Terminando instancia: {instance['InstanceId']}")
-                        ec2.terminate_instances(InstanceIds=[instance['InstanceId']])
-            
-            # Esperar terminación
-            if instance_ids:
-                print("Esperando terminación de instancias...")
-                ec2.get_waiter('instance_terminated').wait(InstanceIds=instance_ids)
-            
-            # Eliminar Security Groups
-            sgs = ec2.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-            for sg in sgs['SecurityGroups']:
-                if sg['GroupName'] != 'default':
-                    print(f"Eliminando SG: {sg['GroupId']}")
-                    ec2.delete_security_group(GroupId=sg['GroupId'])
-            
-            # Eliminar subredes
-            subnets = ec2.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-            for subnet in subnets['Subnets']:
-                print(f"Eliminando subred: {subnet['SubnetId']}")
-                ec2.delete_subnet(SubnetId=subnet['SubnetId'])
-            
-            # Desconectar y eliminar IGW
-            igws = ec2.describe_internet_gateways(Filters=[{'Name': 'attachment.vpc-id', 'Values': [vpc_id]}])
-            for igw in igws['InternetGateways']:
-                igw_id = igw['InternetGatewayId']
-                print(f"Desconectando IGW: {igw_id}")
-                ec2.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
-                print(f"Eliminando IGW: {igw_id}")
-                ec2.delete_internet_gateway(InternetGatewayId=igw_id)
-            
-            # Eliminar VPC
-            print(f"Eliminando VPC: {vpc_id}")
-            ec2.delete_vpc(VpcId=vpc_id)
-        
-        print("\n✅ Limpieza completada!")
-        
+
+        dag = plan_juice_shop_teardown(
+            inventory,
+            get_client('ec2', 'us-east-1'), get_client('elbv2', 'us-east-1'), get_client('wafv2', 'us-east-1')
+        )
+        # Lo que depende de un nodo fallido (p. ej. las subredes si falla el ALB) no se lanza
+        if run_teardown(dag):
+            print("\n✅ Limpieza completada!")
+        else:
+            print("\n⚠️ Limpieza incompleta: vuelve a ejecutar el script para terminarla")
+
     except Exception as e:
         print(f"❌ Error durante la limpieza: {e}")
 
-def main():
-    cleanup_juice_shop_infrastructure()
+def main(plan=False, snapshot=None, state=STATE_PATH):
+    if plan:
+        print_plan(plan_juice_shop_teardown(load_or_collect(snapshot, collect_inventory)))
+        return
+    cleanup_juice_shop_infrastructure(state)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza de la infraestructura Juice Shop")
+    parser.add_argument('--plan', action='store_true',
+                        help="Muestra las oleadas de borrado y el tiempo estimado sin borrar nada")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON del inventario para --plan (se crea si no existe)")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+
+    main(plan=args.plan, snapshot=args.snapshot, state=args.state)
@@ -1,116 +1,121 @@
 #!/usr/bin/env python3
-import boto3
-import time
+import argparse
+import os
+import sys
 
-def cleanup_transit_gateway_infrastructure():
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils.clients import get_client
+from aws_utils.inventory import build_inventory, iter_resources
+from aws_utils.poller import shared_poller
+from aws_utils.reconcile import call_with_retry, current_state, delete_once, use_state
+from aws_utils.teardown import run_per_region, terminate_instances
+
+# Recursos ya borrados: al relanzar tras un fallo se saltan sin llamar a la API
+STATE_PATH = os.path.splitext(os.path.abspath(__file__))[0] + '.state.json'
+
+def cleanup_region(region, ec2_client, vpc_names):
+    """Elimina los VPC attachments y las VPCs de una región"""
+    print(f"\n--- Limpiando recursos en {region} ---")
+
+    # Obtener TGW ID
+    try:
+        tgws = ec2_client.describe_transit_gateways()
+        for tgw in tgws['TransitGateways']:
+            if tgw['State'] in ['available', 'pending']:
+                tgw_id = tgw['TransitGatewayId']
+
+                # Eliminar VPC attachments
+                attachment_ids = []
+                for attachment in iter_resources(
+                        ec2_client, 'describe_transit_gateway_vpc_attachments', 'TransitGatewayVpcAttachments',
+                        Filters=[{'Name': 'transit-gateway-id', 'Values': [tgw_id]}]
+                ):
+                    if attachment['State'] in ['available', 'pending']:
+                        attachment_id = attachment['TransitGatewayAttachmentId']
+                        if delete_once(attachment_id, ec2_client.delete_transit_gateway_vpc_attachment,
+                                       TransitGatewayAttachmentId=attachment_id):
+                            print(f"Eliminando attachment: {attachment_id}")
+                            attachment_ids.append(attachment_id)
+
+                # Una sola espera para todos los attachments del TGW
+                if attachment_ids:
+                    print("Esperando eliminación de attachments...")
+                    shared_poller(ec2_client, 'tgw_vpc_attachment').wait(
+                        attachment_ids, ['deleting', 'deleted'], missing_ok=True, timeout=600
+                    )
+    except Exception as e:
+        print(f"Error eliminando attachments en {region}: {e}")
+
+    # Eliminar VPCs específicas: una consulta de VPCs y una por tipo de recurso para todas
+    vpcs = list(iter_resources(ec2_client, 'describe_vpcs', 'Vpcs', Filters=[{'Name': 'tag:Name', 'Values': vpc_names}]))
+    inventory = build_inventory(
+        ec2_client, [vpc['VpcId'] for vpc in vpcs],
+        ['instances', 'security_groups', 'subnets', 'internet_gateways']
+    )
+    for vpc_name in vpc_names:
+        try:
+            for vpc in vpcs:
+                if {'Key': 'Name', 'Value': vpc_name} not in vpc.get('Tags', []):
+                    continue
+                vpc_id = vpc['VpcId']
+                print(f"Limpiando {vpc_name}: {vpc_id}")
+
+                # Terminar instancias: una sola llamada y una sola espera para todas
+                instance_ids = [instance['InstanceId'] for instance in inventory[vpc_id]['instances']]
+                if instance_ids:
+                    print(f"Terminando instancias y esperando su terminación: {instance_ids}")
+                    terminate_instances(ec2_client, instance_ids)
+
+                # Eliminar Security Groups
+                for sg in inventory[vpc_id]['security_groups']:
+                    if sg['GroupName'] != 'default':
+                        if delete_once(sg['GroupId'], ec2_client.delete_security_group, GroupId=sg['GroupId']):
+                            print(f"Eliminando SG: {sg['GroupId']}")
+
+                # Eliminar subredes
+                for subnet in inventory[vpc_id]['subnets']:
+                    if delete_once(subnet['SubnetId'], ec2_client.delete_subnet, SubnetId=subnet['SubnetId']):
+                        print(f"Eliminando subred: {subnet['SubnetId']}")
+
+                # Desconectar y eliminar IGW
+                for igw in inventory[vpc_id]['internet_gateways']:
+                    igw_id = igw['InternetGatewayId']
+                    if current_state().is_deleted(igw_id):
+                        continue
+                    print(f"Desconectando IGW: {igw_id}")
+                    call_with_retry(ec2_client.detach_internet_gateway, InternetGatewayId=igw_id, VpcId=vpc_id)
+                    print(f"Eliminando IGW: {igw_id}")
+                    delete_once(igw_id, ec2_client.delete_internet_gateway, InternetGatewayId=igw_id)
+
+                # Eliminar VPC (DependencyViolation se reintenta con backoff)
+                if delete_once(vpc_id, ec2_client.delete_vpc, VpcId=vpc_id):
+                    print(f"Eliminando VPC: {vpc_id}")
+
+        except Exception as e:
+            print(f"Error eliminando {vpc_name}: {e}")
+
+
+def cleanup_transit_gateway_infrastructure(parallel=False, state=STATE_PATH):
     """Elimina las conexiones intra-regionales Transit Gateway (VPC attachments) y VPCs asociadas.
     Mantiene los Transit Gateways y el peering inter-regional."""
-    ec2_east = boto3.client('ec2', region_name='us-east-1')
-    ec2_west = boto3.client('ec2', region_name='us-west-2')
+    ec2_east = get_client('ec2', 'us-east-1')
+    ec2_west = get_client('ec2', 'us-west-2')
     
     print("=== Limpiando conexiones intra-regionales Transit Gateway ===")
+    use_state(state)
     
     try:
         # Nota: Este script ahora solo elimina conexiones intra-regionales (VPC attachments)
         # Las conexiones inter-regionales (TGW peering) se mantienen
         
         # 1. Eliminar TGW Attachments y VPCs por región (conexiones intra-regionales)
-        regions = [
-            ('us-east-1', ec2_east, ['VPC-East-1', 'VPC-East-2']),
-            ('us-west-2', ec2_west, ['VPC-West-1', 'VPC-West-2'])
-        ]
+        regions = {
+            'us-east-1': ('us-east-1', ec2_east, ['VPC-East-1', 'VPC-East-2']),
+            'us-west-2': ('us-west-2', ec2_west, ['VPC-West-1', 'VPC-West-2'])
+        }
         
-        for region, ec2_client, vpc_names in regions:
-            print(f"\n--- Limpiando recursos en {region} ---")
-            
-            # Obtener TGW ID
-            try:
-                tgws = ec2_client.describe_transit_gateways()
-                for tgw in tgws['TransitGateways']:
-                    if tgw['State'] in ['available', 'pending']:
-                        tgw_id = tgw['TransitGatewayId']
-                        
-                        # Eliminar VPC attachments
-                        attachments = ec2_client.describe_transit_gateway_vpc_attachments(
-                            Filters=[{'Name': 'transit-gateway-id', 'Values': [tgw_id]}]
-                        )
-                        
-                        attachment_ids = []
-                        for attachment in attachments['TransitGatewayVpcAttachments']:
-                            if attachment['State'] in ['available', 'pending']:
-                                attachment_id = attachment['TransitGatewayAttachmentId']
-                                attachment_ids.append(attachment_id)
-                                print(f"Eliminando attachment: {attachment_id}")
-                                ec2_client.delete_transit_gateway_vpc_attachment(TransitGatewayAttachmentId=attachment_id)
-                        
-                        # Esperar eliminación de attachments
-                        if attachment_ids:
-                            print("Esperando eliminación de attachments...")
-                            for att_id in attachment_ids:
-                                while True:
-                                    try:
-                                        response = ec2_client.describe_transit_gateway_vpc_attachments(TransitGatewayAttachmentIds=[att_id])
-                                        state = response['TransitGatewayVpcAttachments'][0]['State']
-                                        if state in ['deleted', 'deleting']:
-                                            break
-                                    except:
-                                        break  # Attachment no existe
-                                    time.sleep(15)
-            except Exception as e:
-                print(f"Error eliminando attachments en {region}: {e}")
-            
-            # Eliminar VPCs específicas
-            for vpc_name in vpc_names:
-                try:
-                    vpcs = ec2_client.describe_vpcs(Filters=[{'Name': 'tag:Name', 'Values': [vpc_name]}])
-                    
-                    for vpc in vpcs['Vpcs']:
-                        vpc_id = vpc['VpcId']
-                        print(f"Limpiando {vpc_name}: {vpc_id}")
-                        
-                        # Terminar instancias
-                        instances = ec2_client.describe_instances(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-                        instance_ids = []
-                        for reservation in instances['Reservations']:
-                            for instance in reservation['Instances']:
-                                if instance['State']['Name'] not in ['terminated', 'terminating']:
-                                    instance_ids.append(instance['InstanceId'])
-                                    print(f"Terminando instancia: {instance['InstanceId']}")
-                                    ec2_client.terminate_instances(InstanceIds=[instance['InstanceId']])
-                        
-                        # Esperar terminación
-                        if instance_ids:
-                            print("Esperando terminación de instancias...")
-                            ec2_client.get_waiter('instance_terminated').wait(InstanceIds=instance_ids)
-                        
-                        # Eliminar Security Groups
-                        sgs = ec2_client.describe_security_groups(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-                        for sg in sgs['SecurityGroups']:
-                            if sg['GroupName'] != 'default':
-                                print(f"Eliminando SG: {sg['GroupId']}")
-                                ec2_client.delete_security_group(GroupId=sg['GroupId'])
-                        
-                        # Eliminar subredes
-                        subnets = ec2_client.describe_subnets(Filters=[{'Name': 'vpc-id', 'Values': [vpc_id]}])
-                        for subnet in subnets['Subnets']:
-                            print(f"Eliminando subred: {subnet['SubnetId']}")
-                            ec2_client.delete_subnet(SubnetId=subnet['SubnetId'])
-                        
-                        # Desconectar y eliminar IGW
-                        igws = ec2_client.describe_internet_gateways(Filters=[{'Name': 'attachment.vpc-id', 'Values': [vpc_id]}])
-                        for igw in igws['InternetGateways']:
-                            igw_id = igw['InternetGatewayId']
-                            print(f"Desconectando IGW: {igw_id}")
-                            ec2_client.detach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
-                            print(f"Eliminando IGW: {igw_id}")
-                            ec2_client.delete_internet_gateway(InternetGatewayId=igw_id)
-                        
-                        # Eliminar VPC
-                        print(f"Eliminando VPC: {vpc_id}")
-                        ec2_client.delete_vpc(VpcId=vpc_id)
-                        
-                except Exception as e:
-                    print(f"Error eliminando {vpc_name}: {e}")
+        # Las regiones solo comparten el peering, que se conserva: con parallel se limpian a la vez
+        run_per_region(lambda region: cleanup_region(*regions[region]), list(regions), parallel=parallel)
         
         # 2. Eliminar Transit Gateways (opcional, comentado para mantener TGWs con peering inter-regional)
         # print("\n--- Eliminando Transit Gateways ---")
@@ -142,8 +147,15 @@ def cleanup_transit_gateway_infrastructure():
     except Exception as e:
         print(f"❌ Error durante la limpieza: {e}")
 
-def main():
-    cleanup_transit_gateway_infrastructure()
+def main(parallel=False, state=STATE_PATH):
+    cleanup_transit_gateway_infrastructure(parallel=parallel, state=state)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Limpieza de las conexiones intra-regionales Transit Gateway")
+    parser.add_argument('--parallel', action='store_true',
+                        help="Limpia las dos regiones a la vez (el peering inter-regional se conserva)")
+    parser.add_argument('--state', metavar='RUTA', default=STATE_PATH,
+                        help="Fichero con los recursos ya borrados (por defecto junto al script)")
+    args = parser.parse_args()
+    
+    main(parallel=args.parallel, state=args.state)
\ No newline at end of file
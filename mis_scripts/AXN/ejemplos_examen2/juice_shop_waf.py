@@ -1,24 +1,22 @@
 #!/usr/bin/env python3
-import boto3
+import os
+import sys
 import time
 
-def get_amazon_linux_ami(ec2_client):
-    """Obtiene la AMI más reciente de Amazon Linux 2023"""
-    response = ec2_client.describe_images(
-        Filters=[
-            {'Name': 'name', 'Values': ['al2023-ami-*-x86_64']},
-            {'Name': 'owner-id', 'Values': ['137112412989']},  # Amazon
-            {'Name': 'state', 'Values': ['available']}
-        ]
-    )
-    images = sorted(response['Images'], key=lambda x: x['CreationDate'], reverse=True)
-    return images[0]['ImageId']
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+from aws_utils import instrumentation
+from aws_utils.ami import get_amazon_linux_ami
+from aws_utils.clients import get_client
+from aws_utils.coalescing import CoalescingClient
+
+# Métricas opcionales con AWS_UTILS_METRICS=1
+instrumentation.enable_from_env()
 
 def create_juice_shop_infrastructure():
     """Crea toda la infraestructura para Juice Shop con WAF"""
-    ec2 = boto3.client('ec2', region_name='us-east-1')
-    elbv2 = boto3.client('elbv2', region_name='us-east-1')
-    wafv2 = boto3.client('wafv2', region_name='us-east-1')
+    ec2 = CoalescingClient(get_client('ec2', 'us-east-1'))
+    elbv2 = get_client('elbv2', 'us-east-1')
+    wafv2 = get_client('wafv2', 'us-east-1')
     
     print("=== Creando infraestructura Juice Shop ===")
     
@@ -27,9 +25,8 @@ def create_juice_shop_infrastructure():
     print(f"AMI Amazon Linux 2023: {ami_id}")
     
     # 1. Crear VPC
-    vpc_response = ec2.create_vpc(CidrBlock='10.0.0.0/16')
+    vpc_response = ec2.create_vpc(CidrBlock='10.0.0.0/16', Tags=[{'Key': 'Name', 'Value': 'JuiceShop-VPC'}])
     vpc_id = vpc_response['Vpc']['VpcId']
-    ec2.create_tags(Resources=[vpc_id], Tags=[{'Key': 'Name', 'Value': 'JuiceShop-VPC'}])
     print(f"VPC creada: {vpc_id}")
     
     # Habilitar DNS
@@ -37,10 +34,9 @@ def create_juice_shop_infrastructure():
     ec2.modify_vpc_attribute(VpcId=vpc_id, EnableDnsSupport={'Value': True})
     
     # 2. Crear Internet Gateway
-    igw_response = ec2.create_internet_gateway()
+    igw_response = ec2.create_internet_gateway(Tags=[{'Key': 'Name', 'Value': 'JuiceShop-IGW'}])
     igw_id = igw_response['InternetGateway']['InternetGatewayId']
     ec2.attach_internet_gateway(InternetGatewayId=igw_id, VpcId=vpc_id)
-    ec2.create_tags(Resources=[igw_id], Tags=[{'Key': 'Name', 'Value': 'JuiceShop-IGW'}])
     print(f"Internet Gateway: {igw_id}")
     
     # 3. Crear dos subredes públicas en diferentes AZ
@@ -48,13 +44,17 @@ def create_juice_shop_infrastructure():
     az1 = azs['AvailabilityZones'][0]['ZoneName']
     az2 = azs['AvailabilityZones'][1]['ZoneName']
     
-    subnet1_response = ec2.create_subnet(VpcId=vpc_id, CidrBlock='10.0.1.0/24', AvailabilityZone=az1)
+    subnet1_response = ec2.create_subnet(
+        VpcId=vpc_id, CidrBlock='10.0.1.0/24', AvailabilityZone=az1,
+        Tags=[{'Key': 'Name', 'Value': 'JuiceShop-Subnet-1'}]
+    )
     subnet1_id = subnet1_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet1_id], Tags=[{'Key': 'Name', 'Value': 'JuiceShop-Subnet-1'}])
     
-    subnet2_response = ec2.create_subnet(VpcId=vpc_id, CidrBlock='10.0.2.0/24', AvailabilityZone=az2)
+    subnet2_response = ec2.create_subnet(
+        VpcId=vpc_id, CidrBlock='10.0.2.0/24', AvailabilityZone=az2,
+        Tags=[{'Key': 'Name', 'Value': 'JuiceShop-Subnet-2'}]
+    )
     subnet2_id = subnet2_response['Subnet']['SubnetId']
-    ec2.create_tags(Resources=[subnet2_id], Tags=[{'Key': 'Name', 'Value': 'JuiceShop-Subnet-2'}])
     
     # Habilitar IP pública automática
     ec2.modify_subnet_attribute(SubnetId=subnet1_id, MapPublicIpOnLaunch={'Value': True})
@@ -71,10 +71,10 @@ def create_juice_shop_infrastructure():
     sg_response = ec2.create_security_group(
         GroupName='JuiceShop-SG',
         Description='Security group for Juice Shop',
-        VpcId=vpc_id
+        VpcId=vpc_id,
+        Tags=[{'Key': 'Name', 'Value': 'JuiceShop-SG'}]
     )
     sg_id = sg_response['GroupId']
-    ec2.create_tags(Resources=[sg_id], Tags=[{'Key': 'Name', 'Value': 'JuiceShop-SG'}])
     
     # Reglas de seguridad
     ec2.authorize_security_group_ingress(
@@ -0,0 +1,131 @@
+"""Resolución de AMIs con caché en disco (con TTL) y memo en memoria.
+
+`describe_images` con filtros por nombre devuelve la lista completa de imágenes
+que coinciden (varios MB) y hay que ordenarla en Python para quedarse con la más
+reciente. El resultado se guarda en un JSON por (región, filtros, owners):
+
+- AWS_UTILS_AMI_CACHE: ruta del fichero (por defecto ~/.cache/aws_utils/ami_cache.json)
+- AWS_UTILS_AMI_TTL: segundos de validez de cada entrada (por defecto 86400)
+- AWS_UTILS_AMI_OFFLINE=1: no llamar nunca a la API, servir solo desde la caché
+
+Si la API falla y hay una entrada caducada, se usa esa entrada con un aviso.
+"""
+import json
+import os
+import threading
+import time
+
+UBUNTU_2204_FILTERS = [
+    {'Name': 'name', 'Values': ['ubuntu/images/hvm-ssd/ubuntu-jammy-22.04-amd64-server-*']},
+    {'Name': 'owner-id', 'Values': ['099720109477']},
+    {'Name': 'state', 'Values': ['available']}
+]
+
+AMAZON_LINUX_2023_FILTERS = [
+    {'Name': 'name', 'Values': ['al2023-ami-*-x86_64']},
+    {'Name': 'owner-id', 'Values': ['137112412989']},  # Amazon
+    {'Name': 'state', 'Values': ['available']}
+]
+
+_memo = {}
+_key_locks = {}
+_lock = threading.Lock()
+
+
+def _cache_path():
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'aws_utils', 'ami_cache.json')
+    return os.environ.get('AWS_UTILS_AMI_CACHE', default)
+
+
+def _ttl():
+    return float(os.environ.get('AWS_UTILS_AMI_TTL', 86400))
+
+
+def _offline():
+    return os.environ.get('AWS_UTILS_AMI_OFFLINE', '') not in ('', '0', 'false')
+
+
+def _cache_key(region, filters, owners):
+    """Clave estable: el orden de filtros y valores no importa"""
+    normalized = sorted((f['Name'], sorted(f['Values'])) for f in filters)
+    return json.dumps([region, normalized, sorted(owners or [])])
+
+
+def _load_cache():
+    try:
+        with open(_cache_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _store(key, image_id):
+    """Guarda una entrada en la caché de disco (escritura atómica)"""
+    path = _cache_path()
+    with _lock:
+        cache = _load_cache()
+        cache[key] = {'ImageId': image_id, 'Timestamp': time.time()}
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+        _memo[key] = image_id
+
+
+def resolve_ami(ec2_client, filters, owners=None):
+    """Devuelve el ImageId más reciente que cumple `filters` en la región del cliente"""
+    key = _cache_key(ec2_client.meta.region_name, filters, owners)
+    with _lock:
+        if key in _memo:
+            return _memo[key]
+        key_lock = _key_locks.setdefault(key, threading.Lock())
+
+    # Un solo hilo resuelve cada clave; el resto espera y reutiliza el resultado
+    with key_lock:
+        with _lock:
+            if key in _memo:
+                return _memo[key]
+
+        entry = _load_cache().get(key)
+        if entry and (_offline() or time.time() - entry['Timestamp'] < _ttl()):
+            with _lock:
+                _memo[key] = entry['ImageId']
+            return entry['ImageId']
+
+        if _offline():
+            raise LookupError(f"AMI no encontrada en la caché ({_cache_path()}) y modo offline activo")
+
+        params = {'Filters': filters}
+        if owners:
+            params['Owners'] = owners
+        try:
+            images = ec2_client.describe_images(**params)['Images']
+        except Exception as e:
+            if entry:
+                print(f"⚠️ Error consultando AMIs ({e}), usando la caché caducada: {entry['ImageId']}")
+                with _lock:
+                    _memo[key] = entry['ImageId']
+                return entry['ImageId']
+            raise
+
+        if not images:
+            raise LookupError(f"No hay ninguna AMI que cumpla los filtros en {ec2_client.meta.region_name}")
+        image_id = max(images, key=lambda x: x['CreationDate'])['ImageId']
+        _store(key, image_id)
+        return image_id
+
+
+def prime_cache(region, filters, image_id, owners=None):
+    """Añade una AMI a la caché (para ejecuciones offline y pruebas)"""
+    _store(_cache_key(region, filters, owners), image_id)
+
+
+def get_ubuntu_ami(ec2_client):
+    """Obtiene la AMI más reciente de Ubuntu 22.04 LTS"""
+    return resolve_ami(ec2_client, UBUNTU_2204_FILTERS)
+
+
+def get_amazon_linux_ami(ec2_client):
+    """Obtiene la AMI más reciente de Amazon Linux 2023"""
+    return resolve_ami(ec2_client, AMAZON_LINUX_2023_FILTERS)
@@ -0,0 +1,231 @@
+"""Benchmark local de los scripts de creación/limpieza contra un servidor moto.
+
+Cada par (script de creación + su limpieza) se ejecuta en este mismo proceso con
+`runpy`, apuntando boto3 a un servidor moto local (AWS_ENDPOINT_URL) que se
+reinicia entre pares. Los `time.sleep` son virtuales (no esperan, solo suman) y
+`input()` responde 'ELIMINAR'. Por cada script se mide:
+
+- wall_s: tiempo real de ejecución
+- api_calls: nº de llamadas a la API (aws_utils.instrumentation)
+- peak_kib: pico de memoria Python (tracemalloc)
+- virtual_sleep_s: segundos que el script habría dormido
+
+La salida es JSON con claves ordenadas, para poder compararla entre commits:
+
+    python3 -m aws_utils.bench -o antes.json
+    python3 -m aws_utils.bench --compare antes.json
+
+Requiere moto con el servidor (`pip install 'moto[server]'`).
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import json
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import urllib.request
+
+SCRIPTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# nombre -> (script de creación, script de limpieza), relativos a mis_scripts/
+PAIRS = {
+    'examen_1': ('AXN/EXAMEN_1/examen_1.py', 'AXN/EXAMEN_1/cleanup_vpc.py'),
+    'transit_gateway_3vpcs': ('AXN/EXAMEN_2/transit_gateway_3vpcs.py',
+                              'AXN/EXAMEN_2/cleanup_transit_gateway_3vpcs.py'),
+    'juice_shop_waf': ('AXN/ejemplos_examen2/juice_shop_waf.py',
+                       'AXN/ejemplos_examen2/cleanup_juice_shop.py'),
+    'monitoring': ('ADMN/UD03_Observabilidad/ejemplo_examen1/create_monitoring_infrastructure.py',
+                   'ADMN/UD03_Observabilidad/ejemplo_examen1/cleanup_infrastructure.py'),
+}
+
+# Scripts de creación con diario de despliegue (--journal)
+JOURNALED = {'examen_1'}
+
+REGIONS = ['us-east-1', 'us-west-2']
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+@contextlib.contextmanager
+def moto_server():
+    """Arranca un servidor moto local y devuelve su URL"""
+    port = _free_port()
+    url = f'http://127.0.0.1:{port}'
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'moto.server', '-H', '127.0.0.1', '-p', str(port)],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        for _ in range(100):
+            try:
+                urllib.request.urlopen(f'{url}/moto-api/', timeout=1)
+                break
+            except OSError:
+                time.sleep(0.1)
+        else:
+            raise RuntimeError("El servidor moto no ha arrancado (¿está instalado 'moto[server]'?)")
+        yield url
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def _reset_moto(url):
+    request = urllib.request.Request(f'{url}/moto-api/reset', method='POST')
+    urllib.request.urlopen(request).close()
+
+
+def _seed_ami_cache():
+    """Rellena la caché de AMIs con imágenes que existen en moto"""
+    from aws_utils import ami
+    from aws_utils.clients import get_client
+
+    ami._memo.clear()
+    for region in REGIONS:
+        image_id = get_client('ec2', region).describe_images(Owners=['amazon'])['Images'][0]['ImageId']
+        ami.prime_cache(region, ami.UBUNTU_2204_FILTERS, image_id)
+        ami.prime_cache(region, ami.AMAZON_LINUX_2023_FILTERS, image_id)
+
+
+def run_script(relative_path, args=()):
+    """Ejecuta un script como __main__ y devuelve sus métricas"""
+    from aws_utils import instrumentation
+    from aws_utils.clients import reset_clients
+
+    path = os.path.join(SCRIPTS_DIR, relative_path)
+    virtual_sleep = [0.0]
+
+    def fake_sleep(seconds):
+        virtual_sleep[0] += seconds
+
+    saved = (time.sleep, builtins.input, sys.argv)
+    time.sleep = fake_sleep
+    builtins.input = lambda *a: 'ELIMINAR'
+    sys.argv = [path, *args]
+    reset_clients()
+    instrumentation.reset()
+
+    error = None
+    output = io.StringIO()
+    tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(output):
+            runpy.run_path(path, run_name='__main__')
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            error = f'SystemExit({e.code})'
+    except Exception as e:
+        error = f'{type(e).__name__}: {e}'
+    wall = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    time.sleep, builtins.input, sys.argv = saved
+
+    result = {
+        'wall_s': round(wall, 3),
+        'api_calls': instrumentation.summary()['total_calls'],
+        'peak_kib': round(peak / 1024),
+        'virtual_sleep_s': round(virtual_sleep[0], 1)
+    }
+    if error:
+        result['error'] = error
+    return result
+
+
+def run_benchmarks(names=None, repeat=1):
+    """Ejecuta los pares indicados (todos por defecto) y devuelve los resultados"""
+    os.environ.update({
+        'AWS_ACCESS_KEY_ID': 'testing',
+        'AWS_SECRET_ACCESS_KEY': 'testing',
+        'AWS_DEFAULT_REGION': 'us-east-1',
+        'AWS_UTILS_AMI_OFFLINE': '1',
+    })
+    sys.path.insert(0, SCRIPTS_DIR)
+    from aws_utils import instrumentation
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp, moto_server() as url:
+        os.environ['AWS_ENDPOINT_URL'] = url
+        os.environ['AWS_UTILS_AMI_CACHE'] = os.path.join(tmp, 'ami_cache.json')
+        # Las duraciones con sleeps virtuales no deben contaminar el histórico real
+        os.environ['AWS_UTILS_DURATIONS'] = os.path.join(tmp, 'durations.json')
+        instrumentation.enable(report_at_exit=False)
+
+        for name in names or sorted(PAIRS):
+            create, cleanup = PAIRS[name]
+            runs = []
+            for attempt in range(repeat):
+                _reset_moto(url)
+                _seed_ami_cache()
+                # Ni el diario ni el estado de borrado reales (junto a los scripts) se tocan:
+                # un diario sin --resume se vacía y ambos se llenarían de IDs de moto
+                journal = ['--journal', os.path.join(tmp, f'{name}.journal.sqlite')] if name in JOURNALED else []
+                state = ['--state', os.path.join(tmp, f'{name}.{attempt}.state.json')]
+                runs.append({'create': run_script(create, journal), 'cleanup': run_script(cleanup, state)})
+            # Con varias repeticiones se queda la más rápida de cada fase
+            results[name] = {
+                phase: min((run[phase] for run in runs), key=lambda r: r['wall_s'])
+                for phase in ('create', 'cleanup')
+            }
+            print(f"✅ {name}: create {results[name]['create']['wall_s']}s, "
+                  f"cleanup {results[name]['cleanup']['wall_s']}s", file=sys.stderr)
+    return results
+
+
+def compare(old, new):
+    """Imprime la diferencia entre dos resultados de benchmark"""
+    print(f"{'Script':<32} {'Métrica':<16} {'Antes':>10} {'Después':>10} {'Cambio':>9}")
+    for name in sorted(new):
+        for phase in ('create', 'cleanup'):
+            before = old.get(name, {}).get(phase, {})
+            after = new.get(name, {}).get(phase, {})
+            for metric in ('wall_s', 'api_calls', 'peak_kib', 'virtual_sleep_s'):
+                a, b = before.get(metric), after.get(metric)
+                if a is None or b is None:
+                    change = 'n/a'
+                elif a == 0:
+                    change = '=' if b == 0 else '+inf'
+                else:
+                    change = f'{(b - a) / a * 100:+.1f}%'
+                print(f"{name + ':' + phase:<32} {metric:<16} {str(a):>10} {str(b):>10} {change:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark de los scripts de creación/limpieza contra moto')
+    parser.add_argument('pairs', nargs='*', metavar='PAR',
+                        help=f"Pares a ejecutar (por defecto todos): {', '.join(sorted(PAIRS))}")
+    parser.add_argument('-o', '--output', help='Fichero JSON donde guardar los resultados')
+    parser.add_argument('--compare', metavar='JSON', help='Resultados anteriores con los que comparar')
+    parser.add_argument('--repeat', type=int, default=1, help='Repeticiones por par (se queda la más rápida)')
+    args = parser.parse_args()
+    unknown = set(args.pairs) - set(PAIRS)
+    if unknown:
+        parser.error(f"Pares desconocidos: {', '.join(sorted(unknown))}")
+
+    results = run_benchmarks(args.pairs or None, repeat=args.repeat)
+    text = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""Asignación y validación de CIDRs sin conexión, antes de cualquier llamada a AWS.
+
+- `check_topology` / `validate_topology`: VPCs y subredes de un plan; detectan
+  solapes (entre VPCs y entre subredes de una VPC), subredes fuera de su VPC,
+  tamaños que AWS no admite y rangos fuera de RFC1918
+- `find_overlaps`: solapes en una lista de bloques en O(n log n) (ordenación
+  más barrido con pila: dos CIDRs solo pueden ser disjuntos o estar anidados)
+- `CidrAllocator`: reparte bloques libres de un rango (árbol binario de
+  prefijos, estilo buddy) y respeta los ya ocupados
+
+    allocator = CidrAllocator('10.0.0.0/8', reserved=['10.1.0.0/16'])
+    allocator.allocate(16)  # '10.0.0.0/16'
+    allocator.allocate(16)  # '10.2.0.0/16'
+"""
+import heapq
+import ipaddress
+
+RFC1918 = tuple(ipaddress.ip_network(block) for block in ('10.0.0.0/8', '172.16.0.0/12', '192.168.0.0/16'))
+# Tamaños de bloque que admite AWS para VPCs y subredes
+MIN_PREFIXLEN = 16
+MAX_PREFIXLEN = 28
+
+
+def is_rfc1918(cidr):
+    network = ipaddress.ip_network(cidr)
+    return any(network.subnet_of(block) for block in RFC1918 if block.version == network.version)
+
+
+def find_overlaps(blocks):
+    """Pares `(nombre, cidr, nombre, cidr)` de bloques que se solapan.
+
+    `blocks` es una lista de `(nombre, cidr)`. Cada bloque se empareja con el
+    bloque más pequeño que lo contiene (o con su duplicado).
+    """
+    intervals = []
+    for name, cidr in blocks:
+        network = ipaddress.ip_network(cidr)
+        start = int(network.network_address)
+        intervals.append((network.version, start, -network.num_addresses, name, str(network)))
+    intervals.sort()
+
+    overlaps = []
+    # Pila de bloques abiertos: cada uno contiene al siguiente
+    stack = []
+    for version, start, size, name, cidr in intervals:
+        end = start - size
+        while stack and (stack[-1][0] != version or stack[-1][1] < end):
+            stack.pop()
+        if stack:
+            overlaps.append((stack[-1][2], stack[-1][3], name, cidr))
+        stack.append((version, end, name, cidr))
+    return overlaps
+
+
+def topology_from_configs(configs):
+    """Topología `{vpc: (cidr, {subred: cidr})}` a partir de las listas
+    `{'name', 'vpc_cidr', 'subnet_cidr'}` de los scripts de Transit Gateway"""
+    return {
+        config['name']: (config['vpc_cidr'], {f"{config['name']}-subnet": config['subnet_cidr']})
+        for config in configs
+    }
+
+
+def check_topology(vpcs, allow_public=()):
+    """Problemas del plan `{vpc: (cidr, {subred: cidr})}`; lista vacía si es válido.
+
+    Todas las VPCs se comparan entre sí (con Transit Gateway o peering no pueden
+    solaparse aunque estén en regiones distintas). Las VPCs de `allow_public`
+    pueden usar rangos fuera de RFC1918.
+    """
+    problems = []
+    vpc_blocks = []
+    for vpc_name, (vpc_cidr, subnets) in vpcs.items():
+        try:
+            vpc_network = ipaddress.ip_network(vpc_cidr)
+        except ValueError as e:
+            problems.append(f"{vpc_name}: CIDR no válido ({e})")
+            continue
+        if not MIN_PREFIXLEN <= vpc_network.prefixlen <= MAX_PREFIXLEN:
+            problems.append(f"{vpc_name}: {vpc_cidr} debe estar entre /{MIN_PREFIXLEN} y /{MAX_PREFIXLEN}")
+        if vpc_name not in allow_public and not is_rfc1918(vpc_network):
+            problems.append(f"{vpc_name}: {vpc_cidr} no es un rango privado (RFC1918)")
+        vpc_blocks.append((vpc_name, vpc_cidr))
+
+        subnet_blocks = []
+        for subnet_name, subnet_cidr in subnets.items():
+            try:
+                subnet_network = ipaddress.ip_network(subnet_cidr)
+            except ValueError as e:
+                problems.append(f"{subnet_name}: CIDR no válido ({e})")
+                continue
+            if subnet_network.version != vpc_network.version or not subnet_network.subnet_of(vpc_network):
+                problems.append(f"{subnet_name}: {subnet_cidr} está fuera de {vpc_name} ({vpc_cidr})")
+            elif subnet_network.prefixlen > MAX_PREFIXLEN:
+                problems.append(f"{subnet_name}: {subnet_cidr} es menor que /{MAX_PREFIXLEN}")
+            subnet_blocks.append((subnet_name, subnet_cidr))
+        for name_a, cidr_a, name_b, cidr_b in find_overlaps(subnet_blocks):
+            problems.append(f"{name_b} ({cidr_b}) se solapa con {name_a} ({cidr_a})")
+
+    for name_a, cidr_a, name_b, cidr_b in find_overlaps(vpc_blocks):
+        problems.append(f"{name_b} ({cidr_b}) se solapa con {name_a} ({cidr_a})")
+    return problems
+
+
+def validate_topology(vpcs, allow_public=()):
+    """Imprime los problemas de `check_topology`; devuelve False si hay alguno"""
+    problems = check_topology(vpcs, allow_public)
+    if problems:
+        print("❌ Plan de CIDRs no válido (no se ha creado nada):")
+        for problem in problems:
+            print(f"  - {problem}")
+        return False
+    return True
+
+
+class CidrAllocator:
+    """Reparte bloques libres de `pool`: el hueco más ajustado y, dentro de él, la dirección más baja.
+
+    Los bloques libres se guardan por longitud de prefijo; para servir un /n se
+    parte el bloque libre más pequeño que lo contiene, y reservar un bloque
+    existente solo recorre sus prefijos padre: O(32 log n) por operación.
+    """
+
+    def __init__(self, pool, reserved=()):
+        self.pool = ipaddress.ip_network(pool)
+        self._bits = self.pool.max_prefixlen
+        # Por prefijo: montículo de direcciones libres y el conjunto de las vigentes
+        self._heaps = {}
+        self._free = {}
+        self._add_free(self.pool.prefixlen, int(self.pool.network_address))
+        for cidr in reserved:
+            self.reserve(cidr)
+
+    def _add_free(self, prefixlen, address):
+        heapq.heappush(self._heaps.setdefault(prefixlen, []), address)
+        self._free.setdefault(prefixlen, set()).add(address)
+
+    def _pop_free(self, prefixlen):
+        heap, free = self._heaps.get(prefixlen, []), self._free.get(prefixlen, set())
+        while heap:
+            address = heapq.heappop(heap)
+            # Las direcciones ya reservadas se quedan en el montículo hasta salir
+            if address in free:
+                free.discard(address)
+                return address
+        return None
+
+    def _split(self, address, prefixlen, target_prefixlen, keep):
+        """Parte el bloque hasta `target_prefixlen`; libera las mitades que no contienen `keep`"""
+        for child_prefixlen in range(prefixlen + 1, target_prefixlen + 1):
+            half = 1 << (self._bits - child_prefixlen)
+            if keep >= address + half:
+                self._add_free(child_prefixlen, address)
+                address += half
+            else:
+                self._add_free(child_prefixlen, address + half)
+
+    def _network(self, address, prefixlen):
+        return str(ipaddress.ip_network((address, prefixlen)))
+
+    def allocate(self, prefixlen):
+        """Siguiente bloque libre /`prefixlen`; ValueError si el rango está lleno"""
+        if not self.pool.prefixlen <= prefixlen <= self._bits:
+            raise ValueError(f"/{prefixlen} no cabe en {self.pool}")
+        for parent_prefixlen in range(prefixlen, self.pool.prefixlen - 1, -1):
+            address = self._pop_free(parent_prefixlen)
+            if address is not None:
+                self._split(address, parent_prefixlen, prefixlen, address)
+                return self._network(address, prefixlen)
+        raise ValueError(f"No quedan bloques /{prefixlen} libres en {self.pool}")
+
+    def reserve(self, cidr):
+        """Marca `cidr` como ocupado; ValueError si se solapa con otro ya ocupado.
+
+        Los bloques fuera de `pool` no afectan al reparto y se ignoran.
+        """
+        network = ipaddress.ip_network(cidr)
+        if network.version != self.pool.version or not network.overlaps(self.pool):
+            return
+        if self.pool.subnet_of(network):
+            network = self.pool
+        target = int(network.network_address)
+        for parent_prefixlen in range(network.prefixlen, self.pool.prefixlen - 1, -1):
+            size = 1 << (self._bits - parent_prefixlen)
+            address = target - (target - int(self.pool.network_address)) % size
+            if address in self._free.get(parent_prefixlen, ()):
+                self._free[parent_prefixlen].discard(address)
+                self._split(address, parent_prefixlen, network.prefixlen, target)
+                return
+        raise ValueError(f"{cidr} se solapa con un bloque ya ocupado de {self.pool}")
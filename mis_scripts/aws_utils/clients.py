@@ -0,0 +1,53 @@
+"""Registro de clientes boto3 compartidos por proceso.
+
+Crear un cliente cuesta cientos de milisegundos (carga del modelo de servicio) y
+cada uno abre su propio pool de conexiones. get_client() crea un único cliente
+por (servicio, región) la primera vez que se pide y lo reutiliza después, de modo
+que los hilos de los caminos paralelos comparten conexiones TLS ya abiertas.
+
+El tamaño del pool se ajusta con AWS_UTILS_MAX_POOL_CONNECTIONS (por defecto 32,
+suficiente para los pools de hilos de DagExecutor) o con configure().
+"""
+import os
+import threading
+
+import boto3
+from botocore.config import Config
+
+_clients = {}
+_lock = threading.Lock()
+_config = {'max_pool_connections': int(os.environ.get('AWS_UTILS_MAX_POOL_CONNECTIONS', 32))}
+
+
+def configure(**config_kwargs):
+    """Cambia la configuración de botocore (max_pool_connections, retries, ...).
+
+    Los clientes ya creados se descartan para que se creen de nuevo con ella.
+    """
+    with _lock:
+        _config.update(config_kwargs)
+        _clients.clear()
+
+
+def reset_clients():
+    """Descarta los clientes creados (p. ej. entre ejecuciones contra moto)"""
+    with _lock:
+        _clients.clear()
+
+
+def get_client(service, region=None):
+    """Devuelve el cliente compartido de `service` en `region` (creándolo si hace falta)"""
+    key = (service, region)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+
+    # La creación de clientes desde una misma sesión no es segura entre hilos
+    with _lock:
+        if key not in _clients:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            _clients[key] = boto3.DEFAULT_SESSION.client(
+                service, region_name=region, config=Config(**_config)
+            )
+        return _clients[key]
@@ -0,0 +1,105 @@
+"""Cliente EC2 que agrupa llamadas redundantes a la API.
+
+Los scripts siguen el patrón `create_X(...)` + `create_tags(Resources=[id])` y
+activan `EnableDnsSupport`, que ya viene activado por defecto. CoalescingClient:
+
+- Acepta `Tags=[...]` en las llamadas create_* y los convierte en
+  `TagSpecifications`, de modo que el recurso nace etiquetado (1 llamada, no 2).
+- Encola las `create_tags` sueltas y las envía agrupadas por conjunto de
+  etiquetas: una sola petición para todos los recursos con las mismas etiquetas.
+  La cola se vacía antes de cualquier describe_*, con flush() o al salir del `with`.
+- Omite `EnableDnsSupport=True` en las VPCs creadas por el propio cliente.
+
+El resto de operaciones se delegan sin cambios en el cliente boto3.
+"""
+import threading
+
+# Operación create_* -> ResourceType de TagSpecifications
+_TAGGABLE_CREATES = {
+    'create_vpc': 'vpc',
+    'create_internet_gateway': 'internet-gateway',
+    'create_subnet': 'subnet',
+    'create_route_table': 'route-table',
+    'create_security_group': 'security-group',
+    'create_network_acl': 'network-acl',
+    'create_nat_gateway': 'natgateway',
+    'allocate_address': 'elastic-ip',
+    'create_transit_gateway': 'transit-gateway',
+    'create_transit_gateway_vpc_attachment': 'transit-gateway-attachment',
+    'create_vpc_peering_connection': 'vpc-peering-connection',
+}
+
+# create_tags admite como máximo 1000 recursos por llamada
+_MAX_TAG_RESOURCES = 1000
+
+
+class CoalescingClient:
+    """Envuelve un cliente EC2 de boto3 reduciendo las llamadas a la API"""
+
+    def __init__(self, client):
+        self._client = client
+        self._pending_tags = {}
+        self._default_dns_vpcs = set()
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('describe_') and callable(attr):
+            # Las consultas pueden filtrar por etiqueta: enviar antes las pendientes
+            def call(*args, **kwargs):
+                self.flush()
+                return attr(*args, **kwargs)
+            return call
+        if name in _TAGGABLE_CREATES:
+            return lambda **kwargs: self._create(name, **kwargs)
+        return attr
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+        return False
+
+    def _create(self, operation, Tags=None, **kwargs):
+        if Tags:
+            resource_type = _TAGGABLE_CREATES[operation]
+            specs = [dict(spec) for spec in kwargs.get('TagSpecifications', [])]
+            for spec in specs:
+                if spec['ResourceType'] == resource_type:
+                    spec['Tags'] = list(spec['Tags']) + list(Tags)
+                    break
+            else:
+                specs.append({'ResourceType': resource_type, 'Tags': list(Tags)})
+            kwargs['TagSpecifications'] = specs
+
+        response = getattr(self._client, operation)(**kwargs)
+
+        if operation == 'create_vpc':
+            with self._lock:
+                self._default_dns_vpcs.add(response['Vpc']['VpcId'])
+        return response
+
+    def create_tags(self, Resources, Tags):
+        """Encola las etiquetas; se envían agrupadas en el siguiente flush()"""
+        key = tuple((tag['Key'], tag['Value']) for tag in Tags)
+        with self._lock:
+            self._pending_tags.setdefault(key, []).extend(Resources)
+        return {}
+
+    def flush(self):
+        """Envía las create_tags pendientes, una llamada por conjunto de etiquetas"""
+        with self._lock:
+            pending, self._pending_tags = self._pending_tags, {}
+        for key, resources in pending.items():
+            tags = [{'Key': k, 'Value': v} for k, v in key]
+            for i in range(0, len(resources), _MAX_TAG_RESOURCES):
+                self._client.create_tags(Resources=resources[i:i + _MAX_TAG_RESOURCES], Tags=tags)
+
+    def modify_vpc_attribute(self, **kwargs):
+        """Omite EnableDnsSupport=True en VPCs recién creadas (ya es el valor por defecto)"""
+        if kwargs.get('EnableDnsSupport') == {'Value': True}:
+            with self._lock:
+                if kwargs.get('VpcId') in self._default_dns_vpcs:
+                    return {}
+        return self._client.modify_vpc_attribute(**kwargs)
@@ -0,0 +1,145 @@
+"""Ejecutor de grafos de dependencias (DAG) sobre un pool de hilos acotado"""
+import concurrent.futures
+import threading
+import time
+
+
+class DagError(Exception):
+    """Error de un nodo del grafo; conserva los resultados ya obtenidos.
+
+    `failures` son todos los nodos fallidos {nodo: error} y `skipped` los que no
+    llegaron a lanzarse.
+    """
+
+    def __init__(self, node, error, results, failures=None, skipped=()):
+        super().__init__(f"Nodo '{node}' falló: {error}")
+        self.node = node
+        self.error = error
+        self.results = results
+        self.failures = failures or {node: error}
+        self.skipped = list(skipped)
+
+
+class DagExecutor:
+    """Ejecuta nodos (funciones) respetando sus dependencias.
+
+    Cada nodo recibe como argumentos posicionales los resultados de sus
+    dependencias, en el mismo orden en que se declararon. Los nodos
+    independientes se ejecutan en paralelo con como máximo `max_workers` hilos.
+    """
+
+    def __init__(self, max_workers=8):
+        self.max_workers = max_workers
+        self.nodes = {}
+        self.results = {}
+        self.durations = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, func, deps=()):
+        """Añade un nodo al grafo y devuelve su nombre"""
+        if name in self.nodes:
+            raise ValueError(f"Nodo duplicado: {name}")
+        self.nodes[name] = (func, tuple(deps))
+        return name
+
+    def _validate(self):
+        """Comprueba que las dependencias existen y que no hay ciclos"""
+        for name, (_, deps) in self.nodes.items():
+            for dep in deps:
+                if dep not in self.nodes:
+                    raise ValueError(f"El nodo '{name}' depende de '{dep}', que no existe")
+
+        visiting, done = set(), set()
+        for start in self.nodes:
+            if start in done:
+                continue
+            stack = [(start, iter(self.nodes[start][1]))]
+            visiting.add(start)
+            while stack:
+                node, deps = stack[-1]
+                dep = next(deps, None)
+                if dep is None:
+                    stack.pop()
+                    visiting.discard(node)
+                    done.add(node)
+                elif dep in visiting:
+                    raise ValueError(f"Ciclo de dependencias en '{dep}'")
+                elif dep not in done:
+                    visiting.add(dep)
+                    stack.append((dep, iter(self.nodes[dep][1])))
+
+    def waves(self):
+        """Oleadas del grafo sin ejecutarlo: cada una solo depende de las anteriores"""
+        self._validate()
+        remaining = {name: set(deps) for name, (_, deps) in self.nodes.items()}
+        waves = []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            waves.append(ready)
+            for name in ready:
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+        return waves
+
+    def _run_node(self, name):
+        func, deps = self.nodes[name]
+        with self._lock:
+            args = [self.results[dep] for dep in deps]
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            with self._lock:
+                self.durations[name] = time.perf_counter() - start
+
+    def run(self, keep_going=False):
+        """Ejecuta el grafo completo y devuelve {nodo: resultado}.
+
+        Si un nodo falla no se lanzan más nodos, se espera a los que ya están
+        en curso y se lanza DagError con los resultados parciales. Con
+        `keep_going` solo se dejan sin lanzar los que dependen (directa o
+        indirectamente) de un nodo fallido; el resto del grafo sigue.
+        """
+        self._validate()
+
+        pending = {name: len(set(deps)) for name, (_, deps) in self.nodes.items()}
+        dependents = {name: [] for name in self.nodes}
+        for name, (_, deps) in self.nodes.items():
+            for dep in set(deps):
+                dependents[dep].append(name)
+
+        failures = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            running = {}
+            for name, count in pending.items():
+                if count == 0:
+                    running[pool.submit(self._run_node, name)] = name
+
+            while running:
+                finished, _ = concurrent.futures.wait(
+                    running, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        failures[name] = e
+                        continue
+
+                    with self._lock:
+                        self.results[name] = result
+                    if failures and not keep_going:
+                        continue
+                    for child in dependents[name]:
+                        pending[child] -= 1
+                        if pending[child] == 0:
+                            running[pool.submit(self._run_node, child)] = child
+
+        if failures:
+            name, error = next(iter(failures.items()))
+            skipped = [node for node in self.nodes if node not in self.results and node not in failures]
+            raise DagError(name, error, dict(self.results), failures, skipped) from error
+
+        return dict(self.results)
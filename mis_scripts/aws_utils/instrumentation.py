@@ -0,0 +1,198 @@
+"""Métricas opcionales de las llamadas a AWS (eventos de botocore).
+
+Con AWS_UTILS_METRICS=1, `enable_from_env()` engancha los eventos
+`before-call`/`after-call`/`needs-retry` de la sesión por defecto y se registra,
+por (servicio, operación, región): nº de llamadas, latencia p50/p95/p99,
+reintentos y throttles. También se mide el tiempo total en `time.sleep` y en
+los waiters de boto3. Al terminar se imprime una tabla resumen y, si se define
+AWS_UTILS_METRICS_JSON=<ruta>, se escribe el resumen en JSON.
+
+    from aws_utils import instrumentation
+    instrumentation.enable_from_env()  # con AWS_UTILS_METRICS=1 activa las métricas
+"""
+import atexit
+import collections
+import json
+import math
+import os
+import threading
+import time
+
+import boto3
+import botocore.waiter
+
+from aws_utils.clients import reset_clients
+
+_THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'TooManyRequestsException', 'RequestThrottled', 'SlowDown'
+}
+
+_lock = threading.Lock()
+_calls = collections.defaultdict(lambda: {'latencies': [], 'retries': 0, 'throttles': 0, 'errors': 0})
+_waits = collections.defaultdict(float)
+_enabled = False
+_local = threading.local()
+_real_sleep = time.sleep
+_real_waiter_wait = botocore.waiter.Waiter.wait
+
+
+def _percentile(values, pct):
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def _key(model, context):
+    return (model.service_model.service_name, model.name, context.get('client_region') or '-')
+
+
+def _before_call(model, context, **kwargs):
+    context['metrics_start'] = time.perf_counter()
+
+
+def _after_call(http_response, parsed, model, context, **kwargs):
+    start = context.get('metrics_start')
+    if start is None:
+        return
+    elapsed = time.perf_counter() - start
+    metadata = parsed.get('ResponseMetadata', {})
+    with _lock:
+        stats = _calls[_key(model, context)]
+        stats['latencies'].append(elapsed)
+        stats['retries'] += metadata.get('RetryAttempts', 0)
+        if http_response.status_code >= 300:
+            stats['errors'] += 1
+
+
+def _needs_retry(response, operation, request_dict, **kwargs):
+    if response is None:
+        return None
+    code = response[1].get('Error', {}).get('Code')
+    if code in _THROTTLE_CODES:
+        with _lock:
+            _calls[_key(operation, request_dict.get('context', {}))]['throttles'] += 1
+    return None
+
+
+def _timed_sleep(seconds):
+    if getattr(_local, 'in_waiter', False):
+        # Los sleeps internos de un waiter se cuentan como tiempo del waiter
+        return _real_sleep(seconds)
+    start = time.perf_counter()
+    try:
+        _real_sleep(seconds)
+    finally:
+        with _lock:
+            _waits['time.sleep'] += time.perf_counter() - start
+
+
+def _timed_waiter_wait(self, **kwargs):
+    start = time.perf_counter()
+    _local.in_waiter = True
+    try:
+        return _real_waiter_wait(self, **kwargs)
+    finally:
+        _local.in_waiter = False
+        with _lock:
+            _waits[f'waiter:{self.name}'] += time.perf_counter() - start
+
+
+def enable(session=None, report_at_exit=True):
+    """Activa la recogida de métricas (idempotente)"""
+    global _enabled, _real_sleep
+    with _lock:
+        if _enabled:
+            return
+        _enabled = True
+        _real_sleep = time.sleep
+
+    if session is None:
+        if boto3.DEFAULT_SESSION is None:
+            boto3.setup_default_session()
+        session = boto3.DEFAULT_SESSION
+    session.events.register('before-call', _before_call)
+    session.events.register('after-call', _after_call)
+    session.events.register('needs-retry', _needs_retry)
+    # Los clientes copian los eventos de la sesión al crearse
+    reset_clients()
+
+    time.sleep = _timed_sleep
+    botocore.waiter.Waiter.wait = _timed_waiter_wait
+    if report_at_exit:
+        atexit.register(_report_at_exit)
+
+
+def enable_from_env():
+    """Activa las métricas si AWS_UTILS_METRICS está definida (y no es 0/false)"""
+    if os.environ.get('AWS_UTILS_METRICS', '') not in ('', '0', 'false'):
+        enable()
+
+
+def reset():
+    """Vacía las métricas recogidas hasta ahora"""
+    with _lock:
+        _calls.clear()
+        _waits.clear()
+
+
+def summary():
+    """Devuelve las métricas como diccionario serializable a JSON"""
+    with _lock:
+        calls = {key: dict(stats, latencies=list(stats['latencies'])) for key, stats in _calls.items()}
+        waits = dict(_waits)
+
+    operations = []
+    for (service, operation, region), stats in sorted(calls.items()):
+        latencies = stats['latencies']
+        operations.append({
+            'service': service,
+            'operation': operation,
+            'region': region,
+            'count': len(latencies),
+            'total_s': round(sum(latencies), 4),
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+            'p95_ms': round(_percentile(latencies, 95) * 1000, 1),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+            'retries': stats['retries'],
+            'throttles': stats['throttles'],
+            'errors': stats['errors']
+        })
+    return {
+        'total_calls': sum(op['count'] for op in operations),
+        'operations': operations,
+        'waits_s': {k: round(v, 4) for k, v in sorted(waits.items())}
+    }
+
+
+def print_report(data=None):
+    """Imprime la tabla resumen de métricas"""
+    data = data or summary()
+    print("\n=== 📊 Métricas de llamadas AWS ===")
+    print(f"{'Servicio':<10} {'Operación':<42} {'Región':<10} {'N':>5} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'Reint.':>6} {'Throt.':>6}")
+    for op in sorted(data['operations'], key=lambda o: o['total_s'], reverse=True):
+        print(f"{op['service']:<10} {op['operation']:<42} {op['region']:<10} {op['count']:>5} "
+              f"{op['p50_ms']:>8} {op['p95_ms']:>8} {op['p99_ms']:>8} {op['retries']:>6} {op['throttles']:>6}")
+    print(f"Total llamadas: {data['total_calls']}")
+    for name, seconds in data['waits_s'].items():
+        print(f"Tiempo en {name}: {seconds:.1f}s")
+
+
+def write_json(path, data=None):
+    """Escribe el resumen de métricas en un fichero JSON"""
+    with open(path, 'w') as f:
+        json.dump(data or summary(), f, indent=2, sort_keys=True)
+
+
+def _report_at_exit():
+    data = summary()
+    print_report(data)
+    json_path = os.environ.get('AWS_UTILS_METRICS_JSON')
+    if json_path:
+        write_json(json_path, data)
+        print(f"Métricas guardadas en {json_path}")
+
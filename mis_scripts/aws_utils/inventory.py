@@ -0,0 +1,123 @@
+"""Inventario de recursos por VPC con una sola consulta por tipo.
+
+En lugar de `describe_security_groups(vpc)`, `describe_subnets(vpc)`, ... para
+cada VPC (VPCs × tipos llamadas), build_inventory() hace una llamada
+`describe_*` (paginada) por tipo con todas las VPCs en el filtro `vpc-id`, en
+bloques de 200 IDs, y devuelve un índice en memoria:
+
+    inventory = build_inventory(ec2, vpc_ids, ['security_groups', 'subnets'])
+    for sg in inventory[vpc_id]['security_groups']:
+        ...
+
+Para búsquedas sueltas, iter_resources() recorre las páginas de cualquier
+describe_*/list_* de forma perezosa (una página en memoria cada vez) y
+find_resource() deja de paginar en cuanto encuentra el recurso:
+
+    alb = find_resource(elbv2, 'describe_load_balancers', 'LoadBalancers',
+                        lambda lb: lb['LoadBalancerName'] == 'JuiceShop-ALB')
+"""
+# Filtros de EC2: como máximo 200 valores por filtro
+_CHUNK = 200
+
+_LIVE_INSTANCE_STATES = ['pending', 'running', 'stopping', 'stopped']
+
+RESOURCE_TYPES = {
+    'instances': dict(
+        operation='describe_instances',
+        result_key=lambda page: reservation_instances(page),
+        extra_filters=[{'Name': 'instance-state-name', 'Values': _LIVE_INSTANCE_STATES}]
+    ),
+    'subnets': dict(operation='describe_subnets', result_key='Subnets'),
+    'security_groups': dict(operation='describe_security_groups', result_key='SecurityGroups'),
+    'route_tables': dict(operation='describe_route_tables', result_key='RouteTables'),
+    'network_acls': dict(operation='describe_network_acls', result_key='NetworkAcls'),
+    'internet_gateways': dict(
+        operation='describe_internet_gateways', result_key='InternetGateways',
+        vpc_filter='attachment.vpc-id',
+        vpc_ids=lambda igw: [a['VpcId'] for a in igw.get('Attachments', [])]
+    ),
+    'nat_gateways': dict(
+        operation='describe_nat_gateways', result_key='NatGateways', filter_param='Filter'
+    ),
+    'tgw_vpc_attachments': dict(
+        operation='describe_transit_gateway_vpc_attachments', result_key='TransitGatewayVpcAttachments'
+    ),
+}
+
+
+def iter_pages(client, operation, **params):
+    """Genera las páginas de `operation` de una en una, sin pedir la siguiente hasta que se consume.
+
+    Usa el paginador de botocore si existe; si no (p. ej. wafv2.list_web_acls),
+    sigue NextToken/NextMarker a mano.
+    """
+    if client.can_paginate(operation):
+        yield from client.get_paginator(operation).paginate(**params)
+        return
+
+    method = getattr(client, operation)
+    while True:
+        page = method(**params)
+        yield page
+        token_key = next((key for key in ('NextToken', 'NextMarker') if page.get(key)), None)
+        if token_key is None:
+            return
+        params = dict(params, **{token_key: page[token_key]})
+
+
+def iter_resources(client, operation, result_key, **params):
+    """Genera los recursos de todas las páginas de `operation`.
+
+    `result_key` es la clave de la lista en cada página o una función que la extrae.
+    """
+    for page in iter_pages(client, operation, **params):
+        yield from (result_key(page) if callable(result_key) else page.get(result_key, []))
+
+
+def find_resource(client, operation, result_key, predicate=None, **params):
+    """Primer recurso que cumple `predicate` (o None); no pide más páginas tras encontrarlo"""
+    return next((resource for resource in iter_resources(client, operation, result_key, **params)
+                 if predicate is None or predicate(resource)), None)
+
+
+def reservation_instances(page):
+    """Instancias de una página de describe_instances"""
+    return [instance for reservation in page['Reservations'] for instance in reservation['Instances']]
+
+
+def iter_instances(ec2_client, **params):
+    """Genera las instancias de describe_instances, página a página"""
+    return iter_resources(ec2_client, 'describe_instances', reservation_instances, **params)
+
+
+def has_name(name):
+    """Predicado: el recurso tiene la etiqueta Name=`name`"""
+    return lambda resource: {'Key': 'Name', 'Value': name} in resource.get('Tags', [])
+
+
+def _describe(ec2_client, spec, vpc_ids):
+    """Todas las páginas de un describe_* filtrado por las VPCs indicadas"""
+    filters = [{'Name': spec.get('vpc_filter', 'vpc-id'), 'Values': vpc_ids}] + spec.get('extra_filters', [])
+    params = {spec.get('filter_param', 'Filters'): filters}
+    return iter_resources(ec2_client, spec['operation'], spec['result_key'], **params)
+
+
+def build_inventory(ec2_client, vpc_ids, types=None):
+    """Devuelve {vpc_id: {tipo: [recursos]}} con una consulta por tipo (y bloque de 200 VPCs).
+
+    `types` limita los tipos consultados (por defecto, todos los de RESOURCE_TYPES).
+    """
+    vpc_ids = list(dict.fromkeys(vpc_ids))
+    types = list(types or RESOURCE_TYPES)
+    inventory = {vpc_id: {kind: [] for kind in types} for vpc_id in vpc_ids}
+
+    for kind in types:
+        spec = RESOURCE_TYPES[kind]
+        owners = spec.get('vpc_ids', lambda resource: [resource['VpcId']])
+        for i in range(0, len(vpc_ids), _CHUNK):
+            for resource in _describe(ec2_client, spec, vpc_ids[i:i + _CHUNK]):
+                for vpc_id in owners(resource):
+                    if vpc_id in inventory:
+                        inventory[vpc_id][kind].append(resource)
+    return inventory
+
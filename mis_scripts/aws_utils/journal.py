@@ -0,0 +1,183 @@
+"""Diario SQLite de despliegues para poder reanudarlos.
+
+Cada paso (ejercicio1, ejercicio2, ...) guarda su resultado al terminar, y cada
+llamada que crea o modifica recursos (create_*, attach_*, run_instances, ...)
+guarda su respuesta en cuanto la API la devuelve. Al relanzar con `resume=True`:
+
+- Los pasos terminados devuelven su resultado guardado sin tocar la API.
+- El paso que quedó a medias se vuelve a ejecutar, pero las llamadas que ya se
+  hicieron (misma operación y mismos parámetros) devuelven la respuesta guardada
+  en lugar de crear recursos duplicados; solo se envían las que faltaban.
+"""
+import collections
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import boto3
+
+from aws_utils.clients import reset_clients
+
+# Operaciones de solo lectura: nunca se guardan ni se reproducen
+_READ_ONLY_PREFIXES = ('Describe', 'Get', 'List')
+
+# Claves de ID que no siguen el patrón '<Recurso>Id'
+_ID_KEYS = {
+    'TransitGatewayVpcAttachment': 'TransitGatewayAttachmentId',
+    'TransitGatewayPeeringAttachment': 'TransitGatewayAttachmentId',
+}
+_TOP_LEVEL_IDS = ('GroupId', 'AllocationId')
+
+
+def _created_ids(parsed):
+    """Extrae los IDs de recursos de la respuesta de una llamada create_*"""
+    ids = []
+    for key, value in parsed.items():
+        if key in _TOP_LEVEL_IDS and isinstance(value, str):
+            ids.append(value)
+        elif isinstance(value, dict):
+            resource_id = value.get(_ID_KEYS.get(key, f'{key}Id'))
+            if isinstance(resource_id, str):
+                ids.append(resource_id)
+        elif isinstance(value, list) and key.endswith('s'):
+            for item in value:
+                if isinstance(item, dict) and isinstance(item.get(f'{key[:-1]}Id'), str):
+                    ids.append(item[f'{key[:-1]}Id'])
+    return ids
+
+
+class _ReplayedResponse:
+    """Respuesta HTTP mínima para las llamadas reproducidas desde el diario"""
+    status_code = 200
+    headers = {}
+
+
+class Journal:
+    """Registro persistente de pasos completados, llamadas y recursos creados"""
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.resume = resume
+        self._lock = threading.Lock()
+        self._current_step = None
+        self._call_counts = collections.Counter()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS steps (step TEXT PRIMARY KEY, result TEXT, finished REAL)'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS calls (step TEXT, call_key TEXT, response TEXT, PRIMARY KEY (step, call_key))'
+        )
+        self._db.execute(
+            'CREATE TABLE IF NOT EXISTS resources '
+            '(step TEXT, operation TEXT, resource_id TEXT, created REAL)'
+        )
+        if not resume:
+            # Despliegue nuevo: se descarta el diario anterior
+            for table in ('steps', 'calls', 'resources'):
+                self._db.execute(f'DELETE FROM {table}')
+        self._db.commit()
+
+    def step(self, name, func, *args, **kwargs):
+        """Ejecuta un paso, o devuelve su resultado guardado si ya se completó"""
+        if self.resume:
+            with self._lock:
+                row = self._db.execute('SELECT result FROM steps WHERE step = ?', (name,)).fetchone()
+            if row is not None:
+                print(f"⏭️  Paso '{name}' ya completado, se reutiliza su resultado")
+                return json.loads(row[0])
+
+            partial = self.resources(name)
+            if partial:
+                print(f"🔁 Reanudando el paso '{name}' (ya creados: {', '.join(partial)})")
+
+        self._current_step = name
+        self._call_counts.clear()
+        try:
+            result = func(*args, **kwargs)
+        finally:
+            self._current_step = None
+
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO steps VALUES (?, ?, ?)', (name, json.dumps(result), time.time())
+            )
+            self._db.commit()
+        return result
+
+    def record_resource(self, operation, resource_id, step=None):
+        """Anota un recurso creado en el paso actual"""
+        with self._lock:
+            self._db.execute(
+                'INSERT INTO resources VALUES (?, ?, ?, ?)',
+                (step or self._current_step, operation, resource_id, time.time())
+            )
+            self._db.commit()
+
+    def resources(self, step=None):
+        """IDs de recursos anotados (de un paso o de todo el despliegue)"""
+        query = 'SELECT resource_id FROM resources'
+        params = ()
+        if step is not None:
+            query += ' WHERE step = ?'
+            params = (step,)
+        with self._lock:
+            return [row[0] for row in self._db.execute(query + ' ORDER BY created', params)]
+
+    def _call_key(self, model, params):
+        """Clave de una llamada: operación, parámetros y nº de repetición en el paso"""
+        body = params.get('body')
+        if isinstance(body, dict):
+            # botocore genera un ClientToken aleatorio en cada llamada idempotente
+            body = {k: v for k, v in body.items() if k != 'ClientToken'}
+        body = json.dumps(body, sort_keys=True, default=str)
+        digest = hashlib.sha1(f'{model.name}:{body}'.encode()).hexdigest()
+        self._call_counts[digest] += 1
+        return f'{model.name}:{digest}:{self._call_counts[digest]}'
+
+    def _before_call(self, model, params, context, **kwargs):
+        if self._current_step is None or model.name.startswith(_READ_ONLY_PREFIXES):
+            return None
+        context['journal_key'] = key = self._call_key(model, params)
+        if not self.resume:
+            return None
+        with self._lock:
+            row = self._db.execute(
+                'SELECT response FROM calls WHERE step = ? AND call_key = ?', (self._current_step, key)
+            ).fetchone()
+        if row is None:
+            return None
+        context['journal_replayed'] = True
+        return _ReplayedResponse(), json.loads(row[0])
+
+    def _after_call(self, http_response, parsed, model, context, **kwargs):
+        key = context.get('journal_key')
+        if key is None or context.get('journal_replayed') or http_response.status_code >= 300:
+            return
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO calls VALUES (?, ?, ?)',
+                (self._current_step, key, json.dumps(parsed, default=str))
+            )
+            self._db.commit()
+        for resource_id in _created_ids(parsed):
+            self.record_resource(model.name, resource_id)
+
+    def attach(self, session=None):
+        """Engancha el diario a las llamadas de la sesión (por defecto, la de boto3)"""
+        if session is None:
+            if boto3.DEFAULT_SESSION is None:
+                boto3.setup_default_session()
+            session = boto3.DEFAULT_SESSION
+        session.events.register('before-call', self._before_call)
+        session.events.register('after-call', self._after_call)
+        # Cada cliente copia los eventos de la sesión al crearse: los del registro
+        # se descartan para que los nuevos incluyan el diario
+        reset_clients()
+        return self
+
+    def close(self):
+        with self._lock:
+            self._db.close()
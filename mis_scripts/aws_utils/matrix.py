@@ -0,0 +1,242 @@
+"""Matriz de alcanzabilidad N×N entre instancias (rutas, NACLs y Security Groups) con numpy.
+
+A partir de una instantánea de la red (en vivo, solo llamadas describe_*/search_*,
+o de un JSON) calcula para un servicio (`tcp:22`, `icmp`, ...) qué instancia
+puede llegar a cuál, combinando tres capas como matrices booleanas:
+
+- rutas: el simulador de `reachability` se ejecuta una vez por (tabla de
+  rutas, VPC destino), en ambos sentidos, no una vez por par de instancias
+- NACLs: cada NACL evalúa de golpe las direcciones de todas las instancias
+  (máscaras enteras) en los cuatro tramos de ida y vuelta; dentro de la
+  misma subred no se aplican
+- Security Groups: cada grupo calcula qué instancias admite (CIDRs como
+  máscaras enteras, referencias a grupos con la matriz de pertenencia)
+
+Los resultados por tabla, NACL o combinación de grupos se expanden a N×N con
+indexación de numpy. Con `--before` se compara con una instantánea anterior
+y se listan los caminos que se han abierto o cerrado.
+
+    python3 -m aws_utils.matrix --snapshot antes.json --service tcp:22
+    python3 -m aws_utils.matrix --before antes.json --service tcp:22   # qué ha cambiado
+"""
+import argparse
+import ipaddress
+
+import numpy as np
+
+from aws_utils.nacl import EPHEMERAL_PORT, ICMP_REPLIES, PROTOCOLS, CompiledNacl, collect_network_acls
+from aws_utils.plan import load_or_collect, load_snapshot
+from aws_utils.reachability import OK, Simulator, collect_routing
+from aws_utils.sg import SecurityGroupIndex, collect_security_groups
+
+# Líneas de caminos abiertos/cerrados que se imprimen como máximo
+_DIFF_LINES = 50
+
+
+def collect_network(regions, vpc_ids=None):
+    """Rutas, NACLs y Security Groups de `regions` en una sola instantánea serializable en JSON"""
+    return {
+        'routing': collect_routing(regions, vpc_ids),
+        'nacls': collect_network_acls(regions, vpc_ids),
+        'security_groups': collect_security_groups(regions, vpc_ids)
+    }
+
+
+def _parse_service(text):
+    """'tcp:22', 'udp:53' o 'icmp[:tipo]' → `(protocolo, puerto)`"""
+    parts = text.split(':')
+    protocol = PROTOCOLS[parts[0].lower()]
+    if protocol == PROTOCOLS['icmp']:
+        return protocol, int(parts[1]) if len(parts) > 1 else 8
+    return protocol, int(parts[1])
+
+
+class ReachabilityMatrix:
+    """Alcanzabilidad entre las instancias de una instantánea (ver `collect_network`) para un servicio.
+
+    `reachable[i, j]` indica si la instancia `enis[i]` llega a `enis[j]`;
+    `layers` guarda la matriz de cada capa por separado.
+    """
+
+    def __init__(self, snapshot, protocol, port):
+        interfaces = snapshot['security_groups']['interfaces']
+        # Solo las ENIs de instancias, en un orden estable para poder comparar
+        self.enis = sorted(eni_id for eni_id, eni in interfaces.items() if eni.get('instance'))
+        self.interfaces = [interfaces[eni_id] for eni_id in self.enis]
+        self.addresses = np.array([int(ipaddress.IPv4Address(eni['address'])) for eni in self.interfaces],
+                                  dtype=np.uint32)
+        self.protocol, self.port = protocol, port
+        self.layers = {
+            'rutas': self._routing(snapshot['routing']),
+            'NACLs': self._nacls(snapshot['nacls']),
+            'Security Groups': self._security_groups(snapshot['security_groups'])
+        }
+        self.reachable = self.layers['rutas'] & self.layers['NACLs'] & self.layers['Security Groups']
+        np.fill_diagonal(self.reachable, False)
+
+    @staticmethod
+    def _codes(values):
+        """Índice de cada valor en la lista de valores distintos: `(distintos, índices)`"""
+        distinct = sorted(set(values), key=str)
+        positions = {value: position for position, value in enumerate(distinct)}
+        return distinct, np.array([positions[value] for value in values], dtype=np.intp)
+
+    def _same(self, key):
+        _, codes = self._codes([eni.get(key) for eni in self.interfaces])
+        return codes[:, None] == codes[None, :]
+
+    def _routing(self, routing):
+        """Ida y vuelta por tablas de rutas: una traza por (tabla, VPC destino)"""
+        simulator = Simulator(routing)
+        vpcs = routing['vpcs']
+        tables = [vpcs.get(eni['vpc'], {}).get('subnet_tables', {}).get(eni.get('subnet')) for eni in self.interfaces]
+        table_list, table_codes = self._codes(tables)
+        vpc_list, vpc_codes = self._codes([eni['vpc'] for eni in self.interfaces])
+        table_vpc = {table_id: vpc_id for vpc_id, vpc in vpcs.items() for table_id in vpc['route_tables']}
+
+        forward = np.zeros((len(table_list), len(vpc_list)), dtype=bool)
+        for t, table_id in enumerate(table_list):
+            for v, vpc_id in enumerate(vpc_list):
+                if table_id is None or vpc_id not in vpcs:
+                    continue
+                status, _, delivered_to = simulator.trace(table_vpc[table_id], table_id, vpcs[vpc_id]['cidr'])
+                forward[t, v] = status == OK and delivered_to == vpc_id
+        # forward[i, j]: la tabla de i lleva a la VPC de j; su traspuesta es la vuelta
+        pairs = forward[table_codes][:, vpc_codes]
+        return (pairs & pairs.T) | self._same('vpc')
+
+    def _nacls(self, nacls):
+        """Los cuatro tramos de ida y vuelta; cada NACL evalúa todas las direcciones a la vez"""
+        acl_ids = [nacls['subnets'].get(eni.get('subnet')) for eni in self.interfaces]
+        acl_list, acl_codes = self._codes(acl_ids)
+        size = len(self.enis)
+        protocols = np.full(size, self.protocol, dtype=np.int16)
+        if self.protocol == PROTOCOLS['icmp']:
+            request = np.full(size, self.port, dtype=np.int32)
+            reply = np.full(size, ICMP_REPLIES[self.port], dtype=np.int32) if self.port in ICMP_REPLIES else None
+        else:
+            request = np.full(size, self.port, dtype=np.int32)
+            reply = np.full(size, EPHEMERAL_PORT, dtype=np.int32)
+
+        # [tramo][nacl, dirección remota]; una subred sin NACL conocida no filtra
+        legs = {leg: np.ones((len(acl_list), size), dtype=bool) for leg in
+                ('salida', 'entrada', 'salida respuesta', 'entrada respuesta')}
+        for a, acl_id in enumerate(acl_list):
+            if acl_id not in nacls['nacls']:
+                continue
+            nacl = CompiledNacl(nacls['nacls'][acl_id]['entries'], acl_id)
+            legs['salida'][a] = nacl.evaluate_batch(True, protocols, self.addresses, request)[0]
+            legs['entrada'][a] = nacl.evaluate_batch(False, protocols, self.addresses, request)[0]
+            if reply is not None:
+                legs['salida respuesta'][a] = nacl.evaluate_batch(True, protocols, self.addresses, reply)[0]
+                legs['entrada respuesta'][a] = nacl.evaluate_batch(False, protocols, self.addresses, reply)[0]
+        # Fila de la NACL del origen (i) o traspuesta para la del destino (j)
+        allowed = (legs['salida'][acl_codes] & legs['entrada'][acl_codes].T
+                   & legs['salida respuesta'][acl_codes].T & legs['entrada respuesta'][acl_codes])
+        return allowed | self._same('subnet')
+
+    def _security_groups(self, snapshot):
+        """Salida del origen y entrada del destino (stateful), por combinación de grupos"""
+        if not self.enis:
+            return np.zeros((0, 0), dtype=bool)
+        index = SecurityGroupIndex(snapshot)
+        group_list = sorted({group_id for eni in self.interfaces for group_id in eni['groups']})
+        group_positions = {group_id: g for g, group_id in enumerate(group_list)}
+        membership = np.zeros((len(self.enis), len(group_list)), dtype=bool)
+        for i, eni in enumerate(self.interfaces):
+            membership[i, [group_positions[group_id] for group_id in eni['groups']]] = True
+
+        def admitted(egress):
+            """[grupo, instancia remota]: el grupo admite el tráfico con esa instancia"""
+            result = np.zeros((len(group_list), len(self.enis)), dtype=bool)
+            for g, group_id in enumerate(group_list):
+                networks, references = index.rules_for(group_id, egress, self.protocol, self.port)
+                for network, mask in networks:
+                    result[g] |= (self.addresses & np.uint32(mask)) == np.uint32(network)
+                columns = [group_positions[reference] for reference in references if reference in group_positions]
+                if columns:
+                    result[g] |= membership[:, columns].any(axis=1)
+            return result
+
+        set_list, set_codes = self._codes([frozenset(eni['groups']) for eni in self.interfaces])
+        egress, ingress = admitted(True), admitted(False)
+        egress_sets = np.array([egress[[group_positions[g] for g in groups]].any(axis=0) for groups in set_list])
+        ingress_sets = np.array([ingress[[group_positions[g] for g in groups]].any(axis=0) for groups in set_list])
+        return egress_sets[set_codes] & ingress_sets[set_codes].T
+
+    def label(self, i):
+        eni = self.interfaces[i]
+        return eni['name'] if eni['name'] != eni.get('instance') else f"{eni['name']} ({self.enis[i]})"
+
+    def summary(self):
+        """Imprime cuántos pares son alcanzables y cuántos bloquea cada capa"""
+        size = len(self.enis)
+        pairs = size * (size - 1)
+        off_diagonal = ~np.eye(size, dtype=bool)
+        print(f"🧮 {size} instancias: {int(self.reachable.sum())}/{pairs} pares alcanzables")
+        for name, layer in self.layers.items():
+            print(f"  - bloqueados por {name}: {int((~layer & off_diagonal).sum())}")
+
+
+def diff_matrices(before, after):
+    """Caminos `(origen, destino)` que `after` abre y cierra respecto a `before`.
+
+    Las instancias se alinean por ENI; las que solo están en una de las dos
+    cuentan como inalcanzables en la otra.
+    """
+    enis = sorted(set(before.enis) | set(after.enis))
+    positions = {eni_id: position for position, eni_id in enumerate(enis)}
+    labels = {}
+
+    def expand(matrix):
+        full = np.zeros((len(enis), len(enis)), dtype=bool)
+        rows = np.array([positions[eni_id] for eni_id in matrix.enis], dtype=np.intp)
+        full[np.ix_(rows, rows)] = matrix.reachable
+        for i, eni_id in enumerate(matrix.enis):
+            labels[eni_id] = matrix.label(i)
+        return full
+
+    old, new = expand(before), expand(after)
+    opened = [(labels[enis[i]], labels[enis[j]]) for i, j in np.argwhere(new & ~old)]
+    closed = [(labels[enis[i]], labels[enis[j]]) for i, j in np.argwhere(old & ~new)]
+    return opened, closed
+
+
+def print_diff(opened, closed):
+    """Imprime los caminos abiertos y cerrados; devuelve True si no ha cambiado nada"""
+    for icon, verb, paths in (('🟢', 'abierto', opened), ('🔴', 'cerrado', closed)):
+        for source, destination in paths[:_DIFF_LINES]:
+            print(f"  {icon} {verb}: {source} → {destination}")
+        if len(paths) > _DIFF_LINES:
+            print(f"  ... y {len(paths) - _DIFF_LINES} caminos más {verb}s")
+    if not opened and not closed:
+        print("✅ Ningún camino ha cambiado")
+    else:
+        print(f"⚠️ {len(opened)} caminos abiertos y {len(closed)} cerrados")
+    return not opened and not closed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Matriz de alcanzabilidad entre instancias")
+    parser.add_argument('--region', action='append', dest='regions',
+                        help="Región a cargar (repetible; por defecto us-east-1 y us-west-2)")
+    parser.add_argument('--vpc', action='append', dest='vpc_ids', help="Solo estas VPCs (repetible)")
+    parser.add_argument('--service', default='icmp', help="tcp:puerto, udp:puerto o icmp[:tipo] (por defecto icmp)")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON de la red (se crea si no existe)")
+    parser.add_argument('--before', metavar='RUTA',
+                        help="Instantánea anterior con la que comparar los caminos")
+    args = parser.parse_args()
+
+    regions = args.regions or ['us-east-1', 'us-west-2']
+    protocol, port = _parse_service(args.service)
+    snapshot = load_or_collect(args.snapshot, lambda: collect_network(regions, args.vpc_ids))
+    matrix = ReachabilityMatrix(snapshot, protocol, port)
+    matrix.summary()
+    if args.before:
+        print(f"Cambios respecto a {args.before} ({args.service}):")
+        print_diff(*diff_matrices(ReachabilityMatrix(load_snapshot(args.before), protocol, port), matrix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""Evaluación sin conexión de Network ACLs (stateless) sobre flujos completos.
+
+Las entradas de una NACL (formato de `create_network_acl_entry` o de
+`describe_network_acls`) se compilan en un evaluador por sentido y protocolo
+que respeta el orden de RuleNumber y la regla `*` final (deny). Un flujo se
+evalúa en sus dos tramos, porque la NACL no recuerda las conexiones:
+
+- solicitud: salida de la NACL origen → entrada de la NACL destino
+- respuesta: salida de la NACL destino → entrada de la NACL origen (puerto
+  efímero en TCP/UDP, echo-reply en ICMP)
+
+`CompiledNacl.evaluate_batch` evalúa millones de flujos por segundo con numpy
+(opcional: sin él se evalúa flujo a flujo).
+
+    python3 -m aws_utils.nacl --nacl acl-123 --flow icmp:203.0.113.5:10.0.2.10
+"""
+import argparse
+import ipaddress
+
+try:
+    import numpy as np
+except ImportError:  # numpy es opcional: sin él, los lotes se evalúan flujo a flujo
+    np = None
+
+from aws_utils.clients import get_client
+from aws_utils.inventory import iter_resources
+from aws_utils.plan import load_or_collect
+
+PROTOCOLS = {'all': -1, 'icmp': 1, 'tcp': 6, 'udp': 17}
+DEFAULT_RULE = 32767  # La regla `*` de AWS
+EPHEMERAL_PORT = 49152
+# Tipo ICMP de la respuesta a cada tipo de solicitud (echo, timestamp, ...)
+ICMP_REPLIES = {8: 0, 13: 14, 15: 16, 17: 18}
+
+
+def protocol_number(value):
+    """Número de protocolo IP de 'tcp', 'udp', 'icmp', 'all', '-1', '6', 6, ..."""
+    if isinstance(value, str) and value.lower() in PROTOCOLS:
+        return PROTOCOLS[value.lower()]
+    return int(value)
+
+
+def _address(value):
+    return int(ipaddress.IPv4Address(value))
+
+
+def _rule_label(number):
+    return '*' if number == DEFAULT_RULE else str(number)
+
+
+class CompiledNacl:
+    """Entradas de una NACL compiladas para evaluarlas rápido.
+
+    Cada regla queda como una tupla de enteros (red y máscara, protocolo,
+    rango de puertos o tipo/código ICMP); las de cada protocolo se agrupan de
+    antemano para no recorrer las que nunca pueden coincidir.
+    """
+
+    def __init__(self, entries, name=None):
+        self.name = name
+        self.rules = {False: [], True: []}
+        for entry in sorted(entries, key=lambda entry: entry['RuleNumber']):
+            if 'CidrBlock' not in entry:
+                continue  # Las reglas IPv6 no aplican a flujos IPv4
+            network = ipaddress.IPv4Network(entry['CidrBlock'])
+            protocol = protocol_number(entry['Protocol'])
+            port_range = entry.get('PortRange') or {}
+            icmp = entry.get('IcmpTypeCode') or {}
+            self.rules[bool(entry['Egress'])].append((
+                entry['RuleNumber'], entry['RuleAction'] == 'allow',
+                int(network.network_address), int(network.netmask), protocol,
+                port_range.get('From', 0), port_range.get('To', 65535),
+                icmp.get('Type', -1), icmp.get('Code', -1)
+            ))
+        for egress in (False, True):
+            # La regla `*` siempre está, aunque las entradas vengan de un plan
+            self.rules[egress].append((DEFAULT_RULE, False, 0, 0, -1, 0, 65535, -1, -1))
+        self._by_protocol = {}
+
+    def _rules_for(self, egress, protocol):
+        key = (egress, protocol)
+        if key not in self._by_protocol:
+            self._by_protocol[key] = [rule for rule in self.rules[egress] if rule[4] in (-1, protocol)]
+        return self._by_protocol[key]
+
+    def evaluate(self, egress, protocol, address, port=0, icmp_code=0):
+        """`(permitido, regla)` para un paquete; `address` es el extremo remoto
+        (origen en entrada, destino en salida) y `port` el puerto destino o,
+        en ICMP, el tipo"""
+        protocol = protocol_number(protocol)
+        if isinstance(address, str):
+            address = _address(address)
+        for number, allow, net, mask, rule_protocol, low, high, icmp_type, rule_code in self._rules_for(egress, protocol):
+            if address & mask != net:
+                continue
+            if rule_protocol in (6, 17) and not low <= port <= high:
+                continue
+            if rule_protocol == 1 and ((icmp_type != -1 and icmp_type != port)
+                                       or (rule_code != -1 and rule_code != icmp_code)):
+                continue
+            return allow, number
+        return False, DEFAULT_RULE
+
+    def evaluate_batch(self, egress, protocols, addresses, ports, icmp_codes=None):
+        """Versión vectorizada de `evaluate` para arrays del mismo tamaño.
+
+        Devuelve `(permitidos, reglas)`: la primera regla que coincide con cada
+        flujo, aplicando las reglas en orden sobre los flujos aún sin decidir.
+        """
+        if np is None:
+            codes = icmp_codes if icmp_codes is not None else [0] * len(protocols)
+            results = [self.evaluate(egress, int(protocol), int(address), int(port), int(code))
+                       for protocol, address, port, code in zip(protocols, addresses, ports, codes)]
+            return [allowed for allowed, _ in results], [rule for _, rule in results]
+
+        protocols = np.asarray(protocols, dtype=np.int16)
+        addresses = np.asarray(addresses, dtype=np.uint32)
+        ports = np.asarray(ports, dtype=np.int32)
+        codes = np.zeros_like(ports) if icmp_codes is None else np.asarray(icmp_codes, dtype=np.int32)
+        allowed = np.zeros(len(protocols), dtype=bool)
+        rules = np.full(len(protocols), DEFAULT_RULE, dtype=np.int32)
+        pending = np.ones(len(protocols), dtype=bool)
+        for number, allow, net, mask, rule_protocol, low, high, icmp_type, rule_code in self.rules[egress]:
+            match = pending & ((addresses & np.uint32(mask)) == np.uint32(net))
+            if rule_protocol != -1:
+                match &= protocols == rule_protocol
+            if rule_protocol in (6, 17):
+                match &= (ports >= low) & (ports <= high)
+            if rule_protocol == 1:
+                if icmp_type != -1:
+                    match &= ports == icmp_type
+                if rule_code != -1:
+                    match &= codes == rule_code
+            allowed[match] = allow
+            rules[match] = number
+            pending &= ~match
+            if not pending.any():
+                break
+        return allowed, rules
+
+
+def collect_network_acls(regions, vpc_ids=None):
+    """NACLs de `regions` y la de cada subred (solo describe_network_acls), en un dict serializable en JSON"""
+    snapshot = {'nacls': {}, 'subnets': {}}
+    for region in regions:
+        ec2 = get_client('ec2', region)
+        filters = [{'Name': 'vpc-id', 'Values': list(vpc_ids)}] if vpc_ids else []
+        for acl in iter_resources(ec2, 'describe_network_acls', 'NetworkAcls', Filters=filters):
+            name = next((tag['Value'] for tag in acl.get('Tags', []) if tag['Key'] == 'Name'), acl['NetworkAclId'])
+            snapshot['nacls'][acl['NetworkAclId']] = {'name': name, 'entries': acl['Entries']}
+            for association in acl.get('Associations', []):
+                snapshot['subnets'][association['SubnetId']] = acl['NetworkAclId']
+    return snapshot
+
+
+def evaluate_flow(flow, source_nacl=None, destination_nacl=None):
+    """Tramos `[(tramo, nacl, permitido, regla)]` de un flujo en ambos sentidos.
+
+    `flow` es un dict con protocol, source, destination y, según el protocolo,
+    port (y source_port) o icmp_type (e icmp_code). Una NACL None es un extremo
+    sin NACL que evaluar (Internet, o la misma subred).
+    """
+    protocol = protocol_number(flow['protocol'])
+    source, destination = _address(flow['source']), _address(flow['destination'])
+    if protocol == 1:
+        request = (flow.get('icmp_type', 8), flow.get('icmp_code', 0))
+        reply = (ICMP_REPLIES[request[0]], 0) if request[0] in ICMP_REPLIES else None
+    else:
+        request = (flow.get('port', 0), 0)
+        reply = (flow.get('source_port', EPHEMERAL_PORT), 0) if protocol in (6, 17, -1) else None
+
+    steps = [
+        ('salida de la solicitud', source_nacl, True, destination, request),
+        ('entrada de la solicitud', destination_nacl, False, source, request),
+    ]
+    if reply is not None:
+        steps += [
+            ('salida de la respuesta', destination_nacl, True, source, reply),
+            ('entrada de la respuesta', source_nacl, False, destination, reply),
+        ]
+    legs = []
+    for leg, nacl, egress, address, (port, code) in steps:
+        if nacl is not None:
+            allowed, rule = nacl.evaluate(egress, protocol, address, port, code)
+            legs.append((leg, nacl.name, allowed, rule))
+    return legs
+
+
+def print_flow(description, legs):
+    """Imprime el resultado de un flujo; devuelve True si pasa en ambos sentidos"""
+    blocked = [leg for leg in legs if not leg[2]]
+    if not blocked:
+        print(f"  ✅ {description}: permitido")
+        return True
+    leg, name, _, rule = blocked[0]
+    print(f"  ❌ {description}: bloqueado en la {leg} por {name or 'la NACL'} (regla {_rule_label(rule)})")
+    return False
+
+
+def _parse_flow(text):
+    """'tcp:origen:destino:puerto' o 'icmp:origen:destino[:tipo]'"""
+    parts = text.split(':')
+    flow = {'protocol': parts[0], 'source': parts[1], 'destination': parts[2]}
+    if len(parts) > 3:
+        flow['icmp_type' if protocol_number(parts[0]) == 1 else 'port'] = int(parts[3])
+    return flow
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa flujos contra una NACL sin generar tráfico")
+    parser.add_argument('--nacl', required=True, help="ID de la NACL (de la subred destino)")
+    parser.add_argument('--region', default='us-east-1')
+    parser.add_argument('--flow', action='append', required=True,
+                        help="tcp:origen:destino:puerto o icmp:origen:destino[:tipo] (repetible)")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON de las entradas de la NACL (se crea si no existe)")
+    args = parser.parse_args()
+
+    def collect():
+        ec2 = get_client('ec2', args.region)
+        return ec2.describe_network_acls(NetworkAclIds=[args.nacl])['NetworkAcls'][0]['Entries']
+
+    nacl = CompiledNacl(load_or_collect(args.snapshot, collect), args.nacl)
+    for text in args.flow:
+        print_flow(text, evaluate_flow(_parse_flow(text), destination_nacl=nacl))
+
+
+if __name__ == '__main__':
+    main()
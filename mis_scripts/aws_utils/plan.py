@@ -0,0 +1,222 @@
+"""Plan de borrado sin conexión: oleadas del grafo y estimación de tiempo.
+
+Con `--plan`, los scripts de limpieza construyen el grafo de borrado (un
+DagExecutor cuyos nodos no se ejecutan) a partir de una instantánea JSON del
+inventario y muestran qué se borraría, en qué oleadas y qué puede ir en
+paralelo, antes de la confirmación destructiva. Con `--snapshot <ruta>`:
+
+- si la ruta existe, el plan se hace solo con la instantánea (sin llamar a AWS)
+- si no existe, se lee el inventario (solo describe_*) y se guarda ahí
+
+El tiempo estimado simula el grafo con sus `max_workers` hilos y las duraciones
+medias por tipo de nodo registradas en ejecuciones anteriores:
+
+- AWS_UTILS_DURATIONS: fichero de duraciones (por defecto ~/.cache/aws_utils/durations.json)
+
+El tipo de un nodo es su nombre hasta el primer ':' (`subnet:subnet-123` → `subnet`).
+"""
+import collections
+import heapq
+import json
+import os
+import threading
+import time
+
+# Estimaciones iniciales (segundos) mientras no haya duraciones registradas
+DEFAULT_DURATIONS = {
+    'instances': 60,
+    'nat_gateways': 60,
+    'network_acls': 2,
+    'security_groups': 3,
+    'route_table': 2,
+    'igw': 3,
+    'subnet': 2,
+    'vpc': 2,
+    'tgw_peering': 60,
+    'tgw_vpc_attachments': 90,
+    'transit_gateways': 60,
+    'vpc_resources': 15,
+    'waf_disassociation': 2,
+    'web_acl': 3,
+    'listeners': 2,
+    'load_balancer': 30,
+    'target_groups': 2,
+}
+_UNKNOWN_SECONDS = 5
+# Peso de la última ejecución en la media móvil de cada tipo
+_SMOOTHING = 0.3
+
+_lock = threading.Lock()
+
+
+def _durations_path():
+    default = os.path.join(os.path.expanduser('~'), '.cache', 'aws_utils', 'durations.json')
+    return os.environ.get('AWS_UTILS_DURATIONS', default)
+
+
+def node_kind(name):
+    """Tipo de un nodo: su nombre hasta el primer ':'"""
+    return name.split(':', 1)[0]
+
+
+def _load_recorded(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def load_durations(path=None):
+    """Duración estimada (segundos) por tipo de nodo: la registrada o la inicial"""
+    durations = dict(DEFAULT_DURATIONS)
+    durations.update(_load_recorded(path or _durations_path()))
+    return durations
+
+
+def record_durations(node_durations, path=None):
+    """Añade al histórico las duraciones {nodo: segundos} de una ejecución.
+
+    Por cada tipo se toma el nodo más lento y se mezcla con la media anterior.
+    Solo deben pasarse nodos que han borrado algo y sin fallar: los que el
+    estado local salta (~0s) o fallan enseguida llevarían la media hacia 0.
+    Si el fichero no se puede escribir, el histórico simplemente no se actualiza.
+    """
+    if not node_durations:
+        return
+    by_kind = {}
+    for name, seconds in node_durations.items():
+        kind = node_kind(name)
+        by_kind[kind] = max(by_kind.get(kind, 0), seconds)
+
+    path = path or _durations_path()
+    with _lock:
+        recorded = _load_recorded(path)
+        for kind, seconds in by_kind.items():
+            previous = recorded.get(kind)
+            recorded[kind] = round(seconds if previous is None else
+                                   (1 - _SMOOTHING) * previous + _SMOOTHING * seconds, 3)
+        try:
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+            # Escritura atómica: un corte a mitad no deja el histórico corrupto
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(recorded, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+
+class StepTimer:
+    """Mide pasos secuenciales de un script: cada start() cierra el paso anterior.
+
+    Solo se guarda la duración de los pasos marcados con done() (han borrado
+    algo y sin errores); los demás se descartan al cerrarlos.
+    """
+
+    def __init__(self):
+        self.durations = {}
+        self._current = None
+        self._start = None
+        self._done = False
+
+    def start(self, name):
+        self.stop()
+        self._current = name
+        self._start = time.perf_counter()
+        self._done = False
+
+    def done(self):
+        """Marca el paso actual como completado con trabajo real"""
+        self._done = True
+
+    def stop(self):
+        if self._current is not None and self._done:
+            self.durations[self._current] = time.perf_counter() - self._start
+        self._current = None
+
+
+def save_snapshot(path, snapshot):
+    """Guarda la instantánea del inventario (las fechas se guardan como texto)"""
+    with open(path, 'w') as f:
+        json.dump(snapshot, f, indent=2, sort_keys=True, default=str)
+
+
+def load_snapshot(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_or_collect(path, collect):
+    """Instantánea de `path` si existe; si no, la obtiene con `collect()` y la guarda en `path`"""
+    if path and os.path.exists(path):
+        print(f"📄 Usando la instantánea {path} (sin llamadas a AWS)")
+        return load_snapshot(path)
+    snapshot = collect()
+    if path and snapshot is not None:
+        save_snapshot(path, snapshot)
+        print(f"📄 Instantánea guardada en {path}")
+    return snapshot
+
+
+def estimate(dag, durations):
+    """Instante estimado en que termina cada nodo con como máximo `dag.max_workers` a la vez.
+
+    Simula el DagExecutor: cada nodo entra en la cola en cuanto terminan sus
+    dependencias y arranca cuando queda un hilo libre.
+    """
+    dag.waves()  # Valida dependencias y ciclos
+    pending = {name: len(set(deps)) for name, (_, deps) in dag.nodes.items()}
+    dependents = {name: [] for name in dag.nodes}
+    for name, (_, deps) in dag.nodes.items():
+        for dep in set(deps):
+            dependents[dep].append(name)
+
+    ready = collections.deque(name for name, count in pending.items() if count == 0)
+    running = []  # (fin, orden de arranque, nodo)
+    finish = {}
+    now = started = 0
+    while ready or running:
+        while ready and len(running) < dag.max_workers:
+            name = ready.popleft()
+            seconds = durations.get(node_kind(name), _UNKNOWN_SECONDS)
+            heapq.heappush(running, (now + seconds, started, name))
+            started += 1
+        now, _, name = heapq.heappop(running)
+        finish[name] = now
+        for child in dependents[name]:
+            pending[child] -= 1
+            if pending[child] == 0:
+                ready.append(child)
+    return finish
+
+
+def print_plan(dag, durations=None):
+    """Imprime las oleadas del grafo y el tiempo estimado; devuelve los segundos estimados"""
+    durations = durations or load_durations()
+    waves = dag.waves()
+    finish = estimate(dag, durations)
+
+    print("\n=== 🗺️ Plan de borrado (no se modifica nada) ===")
+    for number, wave in enumerate(waves, 1):
+        mode = f"{len(wave)} en paralelo" if len(wave) > 1 else "1 nodo"
+        print(f"Oleada {number} ({mode}):")
+        for name in wave:
+            seconds = durations.get(node_kind(name), _UNKNOWN_SECONDS)
+            print(f"  • {name}  ~{seconds:.0f}s (fin ~{finish[name]:.0f}s)")
+
+    if not finish:
+        print("No hay nada que borrar")
+        return 0
+
+    # Camino crítico: desde el último nodo en terminar, la dependencia más tardía
+    node = max(finish, key=finish.get)
+    critical = []
+    while node is not None:
+        critical.append(node)
+        deps = dag.nodes[node][1]
+        node = max(deps, key=finish.get) if deps else None
+    total = max(finish.values())
+    print(f"\n⏱️ Tiempo estimado: ~{total:.0f}s (hasta {dag.max_workers} hilos)")
+    print(f"   Camino crítico: {' → '.join(reversed(critical))}")
+    return total
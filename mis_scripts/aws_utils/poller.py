@@ -0,0 +1,202 @@
+"""Sondeo en lote del estado de recursos AWS con backoff adaptativo.
+
+En lugar de un bucle `while True: describe(Ids=[uno]); time.sleep(10)` por
+recurso, un StatePoller agrupa todos los IDs pendientes de un mismo tipo y los
+consulta con una sola llamada describe_* por tick. Cada recurso tiene su propio
+Future, que se resuelve en cuanto alcanza el estado objetivo.
+
+Un poller se comparte entre todas las esperas de una región, así que un error
+de la API no falla todas a la vez: el throttling y los errores transitorios
+(ver `reconcile.classify`) solo alargan el siguiente tick, y las esperas
+fallan con un error FATAL o tras `max_errors` errores seguidos.
+"""
+import concurrent.futures
+import threading
+import time
+
+from aws_utils.reconcile import RETRY, THROTTLE, classify
+
+
+class StatePoller:
+    """Consulta en lote el estado de varios recursos del mismo tipo"""
+
+    def __init__(self, client, operation, result_key, id_key, id_filter,
+                 state=lambda resource: resource['State'],
+                 min_delay=2, max_delay=15, backoff=1.5, filter_param='Filters', max_errors=5):
+        self.client = client
+        self.operation = operation
+        self.result_key = result_key
+        self.id_key = id_key
+        self.id_filter = id_filter
+        self.state = state
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.backoff = backoff
+        self.filter_param = filter_param
+        self.max_errors = max_errors
+
+        self._watches = []
+        self._last_states = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, ids, target_states, failed_states=(), missing_ok=False, timeout=None):
+        """Empieza a vigilar `ids` y devuelve {id: Future}.
+
+        El Future se resuelve con el recurso descrito al llegar a uno de
+        `target_states` (o con None si desaparece y `missing_ok`), y falla si
+        pasa a `failed_states` o se agota `timeout` (segundos).
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        futures = {}
+        with self._condition:
+            for resource_id in ids:
+                future = concurrent.futures.Future()
+                futures[resource_id] = future
+                self._watches.append({
+                    'id': resource_id,
+                    'future': future,
+                    'target': set(target_states),
+                    'failed': set(failed_states),
+                    'missing_ok': missing_ok,
+                    'deadline': deadline
+                })
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return futures
+
+    def wait(self, ids, target_states, failed_states=(), missing_ok=False, timeout=None):
+        """Versión bloqueante de watch(); devuelve {id: recurso}"""
+        futures = self.watch(ids, target_states, failed_states, missing_ok, timeout)
+        return {resource_id: future.result() for resource_id, future in futures.items()}
+
+    def _describe(self, ids):
+        """Una llamada describe (paginada si hace falta) para todos los IDs"""
+        params = {self.filter_param: [{'Name': self.id_filter, 'Values': ids}]}
+        if self.client.can_paginate(self.operation):
+            pages = self.client.get_paginator(self.operation).paginate(**params)
+        else:
+            pages = [getattr(self.client, self.operation)(**params)]
+
+        resources = {}
+        for page in pages:
+            items = self.result_key(page) if callable(self.result_key) else page[self.result_key]
+            for resource in items:
+                resources[resource[self.id_key]] = resource
+        return resources
+
+    def _tick(self):
+        """Consulta todos los pendientes y resuelve los que han terminado.
+
+        Devuelve True si algún recurso ha cambiado de estado.
+        """
+        with self._condition:
+            watches = [w for w in self._watches if not w['future'].done()]
+        if not watches:
+            return False
+
+        ids = sorted({w['id'] for w in watches})
+        # Los filtros de EC2 admiten como máximo 200 valores
+        resources = {}
+        for i in range(0, len(ids), 200):
+            resources.update(self._describe(ids[i:i + 200]))
+
+        changed = False
+        now = time.monotonic()
+        for w in watches:
+            resource = resources.get(w['id'])
+            state = self.state(resource) if resource is not None else None
+            if self._last_states.get(w['id']) != state:
+                self._last_states[w['id']] = state
+                changed = True
+
+            if resource is None:
+                if w['missing_ok']:
+                    w['future'].set_result(None)
+                    continue
+            elif state in w['target']:
+                w['future'].set_result(resource)
+                continue
+            elif state in w['failed']:
+                w['future'].set_exception(RuntimeError(f"{w['id']} ha pasado a estado '{state}'"))
+                continue
+
+            if w['deadline'] is not None and now >= w['deadline']:
+                w['future'].set_exception(TimeoutError(f"Timeout esperando {w['id']} (estado: {state})"))
+
+        return changed
+
+    def _loop(self):
+        delay = self.min_delay
+        errors = 0
+        while True:
+            try:
+                changed = self._tick()
+                errors = 0
+            except Exception as e:
+                errors += 1
+                # Throttling o error transitorio: se reintenta en el siguiente tick (con
+                # backoff); un error FATAL o demasiados seguidos se propagan a todos
+                if classify(e) not in (RETRY, THROTTLE) or errors >= self.max_errors:
+                    with self._condition:
+                        for w in self._watches:
+                            if not w['future'].done():
+                                w['future'].set_exception(e)
+                changed = False
+
+            with self._condition:
+                self._watches = [w for w in self._watches if not w['future'].done()]
+                if not self._watches:
+                    self._thread = None
+                    return
+                # Backoff adaptativo: rápido mientras hay progreso, más lento si no
+                delay = self.min_delay if changed else min(delay * self.backoff, self.max_delay)
+                self._condition.wait(timeout=delay)
+
+
+_POLLER_TYPES = {
+    'transit_gateway': dict(
+        operation='describe_transit_gateways', result_key='TransitGateways',
+        id_key='TransitGatewayId', id_filter='transit-gateway-id'
+    ),
+    'tgw_vpc_attachment': dict(
+        operation='describe_transit_gateway_vpc_attachments', result_key='TransitGatewayVpcAttachments',
+        id_key='TransitGatewayAttachmentId', id_filter='transit-gateway-attachment-id'
+    ),
+    'tgw_peering_attachment': dict(
+        operation='describe_transit_gateway_peering_attachments', result_key='TransitGatewayPeeringAttachments',
+        id_key='TransitGatewayAttachmentId', id_filter='transit-gateway-attachment-id'
+    ),
+    'vpc_peering': dict(
+        operation='describe_vpc_peering_connections', result_key='VpcPeeringConnections',
+        id_key='VpcPeeringConnectionId', id_filter='vpc-peering-connection-id',
+        state=lambda resource: resource['Status']['Code']
+    ),
+    'nat_gateway': dict(
+        operation='describe_nat_gateways', result_key='NatGateways',
+        id_key='NatGatewayId', id_filter='nat-gateway-id', filter_param='Filter'
+    ),
+    'instance': dict(
+        operation='describe_instances',
+        result_key=lambda page: [i for r in page['Reservations'] for i in r['Instances']],
+        id_key='InstanceId', id_filter='instance-id',
+        state=lambda resource: resource['State']['Name']
+    ),
+}
+
+_pollers = {}
+_pollers_lock = threading.Lock()
+
+
+def shared_poller(ec2_client, kind):
+    """Devuelve el poller compartido de un tipo de recurso en la región del cliente.
+
+    Todas las esperas del mismo tipo y región comparten las llamadas describe.
+    """
+    key = (ec2_client.meta.region_name, kind)
+    with _pollers_lock:
+        if key not in _pollers:
+            _pollers[key] = StatePoller(ec2_client, **_POLLER_TYPES[kind])
+        return _pollers[key]
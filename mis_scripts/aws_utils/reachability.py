@@ -0,0 +1,310 @@
+"""Simulador de alcanzabilidad entre VPCs sin SSH ni ping.
+
+Carga las tablas de rutas de las VPCs y de los Transit Gateways (en vivo o de
+una instantánea JSON) en un árbol de prefijos por tabla y sigue, con
+coincidencia del prefijo más largo, el camino de cada par origen/destino:
+
+    VPC (tabla de la subred) → TGW (tabla asociada al attachment) → peering
+    → TGW remoto → attachment de la VPC destino
+
+Cada par termina en `ok`, `blackhole` (sin ruta, ruta en blackhole, attachment
+sin tabla o tráfico de tránsito que una VPC no reenvía) o `loop`.
+
+    python3 -m aws_utils.reachability --region us-east-1 --region us-west-2
+    python3 -m aws_utils.reachability --snapshot rutas.json   # sin llamar a AWS
+"""
+import argparse
+import ipaddress
+import sys
+
+from aws_utils.clients import get_client
+from aws_utils.inventory import iter_resources
+from aws_utils.plan import load_or_collect
+
+OK = 'ok'
+BLACKHOLE = 'blackhole'
+LOOP = 'loop'
+# search_transit_gateway_routes exige un filtro (devuelve hasta 1000 rutas por tabla)
+_TGW_ROUTE_STATES = [{'Name': 'state', 'Values': ['active', 'blackhole']}]
+
+
+class PrefixTrie:
+    """Árbol binario de prefijos IPv4 con búsqueda del prefijo más largo"""
+
+    def __init__(self):
+        # Nodo: [hijo 0, hijo 1, (prefijo, valor) o None]
+        self._root = [None, None, None]
+
+    def insert(self, cidr, value):
+        network = ipaddress.ip_network(cidr)
+        address = int(network.network_address)
+        node = self._root
+        for bit in range(network.prefixlen):
+            branch = (address >> (31 - bit)) & 1
+            if node[branch] is None:
+                node[branch] = [None, None, None]
+            node = node[branch]
+        node[2] = (str(network), value)
+
+    def lookup(self, cidr):
+        """`(prefijo, valor)` de la ruta más específica que contiene todo `cidr`, o None"""
+        network = ipaddress.ip_network(cidr)
+        address = int(network.network_address)
+        node, match = self._root, self._root[2]
+        for bit in range(network.prefixlen):
+            node = node[(address >> (31 - bit)) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                match = node[2]
+        return match
+
+
+def _vpc_route(route):
+    target = (route.get('GatewayId') or route.get('TransitGatewayId') or route.get('NatGatewayId')
+              or route.get('VpcPeeringConnectionId') or route.get('NetworkInterfaceId')
+              or route.get('InstanceId') or 'desconocido')
+    return [route['DestinationCidrBlock'], target, route.get('State', 'active')]
+
+
+def collect_routing(regions, vpc_ids=None):
+    """Tablas de rutas de VPCs y TGWs de `regions` (solo llamadas describe_*/search_*).
+
+    Devuelve un dict serializable en JSON; con `vpc_ids` solo se simulan esas VPCs
+    como origen y destino (aunque se cargan todos los TGWs de las regiones).
+    """
+    routing = {'vpcs': {}, 'tgws': {}, 'vpc_peerings': {}}
+    for region in regions:
+        ec2 = get_client('ec2', region)
+        vpc_filters = [{'Name': 'vpc-id', 'Values': list(vpc_ids)}] if vpc_ids else []
+        for vpc in iter_resources(ec2, 'describe_vpcs', 'Vpcs', Filters=vpc_filters):
+            if vpc['IsDefault'] and not vpc_ids:
+                continue
+            name = next((tag['Value'] for tag in vpc.get('Tags', []) if tag['Key'] == 'Name'), vpc['VpcId'])
+            routing['vpcs'][vpc['VpcId']] = {
+                'name': name, 'region': region, 'cidr': vpc['CidrBlock'],
+                'route_tables': {}, 'tables_in_use': [], 'subnet_tables': {}
+            }
+
+        # Una llamada por tipo para toda la región, repartida después por VPC
+        subnets_by_vpc, subnet_tables, main_tables = {}, {}, {}
+        for subnet in iter_resources(ec2, 'describe_subnets', 'Subnets'):
+            subnets_by_vpc.setdefault(subnet['VpcId'], []).append(subnet['SubnetId'])
+        for table in iter_resources(ec2, 'describe_route_tables', 'RouteTables'):
+            vpc = routing['vpcs'].get(table['VpcId'])
+            if vpc is None or vpc['region'] != region:
+                continue
+            vpc['route_tables'][table['RouteTableId']] = [
+                _vpc_route(route) for route in table['Routes'] if 'DestinationCidrBlock' in route
+            ]
+            for assoc in table.get('Associations', []):
+                if assoc.get('Main'):
+                    main_tables[table['VpcId']] = table['RouteTableId']
+                elif assoc.get('SubnetId'):
+                    subnet_tables[assoc['SubnetId']] = table['RouteTableId']
+        for vpc_id, vpc in routing['vpcs'].items():
+            if vpc['region'] != region:
+                continue
+            # Tablas que usa de verdad alguna subred (la principal si hay subredes sin asociar)
+            main_table = main_tables.get(vpc_id)
+            vpc['subnet_tables'] = {
+                subnet_id: subnet_tables.get(subnet_id, main_table) for subnet_id in subnets_by_vpc.get(vpc_id, [])
+            }
+            in_use = set(vpc['subnet_tables'].values())
+            vpc['tables_in_use'] = sorted(table for table in in_use if table) or ([main_table] if main_table else [])
+
+        tgws = routing['tgws']
+        region_tgws = [tgw['TransitGatewayId'] for tgw in iter_resources(
+            ec2, 'describe_transit_gateways', 'TransitGateways',
+            Filters=[{'Name': 'state', 'Values': ['available', 'pending']}]
+        )]
+        for tgw_id in region_tgws:
+            tgws[tgw_id] = {'region': region, 'route_tables': {}, 'attachments': {}}
+        for attachment in iter_resources(ec2, 'describe_transit_gateway_attachments', 'TransitGatewayAttachments',
+                                         Filters=[{'Name': 'state', 'Values': ['available', 'pending']}]):
+            tgw_id, resource_id = attachment['TransitGatewayId'], attachment['ResourceId']
+            # Un peering aparece en las dos regiones; cada lado lo ve desde su TGW
+            if tgw_id not in region_tgws and resource_id in region_tgws:
+                tgw_id, resource_id = resource_id, tgw_id
+            if tgw_id not in region_tgws:
+                continue
+            tgws[tgw_id]['attachments'][attachment['TransitGatewayAttachmentId']] = {
+                'type': attachment['ResourceType'], 'resource': resource_id,
+                'route_table': (attachment.get('Association') or {}).get('TransitGatewayRouteTableId')
+            }
+        for table in iter_resources(ec2, 'describe_transit_gateway_route_tables', 'TransitGatewayRouteTables'):
+            if table['TransitGatewayId'] not in region_tgws:
+                continue
+            routes = ec2.search_transit_gateway_routes(
+                TransitGatewayRouteTableId=table['TransitGatewayRouteTableId'], Filters=_TGW_ROUTE_STATES
+            )['Routes']
+            tgws[table['TransitGatewayId']]['route_tables'][table['TransitGatewayRouteTableId']] = [
+                [route['DestinationCidrBlock'],
+                 next((a['TransitGatewayAttachmentId'] for a in route.get('TransitGatewayAttachments', [])), None),
+                 route['State']]
+                for route in routes if 'DestinationCidrBlock' in route
+            ]
+        # Las tablas asociadas a attachments de este TGW que no sean suyas no sirven
+        for tgw_id in region_tgws:
+            for attachment in tgws[tgw_id]['attachments'].values():
+                if attachment['route_table'] not in tgws[tgw_id]['route_tables']:
+                    attachment['route_table'] = None
+
+        for peering in iter_resources(ec2, 'describe_vpc_peering_connections', 'VpcPeeringConnections',
+                                      Filters=[{'Name': 'status-code', 'Values': ['active']}]):
+            routing['vpc_peerings'][peering['VpcPeeringConnectionId']] = [
+                peering['RequesterVpcInfo']['VpcId'], peering['AccepterVpcInfo']['VpcId']
+            ]
+    return routing
+
+
+class Simulator:
+    """Recorre los caminos de `routing` (ver `collect_routing`)"""
+
+    def __init__(self, routing):
+        self.routing = routing
+        self.vpcs = routing['vpcs']
+        self.tgws = routing['tgws']
+        self.vpc_peerings = routing.get('vpc_peerings', {})
+        self._vpc_tables = {
+            table_id: self._trie(routes)
+            for vpc in self.vpcs.values() for table_id, routes in vpc['route_tables'].items()
+        }
+        self._tgw_tables = {
+            table_id: self._trie(routes)
+            for tgw in self.tgws.values() for table_id, routes in tgw['route_tables'].items()
+        }
+        # Attachment de cada VPC en cada TGW
+        self._vpc_attachments = {
+            (tgw_id, attachment['resource']): attachment_id
+            for tgw_id, tgw in self.tgws.items()
+            for attachment_id, attachment in tgw['attachments'].items() if attachment['type'] == 'vpc'
+        }
+
+    @staticmethod
+    def _trie(routes):
+        trie = PrefixTrie()
+        for cidr, target, state in routes:
+            trie.insert(cidr, (target, state))
+        return trie
+
+    def _arrive(self, vpc_id, destination, path):
+        """El tráfico entra en `vpc_id` desde fuera: solo se entrega si va a esa VPC"""
+        vpc = self.vpcs.get(vpc_id)
+        if vpc is None:
+            return BLACKHOLE, path + [f"{vpc_id} no está en el inventario"], None
+        path = path + [vpc['name']]
+        if ipaddress.ip_network(destination).subnet_of(ipaddress.ip_network(vpc['cidr'])):
+            return OK, path, vpc_id
+        return BLACKHOLE, path + ["una VPC no reenvía tráfico de tránsito"], None
+
+    def trace(self, source_vpc, table_id, destination):
+        """`(estado, camino, vpc donde se entrega)` de un paquete de `source_vpc`
+        (tabla `table_id`) hacia el bloque `destination`"""
+        vpc = self.vpcs[source_vpc]
+        path = [f"{vpc['name']} ({table_id})"]
+        match = self._vpc_tables[table_id].lookup(destination)
+        if match is None:
+            return BLACKHOLE, path + [f"sin ruta a {destination}"], None
+        prefix, (target, state) = match
+        path.append(f"{prefix} → {target}")
+        if state != 'active':
+            return BLACKHOLE, path + [f"ruta en estado {state}"], None
+        if target == 'local':
+            return OK, path, source_vpc
+        if target.startswith('pcx-'):
+            peers = self.vpc_peerings.get(target)
+            if not peers or source_vpc not in peers:
+                return BLACKHOLE, path + [f"peering {target} no activo"], None
+            return self._arrive(peers[1] if peers[0] == source_vpc else peers[0], destination, path)
+        if not target.startswith('tgw-'):
+            return BLACKHOLE, path + [f"sale por {target}, no hacia otra VPC"], None
+
+        tgw_id = target
+        attachment_id = self._vpc_attachments.get((tgw_id, source_vpc))
+        if attachment_id is None:
+            return BLACKHOLE, path + [f"{vpc['name']} no tiene attachment en {tgw_id}"], None
+        visited = set()
+        while True:
+            tgw = self.tgws.get(tgw_id)
+            if tgw is None:
+                return BLACKHOLE, path + [f"{tgw_id} no está en el inventario"], None
+            table = tgw['attachments'][attachment_id]['route_table']
+            if table is None:
+                return BLACKHOLE, path + [f"{attachment_id} sin tabla asociada en {tgw_id}"], None
+            if (tgw_id, table) in visited:
+                return LOOP, path + [f"{tgw_id} ({table}) ya visitado"], None
+            visited.add((tgw_id, table))
+
+            match = self._tgw_tables[table].lookup(destination)
+            if match is None:
+                return BLACKHOLE, path + [f"{tgw_id} ({table}): sin ruta a {destination}"], None
+            prefix, (next_attachment, state) = match
+            path.append(f"{tgw_id} ({table}): {prefix} → {next_attachment or 'ningún attachment'}")
+            if state != 'active' or next_attachment is None:
+                return BLACKHOLE, path + ["ruta TGW en blackhole"], None
+            attachment = tgw['attachments'].get(next_attachment)
+            if attachment is None:
+                return BLACKHOLE, path + [f"{next_attachment} no pertenece a {tgw_id}"], None
+            if attachment['type'] == 'vpc':
+                return self._arrive(attachment['resource'], destination, path)
+            if attachment['type'] != 'peering':
+                return BLACKHOLE, path + [f"attachment {attachment['type']} fuera de la simulación"], None
+            # Al cruzar el peering se continúa en el TGW remoto con el mismo attachment
+            tgw_id, attachment_id = attachment['resource'], next_attachment
+            if attachment_id not in self.tgws.get(tgw_id, {}).get('attachments', {}):
+                return BLACKHOLE, path + [f"peering {attachment_id} no visible desde {tgw_id}"], None
+
+    def mesh(self):
+        """Resultado de cada par (origen, tabla, destino): [(vpc, tabla, vpc, estado, camino)]"""
+        results = []
+        for source_vpc, vpc in self.vpcs.items():
+            for table_id in vpc['tables_in_use']:
+                for destination_vpc, destination in self.vpcs.items():
+                    if destination_vpc == source_vpc:
+                        continue
+                    status, path, delivered_to = self.trace(source_vpc, table_id, destination['cidr'])
+                    # Entregado, pero en otra VPC que se solapa con el destino
+                    if status == OK and delivered_to != destination_vpc:
+                        status, path = BLACKHOLE, path + [f"entregado en {self.vpcs[delivered_to]['name']}"]
+                    results.append((source_vpc, table_id, destination_vpc, status, path))
+        return results
+
+
+def print_report(routing, results):
+    """Imprime los pares que fallan y un resumen; devuelve True si todos son alcanzables"""
+    vpcs = routing['vpcs']
+    failures = [result for result in results if result[3] != OK]
+    for source_vpc, table_id, destination_vpc, status, path in failures:
+        icon = '🔁' if status == LOOP else '🕳️'
+        print(f"{icon} {vpcs[source_vpc]['name']} → {vpcs[destination_vpc]['name']}: {status}")
+        print(f"     {' | '.join(path)}")
+    reachable = len(results) - len(failures)
+    icon = '✅' if not failures else '⚠️'
+    print(f"{icon} {reachable}/{len(results)} pares origen/destino alcanzables")
+    return not failures
+
+
+def verify_mesh(regions, vpc_ids=None):
+    """Comprueba en vivo que todas las VPCs se alcanzan entre sí; True si es así"""
+    routing = collect_routing(regions, vpc_ids)
+    return print_report(routing, Simulator(routing).mesh())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Alcanzabilidad entre VPCs según las tablas de rutas")
+    parser.add_argument('--region', action='append', dest='regions',
+                        help="Región a cargar (repetible; por defecto us-east-1 y us-west-2)")
+    parser.add_argument('--vpc', action='append', dest='vpc_ids', help="Solo estas VPCs (repetible)")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON de las tablas de rutas (se crea si no existe)")
+    args = parser.parse_args()
+
+    regions = args.regions or ['us-east-1', 'us-west-2']
+    routing = load_or_collect(args.snapshot, lambda: collect_routing(regions, args.vpc_ids))
+    ok = print_report(routing, Simulator(routing).mesh())
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
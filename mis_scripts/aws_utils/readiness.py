@@ -0,0 +1,136 @@
+"""Esperas por condición en lugar de pausas fijas (`time.sleep(30)`).
+
+Cada comprobación es un predicado que consulta la API y devuelve un valor
+verdadero en cuanto su condición se cumple (attachment `available`, tabla de
+rutas asociada...). wait_until() lo reevalúa con backoff hasta su propio
+timeout, y wait_each() hace lo mismo para varios elementos a la vez, ejecutando
+la acción de cada uno (p. ej. crear sus rutas) en cuanto está listo.
+"""
+import time
+
+
+def wait_until(predicate, description, timeout=300, min_delay=1, max_delay=10, backoff=1.5):
+    """Espera a que `predicate()` devuelva un valor verdadero y lo devuelve.
+
+    Lanza TimeoutError si no se cumple en `timeout` segundos.
+    """
+    deadline = time.monotonic() + timeout
+    delay = min_delay
+    while True:
+        result = predicate()
+        if result:
+            return result
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise TimeoutError(f"Timeout ({timeout}s) esperando {description}")
+        time.sleep(min(delay, remaining))
+        delay = min(delay * backoff, max_delay)
+
+
+def wait_each(keys, ready_keys, on_ready, description, timeout=300, min_delay=1, max_delay=10, backoff=1.5):
+    """Ejecuta `on_ready(key)` para cada clave en cuanto está lista.
+
+    `ready_keys(pendientes)` devuelve las claves pendientes cuya condición ya se
+    cumple (normalmente con una sola consulta para todas). Lanza TimeoutError
+    con las que sigan pendientes al agotarse `timeout`.
+    """
+    pending = list(keys)
+
+    def step():
+        ready = set(ready_keys(list(pending)))
+        for key in [k for k in pending if k in ready]:
+            pending.remove(key)
+            on_ready(key)
+        return not pending
+
+    try:
+        wait_until(step, description, timeout, min_delay, max_delay, backoff)
+    except TimeoutError:
+        raise TimeoutError(f"Timeout ({timeout}s) esperando {description}: {', '.join(map(str, pending))}")
+
+
+# --- Predicados ---
+
+def tgw_attachment_states(ec2_client, attachment_ids):
+    """Estado de cada attachment de TGW (VPC o peering) en una sola llamada"""
+    response = ec2_client.describe_transit_gateway_attachments(
+        Filters=[{'Name': 'transit-gateway-attachment-id', 'Values': list(attachment_ids)}]
+    )
+    return {a['TransitGatewayAttachmentId']: a['State'] for a in response['TransitGatewayAttachments']}
+
+
+def tgw_attachments_available(ec2_client, attachment_ids):
+    """True si todos los attachments están en `available`"""
+    states = tgw_attachment_states(ec2_client, attachment_ids)
+    return all(states.get(attachment_id) == 'available' for attachment_id in attachment_ids)
+
+
+def tgw_route_table_ready(ec2_client, tgw_id, resource_ids=()):
+    """ID de la tabla de rutas por defecto del TGW si está `available` y tiene
+    asociados los recursos (VPCs) indicados; None si aún no"""
+    tgw = ec2_client.describe_transit_gateways(TransitGatewayIds=[tgw_id])['TransitGateways'][0]
+    route_table_id = tgw.get('Options', {}).get('AssociationDefaultRouteTableId')
+    if not route_table_id:
+        return None
+    tables = ec2_client.describe_transit_gateway_route_tables(
+        TransitGatewayRouteTableIds=[route_table_id]
+    )['TransitGatewayRouteTables']
+    if not tables or tables[0]['State'] != 'available':
+        return None
+    if resource_ids:
+        associations = ec2_client.get_transit_gateway_route_table_associations(
+            TransitGatewayRouteTableId=route_table_id
+        )['Associations']
+        associated = {a['ResourceId'] for a in associations if a.get('State', 'associated') == 'associated'}
+        if not set(resource_ids) <= associated:
+            return None
+    return route_table_id
+
+
+def vpcs_attached_to_tgw(ec2_client, tgw_id, vpc_ids):
+    """VPCs de `vpc_ids` cuyo attachment con el TGW está `available`"""
+    response = ec2_client.describe_transit_gateway_vpc_attachments(
+        Filters=[
+            {'Name': 'transit-gateway-id', 'Values': [tgw_id]},
+            {'Name': 'vpc-id', 'Values': list(vpc_ids)}
+        ]
+    )
+    return {a['VpcId'] for a in response['TransitGatewayVpcAttachments'] if a['State'] == 'available'}
+
+
+def route_tables_associated(ec2_client, route_table_subnets):
+    """Tablas de rutas ({tabla: subred}) que ya tienen su subred asociada,
+    explícitamente o de forma implícita por ser la tabla principal de la VPC"""
+    if not route_table_subnets:
+        return set()
+    response = ec2_client.describe_route_tables(RouteTableIds=list(route_table_subnets))
+    ready = set()
+    for table in response['RouteTables']:
+        for association in table.get('Associations', []):
+            state = association.get('AssociationState', {}).get('State', 'associated')
+            subnet_matches = association.get('Main') or association.get('SubnetId') == route_table_subnets[table['RouteTableId']]
+            if subnet_matches and state == 'associated':
+                ready.add(table['RouteTableId'])
+    return ready
+
+
+def tgw_peering_route_table(ec2_client, tgw_id, peering_id):
+    """ID de la tabla de rutas por defecto del TGW si el peering ya está
+    `available` en esa región (y la tabla también); None si aún no"""
+    if not tgw_attachments_available(ec2_client, [peering_id]):
+        return None
+    return tgw_route_table_ready(ec2_client, tgw_id)
+
+
+def vpcs_ready_for_tgw_routes(ec2_client, tgw_id, vpc_resources):
+    """VPCs que ya admiten rutas hacia el TGW: attachment `available` y subred
+    asociada a su tabla de rutas. `vpc_resources` son dicts con vpc_id,
+    subnet_id y route_table_id."""
+    by_vpc = {resource['vpc_id']: resource for resource in vpc_resources}
+    if not by_vpc:
+        return set()
+    attached = vpcs_attached_to_tgw(ec2_client, tgw_id, by_vpc)
+    associated = route_tables_associated(
+        ec2_client, {by_vpc[vpc_id]['route_table_id']: by_vpc[vpc_id]['subnet_id'] for vpc_id in attached}
+    )
+    return {vpc_id for vpc_id in attached if by_vpc[vpc_id]['route_table_id'] in associated}
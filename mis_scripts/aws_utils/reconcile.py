@@ -0,0 +1,130 @@
+"""Borrado idempotente: estado local de lo ya borrado y clasificación de errores.
+
+Al relanzar una limpieza tras un fallo parcial, los recursos que ya se
+confirmaron como borrados se saltan sin llamar a la API, y cada error de AWS se
+trata según su tipo en lugar de tragarse con `except:`:
+
+- NotFound (`InvalidVpcID.NotFound`, `LoadBalancerNotFound`, ...): ya está borrado
+- DependencyViolation / ResourceInUse: se reintenta con backoff exponencial
+- Throttling: se reintenta con backoff exponencial y jitter
+- cualquier otro: se propaga
+
+    use_state('cleanup.state.json')  # sin llamarlo, el estado solo vive en memoria
+    delete_once(subnet_id, ec2.delete_subnet, SubnetId=subnet_id)
+"""
+import json
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+DONE = 'done'
+RETRY = 'retry'
+THROTTLE = 'throttle'
+FATAL = 'fatal'
+
+_DONE_CODES = {'WAFNonexistentItemException', 'Gateway.NotAttached'}
+_RETRY_CODES = {
+    'DependencyViolation', 'InvalidDependencyViolation', 'ResourceInUse',
+    'ResourceInUseException', 'IncorrectState', 'WAFAssociatedItemException'
+}
+_THROTTLE_CODES = {
+    'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'TooManyRequestsException', 'RequestThrottled', 'SlowDown'
+}
+
+
+def classify(error):
+    """Tipo de un error de borrado: DONE, RETRY, THROTTLE o FATAL"""
+    if not isinstance(error, ClientError):
+        return FATAL
+    code = error.response.get('Error', {}).get('Code', '')
+    if code.endswith('NotFound') or code in _DONE_CODES:
+        return DONE
+    if code in _RETRY_CODES:
+        return RETRY
+    if code in _THROTTLE_CODES:
+        return THROTTLE
+    return FATAL
+
+
+class DeletionState:
+    """IDs de recursos confirmados como borrados, opcionalmente guardados en un JSON"""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._deleted = {}
+        if path:
+            try:
+                with open(path) as f:
+                    self._deleted = json.load(f).get('deleted', {})
+            except (OSError, ValueError):
+                pass
+
+    def is_deleted(self, resource_id):
+        with self._lock:
+            return resource_id in self._deleted
+
+    def mark_deleted(self, resource_id):
+        with self._lock:
+            self._deleted[resource_id] = time.strftime('%Y-%m-%dT%H:%M:%S')
+            if self.path:
+                # Escritura atómica: un corte a mitad no deja el fichero corrupto
+                tmp_path = f'{self.path}.tmp'
+                with open(tmp_path, 'w') as f:
+                    json.dump({'deleted': self._deleted}, f, indent=2, sort_keys=True)
+                os.replace(tmp_path, self.path)
+
+
+_state = DeletionState()
+
+
+def use_state(path):
+    """Activa el fichero de estado `path` para los borrados de este proceso"""
+    global _state
+    _state = DeletionState(path)
+    if _state._deleted:
+        print(f"⏭️ {len(_state._deleted)} recursos ya borrados según {path}; se saltan")
+    return _state
+
+
+def current_state():
+    return _state
+
+
+def call_with_retry(func, *args, attempts=8, base_delay=2, max_delay=30, **kwargs):
+    """Llama a `func` reintentando según el tipo de error.
+
+    Devuelve su resultado, o None si AWS responde que el recurso ya no existe.
+    """
+    delay = base_delay
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except ClientError as e:
+            kind = classify(e)
+            if kind == DONE:
+                return None
+            if kind == FATAL or attempt == attempts:
+                raise
+            code = e.response['Error']['Code']
+            # Con throttling, jitter completo para no reintentar todos a la vez
+            wait = random.uniform(0, delay) if kind == THROTTLE else delay
+            print(f"  ⏳ {code}, reintento {attempt}/{attempts - 1} en {wait:.0f}s...")
+            time.sleep(wait)
+            delay = min(delay * 2, max_delay)
+
+
+def delete_once(resource_id, func, *args, **kwargs):
+    """Borra `resource_id` con `func` salvo que el estado ya lo dé por borrado.
+
+    Devuelve False si se ha saltado sin llamar a la API.
+    """
+    if _state.is_deleted(resource_id):
+        return False
+    call_with_retry(func, *args, **kwargs)
+    _state.mark_deleted(resource_id)
+    return True
@@ -0,0 +1,275 @@
+"""Evaluación sin conexión de Security Groups: ¿puede A llegar a B por el puerto P?
+
+Carga los Security Groups y las interfaces de red (ENIs) de una o varias VPCs
+(en vivo, solo llamadas describe_*, o de una instantánea JSON) y responde sin
+más llamadas a AWS:
+
+- las reglas de cada grupo se indexan por sentido, protocolo y rango de
+  puertos (intervalos de puertos → orígenes permitidos, búsqueda binaria)
+- las referencias a otros grupos (`UserIdGroupPairs`) se resuelven con un
+  índice invertido grupo → ENIs miembro, sin expandirlas a direcciones
+- los Security Groups son stateful: basta con la salida del origen y la
+  entrada del destino; la respuesta siempre vuelve
+
+Los extremos son IDs de ENI o de instancia, la etiqueta Name de la instancia o
+una IP (si no es de ninguna ENI cargada, es un extremo externo, sin grupos).
+Las reglas IPv6 y las de prefix lists no se evalúan; en ICMP el puerto es el
+tipo y el código no se distingue.
+
+    python3 -m aws_utils.sg --vpc vpc-123 --check Bastion-Host-1:App-Server-1:tcp:22
+    python3 -m aws_utils.sg --snapshot sgs.json --who App-Server-1:tcp:22
+"""
+import argparse
+import bisect
+import ipaddress
+
+from aws_utils.clients import get_client
+from aws_utils.inventory import iter_instances, iter_resources
+from aws_utils.nacl import PROTOCOLS, protocol_number
+from aws_utils.plan import load_or_collect
+
+_ALL_PORTS = (0, 65535)
+_PORTED = (PROTOCOLS['icmp'], PROTOCOLS['tcp'], PROTOCOLS['udp'])
+_ECHO_REQUEST = 8
+
+
+def _default_port(protocol, port):
+    """Sin puerto, ICMP es un ping (echo request)"""
+    if port is not None:
+        return port
+    return _ECHO_REQUEST if protocol == PROTOCOLS['icmp'] else 0
+
+
+def _port_range(protocol, permission):
+    """Rango de puertos (o de tipos ICMP) de una regla; -1 es "todos" """
+    low, high = permission.get('FromPort', -1), permission.get('ToPort', -1)
+    if protocol not in _PORTED or low == -1:
+        return _ALL_PORTS
+    if protocol == PROTOCOLS['icmp']:
+        return low, low  # En ICMP, ToPort es el código
+    return low, high
+
+
+def collect_security_groups(regions, vpc_ids=None):
+    """Security Groups y ENIs de `regions` (solo llamadas describe_*), en un dict serializable en JSON"""
+    snapshot = {'groups': {}, 'interfaces': {}}
+    for region in regions:
+        ec2 = get_client('ec2', region)
+        filters = [{'Name': 'vpc-id', 'Values': list(vpc_ids)}] if vpc_ids else []
+        for group in iter_resources(ec2, 'describe_security_groups', 'SecurityGroups', Filters=filters):
+            snapshot['groups'][group['GroupId']] = {
+                'name': group['GroupName'], 'vpc': group.get('VpcId'),
+                'ingress': group.get('IpPermissions', []), 'egress': group.get('IpPermissionsEgress', [])
+            }
+        names = {
+            instance['InstanceId']: next((tag['Value'] for tag in instance.get('Tags', []) if tag['Key'] == 'Name'),
+                                         instance['InstanceId'])
+            for instance in iter_instances(ec2, Filters=filters)
+        }
+        for eni in iter_resources(ec2, 'describe_network_interfaces', 'NetworkInterfaces', Filters=filters):
+            instance_id = (eni.get('Attachment') or {}).get('InstanceId')
+            snapshot['interfaces'][eni['NetworkInterfaceId']] = {
+                'name': names.get(instance_id, instance_id or eni['NetworkInterfaceId']),
+                'instance': instance_id, 'address': eni['PrivateIpAddress'], 'vpc': eni['VpcId'],
+                'subnet': eni.get('SubnetId'),
+                'groups': [group['GroupId'] for group in eni.get('Groups', [])]
+            }
+    return snapshot
+
+
+class SecurityGroupIndex:
+    """Reglas de los Security Groups de una instantánea (ver `collect_security_groups`), indexadas.
+
+    Las reglas de cada grupo se compilan la primera vez que se consultan, por
+    sentido y protocolo, en intervalos de puertos disjuntos; una consulta es
+    una búsqueda binaria por grupo del extremo.
+    """
+
+    def __init__(self, snapshot):
+        self.groups = snapshot['groups']
+        self.interfaces = snapshot['interfaces']
+        # Índice invertido: grupo → ENIs que lo tienen
+        self.members = {}
+        self._endpoints = {}
+        for eni_id, eni in self.interfaces.items():
+            groups = frozenset(eni['groups'])
+            for group_id in groups:
+                self.members.setdefault(group_id, set()).add(eni_id)
+            endpoint = (int(ipaddress.IPv4Address(eni['address'])), groups, eni['name'])
+            for key in (eni['address'], eni.get('instance'), eni['name'], eni_id):
+                if key:
+                    self._endpoints.setdefault(key, endpoint)
+        self._rules = {group_id: {False: self._compile(group['ingress']), True: self._compile(group['egress'])}
+                       for group_id, group in self.groups.items()}
+        self._segments = {}
+
+    @staticmethod
+    def _compile(permissions):
+        """Reglas `(protocolo, desde, hasta, red, máscara, grupo referenciado)` de unos IpPermissions"""
+        rules = []
+        for permission in permissions:
+            protocol = protocol_number(permission['IpProtocol'])
+            low, high = _port_range(protocol, permission)
+            for ip_range in permission.get('IpRanges', []):
+                network = ipaddress.IPv4Network(ip_range['CidrIp'])
+                rules.append((protocol, low, high, int(network.network_address), int(network.netmask), None))
+            for pair in permission.get('UserIdGroupPairs', []):
+                if 'GroupId' in pair:
+                    rules.append((protocol, low, high, None, None, pair['GroupId']))
+        return rules
+
+    def _index(self, group_id, egress, protocol):
+        """`(límites, segmentos)` de un grupo para un sentido y protocolo.
+
+        El segmento i cubre los puertos [límites[i], límites[i + 1]) y guarda las
+        redes `(red, máscara)` y los grupos referenciados que los permiten.
+        """
+        key = (group_id, egress, protocol)
+        if key in self._segments:
+            return self._segments[key]
+        rules = [rule for rule in self._rules.get(group_id, {}).get(egress, []) if rule[0] in (-1, protocol)]
+        bounds = sorted({rule[1] for rule in rules} | {rule[2] + 1 for rule in rules})
+        segments = [([], set()) for _ in bounds]
+        for _, low, high, network, mask, reference in rules:
+            for position in range(bisect.bisect_left(bounds, low), bisect.bisect_left(bounds, high + 1)):
+                if reference is None:
+                    segments[position][0].append((network, mask))
+                else:
+                    segments[position][1].add(reference)
+        self._segments[key] = (bounds, segments)
+        return bounds, segments
+
+    def rules_for(self, group_id, egress, protocol, port):
+        """`(redes, grupos referenciados)` que `group_id` permite en un sentido, protocolo y puerto"""
+        bounds, segments = self._index(group_id, egress, protocol)
+        position = bisect.bisect_right(bounds, port) - 1
+        return segments[position] if position >= 0 else ((), ())
+
+    def _match(self, groups, egress, protocol, port, address, peer_groups):
+        """Grupo de `groups` que permite el tráfico con el extremo remoto, o None"""
+        for group_id in groups:
+            networks, references = self.rules_for(group_id, egress, protocol, port)
+            if references and not references.isdisjoint(peer_groups):
+                return group_id
+            for network, mask in networks:
+                if address & mask == network:
+                    return group_id
+        return None
+
+    def resolve(self, endpoint):
+        """`(dirección, grupos, nombre)` de un extremo; una IP desconocida es externa (sin grupos)"""
+        if endpoint in self._endpoints:
+            return self._endpoints[endpoint]
+        try:
+            return int(ipaddress.IPv4Address(endpoint)), None, endpoint
+        except ValueError:
+            raise ValueError(f"Extremo desconocido: {endpoint}") from None
+
+    def _group_names(self, groups):
+        return ', '.join(self.groups.get(group_id, {}).get('name', group_id) for group_id in sorted(groups))
+
+    def _decide(self, source, destination, protocol, port):
+        """`(grupo de salida, grupo de entrada, tramo bloqueado)`; None en los tramos sin grupos"""
+        source_address, source_groups, _ = self.resolve(source)
+        destination_address, destination_groups, _ = self.resolve(destination)
+        egress_group = ingress_group = None
+        if source_groups is not None:
+            egress_group = self._match(source_groups, True, protocol, port, destination_address,
+                                       destination_groups or ())
+            if egress_group is None:
+                return None, None, 'salida'
+        if destination_groups is not None:
+            ingress_group = self._match(destination_groups, False, protocol, port, source_address,
+                                        source_groups or ())
+            if ingress_group is None:
+                return egress_group, None, 'entrada'
+        return egress_group, ingress_group, None
+
+    def can_reach(self, source, destination, protocol, port=None):
+        """`(permitido, detalle)`: la salida de `source` y la entrada de `destination`"""
+        protocol = protocol_number(protocol)
+        egress_group, ingress_group, blocked = self._decide(source, destination, protocol,
+                                                            _default_port(protocol, port))
+        if blocked:
+            _, groups, name = self.resolve(source if blocked == 'salida' else destination)
+            return False, f"ninguna regla de {blocked} de {name} ({self._group_names(groups)})"
+        allowed_by = [f"{leg} por {self.groups[group_id]['name']}"
+                      for leg, group_id in (('salida', egress_group), ('entrada', ingress_group)) if group_id]
+        return True, ', '.join(allowed_by) or "sin Security Groups en ningún extremo"
+
+    def evaluate_batch(self, queries):
+        """Lista de booleanos: si cada `(origen, destino, protocolo, puerto)` está permitido"""
+        results = []
+        for source, destination, protocol, port in queries:
+            protocol = protocol_number(protocol)
+            results.append(self._decide(source, destination, protocol, _default_port(protocol, port))[2] is None)
+        return results
+
+    def who_can_reach(self, destination, protocol, port=None):
+        """Orígenes que admite la entrada de `destination`: `(redes, nombres de ENIs)`.
+
+        Las referencias a grupos se expanden a sus ENIs con el índice invertido.
+        """
+        protocol = protocol_number(protocol)
+        port = _default_port(protocol, port)
+        _, groups, _ = self.resolve(destination)
+        cidrs, enis = set(), set()
+        for group_id in groups or ():
+            networks, references = self.rules_for(group_id, False, protocol, port)
+            cidrs.update(str(ipaddress.IPv4Network((network, bin(mask).count('1')))) for network, mask in networks)
+            enis.update(eni_id for reference in references for eni_id in self.members.get(reference, ()))
+        return sorted(cidrs), sorted(self.interfaces[eni_id]['name'] for eni_id in enis)
+
+
+def print_check(description, allowed, detail, expected=None):
+    """Imprime el resultado de una consulta; devuelve False si no es el esperado"""
+    verdict = 'permitido' if allowed else 'denegado'
+    if expected is None or allowed == expected:
+        icon = '✅' if expected is not None or allowed else '🚫'
+        print(f"  {icon} {description}: {verdict} ({detail})")
+        return True
+    print(f"  ❌ {description}: {verdict} y se esperaba lo contrario ({detail})")
+    return False
+
+
+def verify_access(regions, vpc_ids, checks):
+    """Comprueba en vivo `[(descripción, origen, destino, protocolo, puerto, esperado)]`; True si todo cuadra"""
+    index = SecurityGroupIndex(collect_security_groups(regions, vpc_ids))
+    ok = True
+    for description, source, destination, protocol, port, expected in checks:
+        allowed, detail = index.can_reach(source, destination, protocol, port)
+        ok = print_check(description, allowed, detail, expected) and ok
+    return ok
+
+
+def _parse_query(text):
+    """'origen:destino:protocolo[:puerto]'"""
+    parts = text.split(':')
+    return parts[0], parts[1], parts[2], int(parts[3]) if len(parts) > 3 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evalúa accesos entre ENIs según sus Security Groups")
+    parser.add_argument('--region', action='append', dest='regions',
+                        help="Región a cargar (repetible; por defecto us-east-1)")
+    parser.add_argument('--vpc', action='append', dest='vpc_ids', help="Solo estas VPCs (repetible)")
+    parser.add_argument('--check', action='append', default=[],
+                        help="origen:destino:protocolo[:puerto] (repetible)")
+    parser.add_argument('--who', action='append', default=[],
+                        help="destino:protocolo[:puerto]: quién puede entrar (repetible)")
+    parser.add_argument('--snapshot', metavar='RUTA',
+                        help="Instantánea JSON de los Security Groups y ENIs (se crea si no existe)")
+    args = parser.parse_args()
+
+    regions = args.regions or ['us-east-1']
+    index = SecurityGroupIndex(load_or_collect(args.snapshot, lambda: collect_security_groups(regions, args.vpc_ids)))
+    for text in args.check:
+        print_check(text, *index.can_reach(*_parse_query(text)))
+    for text in args.who:
+        destination, protocol, port = _parse_query(f'-:{text}')[1:]
+        cidrs, enis = index.who_can_reach(destination, protocol, port)
+        print(f"🔎 {text}: {', '.join(cidrs + enis) or 'nadie'}")
+
+
+if __name__ == '__main__':
+    main()
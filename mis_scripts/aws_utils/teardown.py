@@ -0,0 +1,428 @@
+"""Borrado de una VPC en paralelo según sus dependencias reales.
+
+En lugar del orden fijo instancias → NACLs → SGs → NATs → tablas de rutas →
+IGW → subredes → VPC, se lee el inventario de la VPC y se construye un
+DagExecutor donde cada recurso solo espera a lo que de verdad lo bloquea:
+
+- security_groups: espera a las instancias (sus ENIs usan los SGs); dentro se
+  borran por niveles según sus referencias cruzadas, revocando solo los ciclos
+- internet_gateway: espera a instancias y NATs (IPs públicas mapeadas)
+- nat_gateways: se borran todos a la vez y cada IP elástica se libera en
+  cuanto su NAT termina
+- subnet:<id>: espera a las instancias, a las NACLs, a las tablas de rutas
+  asociadas a esa subred y, si aloja alguno, a los NATs
+- vpc: espera a todo lo anterior
+
+Cada borrado pasa por aws_utils.reconcile: se salta si el estado local ya lo
+da por borrado, un NotFound cuenta como borrado y se reintenta con backoff
+mientras AWS responda DependencyViolation (p. ej. una ENI que aún se está
+liberando) o throttling. Si un nodo falla, los que dependen de él no se lanzan
+y el resto del grafo sigue (ver `run_teardown`).
+"""
+import concurrent.futures
+import threading
+
+from botocore.exceptions import ClientError
+
+from aws_utils.dag import DagError, DagExecutor
+from aws_utils.inventory import build_inventory
+from aws_utils.plan import record_durations
+from aws_utils.poller import shared_poller
+from aws_utils.reconcile import call_with_retry, current_state, delete_once
+
+_print_lock = threading.Lock()
+
+
+def _print(message):
+    """print() que no mezcla las líneas de los hilos del grafo"""
+    with _print_lock:
+        print(message)
+
+
+def vpc_inventories(ec2_client, vpc_ids):
+    """Recursos que hay que borrar de cada VPC, con una consulta por tipo para todas"""
+    inventories = build_inventory(ec2_client, vpc_ids, [
+        'instances', 'network_acls', 'security_groups', 'nat_gateways',
+        'route_tables', 'internet_gateways', 'subnets'
+    ])
+    for inventory in inventories.values():
+        inventory['nat_gateways'] = [
+            nat for nat in inventory['nat_gateways'] if nat['State'] not in ('deleted', 'deleting')
+        ]
+    return inventories
+
+
+def vpc_inventory(ec2_client, vpc_id):
+    """Recursos de la VPC que hay que borrar, con una consulta por tipo"""
+    return vpc_inventories(ec2_client, [vpc_id])[vpc_id]
+
+
+def terminate_instances(ec2_client, instance_ids, timeout=600):
+    """Termina las instancias con una sola llamada y espera a todas a la vez.
+
+    Las que ya no existen (o que el estado local ya da por terminadas) se
+    ignoran en lugar de fallar. Devuelve las IDs que se han terminado.
+    """
+    state = current_state()
+    instance_ids = [i for i in instance_ids if not state.is_deleted(i)]
+    if not instance_ids:
+        return []
+    try:
+        # Llamada directa: con call_with_retry el NotFound de un solo ID se daría
+        # por bueno y no se terminaría ninguna
+        ec2_client.terminate_instances(InstanceIds=instance_ids)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidInstanceID.NotFound':
+            raise
+        # Alguna ya ha desaparecido: se repite solo con las que siguen existiendo
+        reservations = ec2_client.describe_instances(
+            Filters=[{'Name': 'instance-id', 'Values': instance_ids}]
+        )['Reservations']
+        existing = [i['InstanceId'] for r in reservations for i in r['Instances']
+                    if i['State']['Name'] not in ('shutting-down', 'terminated')]
+        _print(f"   Instancias que ya no existían: {sorted(set(instance_ids) - set(existing))}")
+        instance_ids = existing
+        if not instance_ids:
+            return []
+        ec2_client.terminate_instances(InstanceIds=instance_ids)
+
+    # Un único describe por tick para todas; las que desaparecen cuentan como terminadas
+    shared_poller(ec2_client, 'instance').wait(instance_ids, ['terminated'], missing_ok=True, timeout=timeout)
+    for instance_id in instance_ids:
+        state.mark_deleted(instance_id)
+    return instance_ids
+
+
+def logged_step(description, func, *args):
+    """Ejecuta un nodo de borrado; si falla, imprime el error y lo propaga al grafo.
+
+    Las funciones de borrado devuelven si han borrado algo (False si el estado
+    local ya lo daba todo por borrado); solo esas duraciones se registran.
+    """
+    try:
+        return func(*args)
+    except Exception as e:
+        _print(f"❌ Error eliminando {description}: {e}")
+        raise
+
+
+def _terminate_instances(ec2, instances):
+    instance_ids = [i['InstanceId'] for i in instances]
+    _print(f"Terminando instancias y esperando su terminación: {instance_ids}")
+    terminated = terminate_instances(ec2, instance_ids)
+    _print("Instancias terminadas exitosamente")
+    return bool(terminated)
+
+
+def _delete_network_acls(ec2, network_acls):
+    default_nacl_id = next((n['NetworkAclId'] for n in network_acls if n['IsDefault']), None)
+    deleted = False
+    for nacl in network_acls:
+        if nacl['IsDefault'] or current_state().is_deleted(nacl['NetworkAclId']):
+            continue
+        # Las subredes vuelven a la NACL por defecto antes de borrar la personalizada
+        for assoc in nacl['Associations']:
+            call_with_retry(
+                ec2.replace_network_acl_association,
+                AssociationId=assoc['NetworkAclAssociationId'],
+                NetworkAclId=default_nacl_id
+            )
+        delete_once(nacl['NetworkAclId'], ec2.delete_network_acl, NetworkAclId=nacl['NetworkAclId'])
+        _print(f"Network ACL {nacl['NetworkAclId']} eliminada")
+        deleted = True
+    return deleted
+
+
+def _group_references(rule):
+    return {pair['GroupId'] for pair in rule.get('UserIdGroupPairs', []) if 'GroupId' in pair}
+
+
+def _references_only(rule, group_ids):
+    """Copia de la regla con solo los pares que referencian a `group_ids` (para revocarlos)"""
+    permission = {key: rule[key] for key in ('IpProtocol', 'FromPort', 'ToPort') if key in rule}
+    permission['UserIdGroupPairs'] = [
+        pair for pair in rule.get('UserIdGroupPairs', []) if pair.get('GroupId') in group_ids
+    ]
+    return permission
+
+
+def plan_security_group_deletion(security_groups):
+    """Orden de borrado de los SGs de una VPC según quién referencia a quién.
+
+    Una regla de A que referencia a B impide borrar B mientras A exista, así que A
+    va en un nivel anterior y no hace falta revocar nada. Solo se revocan las
+    referencias que forman ciclos y las del SG default (que no se borra); las de
+    un SG a sí mismo no bloquean su borrado.
+    Devuelve (niveles, {group_id: (ingress, egress)} con las reglas a revocar).
+    """
+    deletable = {sg['GroupId'] for sg in security_groups if sg['GroupName'] != 'default'}
+    references = {}
+    for sg in security_groups:
+        rules = sg['IpPermissions'] + sg['IpPermissionsEgress']
+        referenced = set().union(*map(_group_references, rules))
+        references[sg['GroupId']] = (referenced & deletable) - {sg['GroupId']}
+
+    def reaches(start, target):
+        seen, stack = {start}, [start]
+        while stack:
+            for nxt in references.get(stack.pop(), ()):
+                if nxt == target:
+                    return True
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return False
+
+    # A -> B está en un ciclo si B también llega hasta A
+    cyclic = {(a, b) for a in deletable for b in references[a] if reaches(b, a)}
+
+    revoke = {}
+    for sg in security_groups:
+        group_id = sg['GroupId']
+        if group_id in deletable:
+            blocked = {b for b in references[group_id] if (group_id, b) in cyclic}
+        else:
+            blocked = references[group_id]
+        if not blocked:
+            continue
+        revoke[group_id] = tuple(
+            [_references_only(rule, blocked) for rule in rules if _group_references(rule) & blocked]
+            for rules in (sg['IpPermissions'], sg['IpPermissionsEgress'])
+        )
+
+    # Niveles (Kahn) con las referencias que quedan tras revocar
+    edges = {a: references[a] - {b for x, b in cyclic if x == a} for a in deletable}
+    pending = {group_id: 0 for group_id in deletable}
+    for targets in edges.values():
+        for b in targets:
+            pending[b] += 1
+    levels = []
+    ready = sorted(group_id for group_id, count in pending.items() if count == 0)
+    while ready:
+        levels.append(ready)
+        next_level = []
+        for a in ready:
+            for b in edges[a]:
+                pending[b] -= 1
+                if pending[b] == 0:
+                    next_level.append(b)
+        ready = sorted(next_level)
+    return levels, revoke
+
+
+def _delete_security_group(ec2, group_id):
+    if delete_once(group_id, ec2.delete_security_group, GroupId=group_id):
+        _print(f"Security Group {group_id} eliminado")
+
+
+def _delete_security_groups(ec2, security_groups, max_workers=8):
+    state = current_state()
+    levels, revoke = plan_security_group_deletion(
+        [sg for sg in security_groups if not state.is_deleted(sg['GroupId'])]
+    )
+    # Una llamada por SG y sentido, solo con las referencias que forman ciclos
+    for group_id, (ingress, egress) in revoke.items():
+        if ingress:
+            call_with_retry(ec2.revoke_security_group_ingress, GroupId=group_id, IpPermissions=ingress)
+        if egress:
+            call_with_retry(ec2.revoke_security_group_egress, GroupId=group_id, IpPermissions=egress)
+    # Cada nivel solo está referenciado por SGs de niveles anteriores, ya borrados
+    for level in levels:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(len(level), max_workers)) as pool:
+            for future in [pool.submit(_delete_security_group, ec2, group_id) for group_id in level]:
+                future.result()
+    return bool(levels or revoke)
+
+
+def _delete_nat_gateways(ec2, nat_gateways, timeout=600):
+    nat_gateways = [nat for nat in nat_gateways if not current_state().is_deleted(nat['NatGatewayId'])]
+    if not nat_gateways:
+        return False
+    for nat in nat_gateways:
+        call_with_retry(ec2.delete_nat_gateway, NatGatewayId=nat['NatGatewayId'])
+        _print(f"NAT Gateway {nat['NatGatewayId']} eliminado")
+    _print("Esperando eliminación de los NAT Gateways...")
+    # Una sola espera para todos; la IP de cada NAT se libera en cuanto ese NAT termina
+    deleted = shared_poller(ec2, 'nat_gateway').watch(
+        [nat['NatGatewayId'] for nat in nat_gateways], ['deleted'], failed_states=['failed'], missing_ok=True,
+        timeout=timeout
+    )
+
+    def release(nat):
+        deleted[nat['NatGatewayId']].result()
+        for address in nat['NatGatewayAddresses']:
+            if 'AllocationId' in address:
+                if delete_once(address['AllocationId'], ec2.release_address, AllocationId=address['AllocationId']):
+                    _print(f"IP Elástica {address['AllocationId']} liberada")
+        current_state().mark_deleted(nat['NatGatewayId'])
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(nat_gateways)) as pool:
+        for future in [pool.submit(release, nat) for nat in nat_gateways]:
+            future.result()
+    return True
+
+
+def _delete_route_table(ec2, route_table):
+    route_table_id = route_table['RouteTableId']
+    if current_state().is_deleted(route_table_id):
+        return False
+    for assoc in route_table['Associations']:
+        if not assoc.get('Main'):
+            call_with_retry(ec2.disassociate_route_table, AssociationId=assoc['RouteTableAssociationId'])
+    delete_once(route_table_id, ec2.delete_route_table, RouteTableId=route_table_id)
+    _print(f"Tabla de enrutamiento {route_table_id} eliminada")
+    return True
+
+
+def _delete_internet_gateway(ec2, igw, vpc_id):
+    igw_id = igw['InternetGatewayId']
+    if current_state().is_deleted(igw_id):
+        return False
+    call_with_retry(ec2.detach_internet_gateway, InternetGatewayId=igw_id, VpcId=vpc_id)
+    delete_once(igw_id, ec2.delete_internet_gateway, InternetGatewayId=igw_id)
+    _print(f"Internet Gateway {igw_id} eliminado")
+    return True
+
+
+def _delete_subnet(ec2, subnet_id):
+    if not delete_once(subnet_id, ec2.delete_subnet, SubnetId=subnet_id):
+        return False
+    _print(f"Subred {subnet_id} eliminada")
+    return True
+
+
+def _delete_vpc(ec2, vpc_id):
+    _print("\nEliminando VPC...")
+    if not delete_once(vpc_id, ec2.delete_vpc, VpcId=vpc_id):
+        _print(f"⏭️  VPC {vpc_id} ya eliminada en una ejecución anterior")
+        return False
+    _print(f"✅ VPC {vpc_id} y toda su infraestructura eliminada exitosamente!")
+    return True
+
+
+def plan_vpc_teardown(ec2_client, vpc_id, inventory=None, max_workers=8, dag=None, after=()):
+    """Construye (sin ejecutarlo) el DagExecutor que borra la VPC.
+
+    Con `dag` los nodos se añaden a un grafo existente; `after` son nodos de ese
+    grafo que ocupan ENIs o IPs públicas en la VPC (p. ej. un ALB) y que deben
+    terminar antes de borrar SGs, subredes e IGWs.
+    """
+    inventory = inventory or vpc_inventory(ec2_client, vpc_id)
+    dag = dag or DagExecutor(max_workers=max_workers)
+    after = list(after)
+
+    def node(name, description, func, *args, deps=()):
+        return dag.add(name, lambda *_: logged_step(description, func, ec2_client, *args), deps)
+
+    # Instancias y NATs ocupan IPs y ENIs en las subredes
+    instances = []
+    if inventory['instances']:
+        instances.append(node(f'instances:{vpc_id}', 'instancias', _terminate_instances, inventory['instances']))
+    nats = []
+    if inventory['nat_gateways']:
+        nats.append(node(f'nat_gateways:{vpc_id}', 'NAT Gateways', _delete_nat_gateways, inventory['nat_gateways']))
+
+    nacls = node(f'network_acls:{vpc_id}', 'Network ACLs', _delete_network_acls, inventory['network_acls'])
+    sgs = node(f'security_groups:{vpc_id}', 'Security Groups', _delete_security_groups,
+               inventory['security_groups'], deps=instances + after)
+
+    route_tables = []
+    subnet_route_tables = {}
+    for rt in inventory['route_tables']:
+        if any(assoc.get('Main') for assoc in rt['Associations']):
+            continue
+        name = node(f"route_table:{rt['RouteTableId']}", 'tabla de enrutamiento', _delete_route_table, rt)
+        route_tables.append(name)
+        for assoc in rt['Associations']:
+            if assoc.get('SubnetId'):
+                subnet_route_tables.setdefault(assoc['SubnetId'], []).append(name)
+
+    igws = [
+        node(f"igw:{igw['InternetGatewayId']}", 'IGW', _delete_internet_gateway, igw, vpc_id,
+             deps=instances + nats + after)
+        for igw in inventory['internet_gateways']
+    ]
+
+    # Solo las subredes que alojan un NAT esperan a los NATs
+    nat_subnets = {nat['SubnetId'] for nat in inventory['nat_gateways']}
+    subnets = [
+        node(f"subnet:{subnet['SubnetId']}", 'subred', _delete_subnet, subnet['SubnetId'],
+             deps=instances + (nats if subnet['SubnetId'] in nat_subnets else [])
+             + [nacls] + subnet_route_tables.get(subnet['SubnetId'], []) + after)
+        for subnet in inventory['subnets']
+    ]
+
+    node(f'vpc:{vpc_id}', 'VPC', _delete_vpc, vpc_id,
+         deps=[nacls, sgs] + instances + nats + route_tables + igws + subnets + after)
+    return dag
+
+
+def run_teardown(dag):
+    """Ejecuta un grafo de borrado hasta donde se pueda; devuelve True si se completó entero.
+
+    Si un nodo falla, los que dependen de él no se lanzan (solo agotarían los
+    reintentos de DependencyViolation) pero el resto del grafo sigue. Al final
+    se listan los nodos fallidos y los que se han saltado; al relanzar, el
+    estado local salta lo que ya se borró.
+    """
+    try:
+        dag.run(keep_going=True)
+        return True
+    except DagError as e:
+        _print(f"\n❌ Nodos fallidos ({len(e.failures)}):")
+        for name, error in e.failures.items():
+            _print(f"   • {name}: {error}")
+        if e.skipped:
+            _print(f"⏭️  Sin lanzar por depender de ellos ({len(e.skipped)}): {', '.join(e.skipped)}")
+        return False
+    finally:
+        # Duraciones reales para las estimaciones de --plan: solo los nodos que han
+        # borrado algo y sin fallar (los saltados por el estado duran ~0s)
+        record_durations({name: seconds for name, seconds in dag.durations.items() if dag.results.get(name)})
+
+
+def teardown_vpc(ec2_client, vpc_id, max_workers=8):
+    """Borra la VPC y todo su contenido; devuelve True si la VPC se eliminó"""
+    return run_teardown(plan_vpc_teardown(ec2_client, vpc_id, max_workers=max_workers))
+
+
+def delete_tgw_peering_attachments(ec2_client, timeout=600):
+    """Borra los peerings entre TGWs visibles desde la región del cliente.
+
+    El peering es el único recurso compartido entre regiones: se borra una vez,
+    antes de limpiar cada región. Devuelve las IDs borradas.
+    """
+    attachments = ec2_client.describe_transit_gateway_peering_attachments(
+        Filters=[{'Name': 'state', 'Values': ['available', 'pending', 'pendingAcceptance']}]
+    )['TransitGatewayPeeringAttachments']
+    state = current_state()
+    attachment_ids = []
+    for attachment in attachments:
+        attachment_id = attachment['TransitGatewayAttachmentId']
+        if state.is_deleted(attachment_id):
+            continue
+        try:
+            call_with_retry(ec2_client.delete_transit_gateway_peering_attachment, TransitGatewayAttachmentId=attachment_id)
+            _print(f"   Eliminando TGW Peering: {attachment_id}")
+            attachment_ids.append(attachment_id)
+        except Exception as e:
+            _print(f"   ⚠️ Error eliminando peering {attachment_id}: {e}")
+    if attachment_ids:
+        shared_poller(ec2_client, 'tgw_peering_attachment').wait(
+            attachment_ids, ['deleting', 'deleted'], missing_ok=True, timeout=timeout
+        )
+        for attachment_id in attachment_ids:
+            state.mark_deleted(attachment_id)
+        _print(f"   ✅ Peerings eliminados: {attachment_ids}")
+    return attachment_ids
+
+
+def run_per_region(func, regions, parallel=False):
+    """Ejecuta `func(región)` para cada región, en serie o todas a la vez"""
+    if not parallel:
+        for region in regions:
+            func(region)
+        return
+    with concurrent.futures.ThreadPoolExecutor(max_workers=len(regions)) as pool:
+        for future in [pool.submit(func, region) for region in regions]:
+            future.result()